@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+#
+# Benchmark of the bridge command round trip.
+#
+# Sends light commands one after another to the local mock Hue bridge, with the
+# pooled keep-alive BridgeClient, with the same client opening a new connection
+# for every command, and with blocking qhue calls as used before the async
+# client. Reports the round trip of each command and the connections opened.
+# The mock bridge has no rate limit here, and no emulated latency unless
+# --latency is given, so the round trip is mostly the connection handling.
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_e2e import percentiles  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+MODES = ("pooled", "new-connection", "qhue")
+
+
+def count_connections(counter):
+    """
+    Create a trace config counting the connections a session opens.
+
+    Args:
+        counter (list): Single-item list incremented for each new connection.
+
+    Returns:
+        aiohttp.TraceConfig: Trace config for the session.
+    """
+
+    async def on_connection_create_end(session, context, params):
+        counter[0] += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def send_async(bridge, mode, commands):
+    """
+    Send commands with the async bridge client.
+
+    Args:
+        bridge (MockHueBridge): Mock bridge.
+        mode (str): Either "pooled" or "new-connection".
+        commands (int): Number of commands to send.
+
+    Returns:
+        tuple: Round trip of each command in seconds, and connections opened.
+    """
+    from bridge_client import BridgeClient
+
+    client = BridgeClient(bridge.address, bridge.username)
+    connections = [0]
+    client.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(force_close=mode == "new-connection"),
+        headers={"hue-application-key": client.username},
+        timeout=client.timeout,
+        trace_configs=[count_connections(connections)],
+    )
+    round_trips = []
+    try:
+        for index in range(commands):
+            started = time.perf_counter()
+            await client.lights("1", "state", bri=index % 254 + 1)
+            round_trips.append(time.perf_counter() - started)
+    finally:
+        await client.close()
+    return round_trips, connections[0]
+
+
+def send_qhue(bridge, commands):
+    """
+    Send commands with blocking qhue calls.
+
+    Args:
+        bridge (MockHueBridge): Mock bridge.
+        commands (int): Number of commands to send.
+
+    Returns:
+        tuple: Round trip of each command in seconds, and None as the
+            connections are not counted.
+    """
+    from qhue import Bridge
+
+    qhue_bridge = Bridge(bridge.address, bridge.username)
+    round_trips = []
+    for index in range(commands):
+        started = time.perf_counter()
+        qhue_bridge.lights[1].state(bri=index % 254 + 1)
+        round_trips.append(time.perf_counter() - started)
+    return round_trips, None
+
+
+async def run(args):
+    bridge = MockHueBridge(latency=args.latency, jitter=0, rate_limited=False)
+    await bridge.start()
+    try:
+        for mode in args.modes:
+            if mode == "qhue":
+                # Blocking calls run in a thread so the mock can answer them
+                result = await asyncio.to_thread(send_qhue, bridge, args.commands)
+            else:
+                result = await send_async(bridge, mode, args.commands)
+            report(mode, *result)
+    finally:
+        await bridge.stop()
+
+
+def report(mode, round_trips, connections):
+    """
+    Print the measurements of a mode.
+
+    Args:
+        mode (str): Mode name.
+        round_trips (list): Round trip of each command in seconds.
+        connections (int): Connections opened, or None if not counted.
+    """
+    p50, p90, p99 = percentiles(round_trips)
+    mean = sum(round_trips) / len(round_trips)
+    opened = "not counted" if connections is None else connections
+    print(f"{mode}:")
+    print(
+        f"  Round trip:  mean {mean * 1000:.2f} ms, p50 {p50 * 1000:.2f} ms, "
+        f"p90 {p90 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms"
+    )
+    print(f"  Connections: {opened} for {len(round_trips)} commands")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge command round trip")
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=MODES, help="clients to compare"
+    )
+    parser.add_argument(
+        "--commands", type=int, default=500, help="commands sent per client"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="bridge latency in seconds"
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+#
+# Benchmarks decoding of Events API batches.
+#
+# Compares parsing a batch into raw dicts with decode_batch, which turns it
+# into compact Event records, and reports parse time and memory per event.
+# Pass the path of a recorded response body to use real traffic, otherwise a
+# synthetic batch of mixed events is generated.
+
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from event_decoder import decode_batch, loads, orjson  # noqa: E402
+
+BATCH_SIZE = 5000
+ROUNDS = 20
+
+
+def make_event(number):
+    """
+    Build a synthetic event resembling the Events API payload.
+
+    Args:
+        number (int): Sequence number of the event.
+
+    Returns:
+        dict: Raw event.
+    """
+    user = {
+        "username": f"user{number}",
+        "inFanclub": random.random() < 0.2,
+        "gender": "m",
+        "hasTokens": True,
+        "recentTips": "none",
+        "isMod": False,
+        "colorGroup": "p",
+    }
+    method = random.choice(["userEnter", "userLeave", "tip", "chatMessage", "follow"])
+    payload = {"user": user, "broadcaster": "broadcaster"}
+    if method == "tip":
+        payload["tip"] = {"tokens": random.randint(1, 1000), "isAnon": False}
+    if method == "chatMessage":
+        payload["message"] = {"message": "hello " * 10, "color": "#000", "font": "x"}
+    return {"method": method, "object": payload, "id": f"{number}-{time.time()}"}
+
+
+def load_body():
+    """
+    Load a recorded response body or build a synthetic one.
+
+    Returns:
+        bytes: Response body.
+    """
+    if len(sys.argv) > 1:
+        return Path(sys.argv[1]).read_bytes()
+    events = [make_event(number) for number in range(BATCH_SIZE)]
+    return json.dumps({"events": events, "nextUrl": "https://example"}).encode()
+
+
+def measure(name, decode, body, count):
+    """
+    Print parse time and retained memory per event for a decoder.
+
+    Args:
+        name (str): Name of the decoder.
+        decode (callable): Function decoding the body.
+        body (bytes): Response body.
+        count (int): Number of events in the body.
+    """
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        decode(body)
+    elapsed = (time.perf_counter() - started) / ROUNDS
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = decode(body)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del result
+
+    print(
+        f"{name:<24} {elapsed * 1000:8.2f} ms/batch "
+        f"{elapsed / count * 1e6:6.2f} us/event {retained / count:8.1f} B/event"
+    )
+
+
+def main():
+    body = load_body()
+    count = len(json.loads(body)["events"])
+    print(f"{count} events, {len(body)} bytes, orjson {'on' if orjson else 'off'}")
+    measure("json.loads (raw dicts)", json.loads, body, count)
+    measure("loads (raw dicts)", loads, body, count)
+    measure("decode_batch (Event)", decode_batch, body, count)
+
+
+if __name__ == "__main__":
+    main()
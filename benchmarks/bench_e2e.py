@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+#
+# End-to-end benchmark of the event to light pipeline.
+#
+# Runs the real main() against the local mock Events API, replaying a script of
+# event rates and bursts, and the local mock Hue bridge with emulated latency
+# and rate limits. Reports events per second, event to command latency
+# percentiles, bridge calls per event and memory. Both mocks run in the same
+# process, so their allocations are included in the memory figures.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_events_api import DEFAULT_SCRIPT, MockEventsAPI  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+# Time in seconds given to the pipeline to catch up after the script ends
+SETTLE_SECONDS = 2
+
+
+def percentiles(samples):
+    """
+    Get the 50th, 90th and 99th percentiles of samples.
+
+    Args:
+        samples (list): Sample values.
+
+    Returns:
+        tuple: Percentiles, or None for each if there are too few samples.
+    """
+    if len(samples) < 2:
+        return None, None, None
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[89], cuts[98]
+
+
+def prepare_workdir(bridge, events_api):
+    """
+    Create a working directory with the files main() reads.
+
+    Args:
+        bridge (MockHueBridge): Mock bridge to use.
+        events_api (MockEventsAPI): Mock Events API to poll.
+    """
+    os.chdir(tempfile.mkdtemp(prefix="bench-e2e-"))
+    with open("credentials.json", "w") as file:
+        json.dump({"ip": bridge.address, "username": bridge.username}, file)
+    shutil.copy(ROOT / "rules.yaml", "rules.yaml")
+
+    os.environ["USERNAME"] = "bench"
+    os.environ["TOKEN"] = "token"
+    os.environ["EVENTS_API_URL"] = events_api.feed_url("{username}", "{token}")
+    os.environ.setdefault("LOG_LEVEL", "INFO")
+
+
+async def run(args):
+    bridge = MockHueBridge(latency=args.latency, rate_limited=not args.no_rate_limit)
+    events_api = MockEventsAPI(script=DEFAULT_SCRIPT, poll_delay=args.poll_timeout)
+    await bridge.start()
+    await events_api.start()
+    prepare_workdir(bridge, events_api)
+
+    # Imported here so logging writes into the working directory
+    import main as app
+    from metrics import DISPATCH_SECONDS, EVENT_TO_LIGHT_SECONDS
+
+    latencies = []
+    observe = EVENT_TO_LIGHT_SECONDS.observe
+
+    def record(value, *label_values):
+        latencies.append(value)
+        observe(value, *label_values)
+
+    EVENT_TO_LIGHT_SECONDS.observe = record
+
+    tracemalloc.start()
+    started = time.monotonic()
+    task = asyncio.create_task(app.main())
+    await asyncio.sleep(events_api.script_duration + SETTLE_SECONDS)
+    memory, peak = tracemalloc.get_traced_memory()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    elapsed = time.monotonic() - started
+    tracemalloc.stop()
+    await events_api.stop()
+    await bridge.stop()
+
+    methods = {phase.method for phase in DEFAULT_SCRIPT}
+    handled = sum(DISPATCH_SECONDS.count(method) for method in methods)
+    p50, p90, p99 = percentiles(latencies)
+
+    print(f"Events generated:       {events_api.generated}")
+    print(f"Events handled:         {handled} ({handled / elapsed:.1f}/s)")
+    if p50 is not None:
+        print(
+            f"Event to command:       p50 {p50 * 1000:.1f} ms, "
+            f"p90 {p90 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms "
+            f"({len(latencies)} effects)"
+        )
+    print(
+        f"Bridge calls per event: {bridge.requests / max(handled, 1):.3f} "
+        f"({bridge.requests} calls, {len(bridge.commands)} commands, "
+        f"{bridge.rejected} rate limited)"
+    )
+    print(
+        f"Memory:                 {memory / 1024:.1f} KiB, "
+        f"peak {peak / 1024:.1f} KiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="bridge latency in seconds"
+    )
+    parser.add_argument(
+        "--poll-timeout",
+        type=float,
+        default=10,
+        help="time in seconds the mock Events API holds an empty poll",
+    )
+    parser.add_argument(
+        "--no-rate-limit",
+        action="store_true",
+        help="accept every bridge command",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+#
+# Benchmarks the cost of each additional feed in multi-feed mode.
+#
+# Runs FeedManager against the local mock Events API with an increasing number
+# of feeds and reports memory and CPU time per additional feed.
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_events_api import MockEventsAPI  # noqa: E402
+from multi_feed import FeedConfig, FeedManager  # noqa: E402
+
+FEED_COUNTS = (1, 10, 50, 100)
+RUN_SECONDS = 5
+
+
+class CountingLightController:
+    """
+    Light controller stand-in that only counts triggered effects.
+    """
+
+    def __init__(self):
+        self.effects = 0
+
+    def play_effect(self, effect, group_id, received_at=None):
+        self.effects += 1
+        return True
+
+
+async def measure(feed_count):
+    """
+    Run the feed manager with a number of feeds.
+
+    Args:
+        feed_count (int): Number of feeds.
+
+    Returns:
+        tuple: Traced memory in bytes, CPU seconds and handled events.
+    """
+    # Each run needs fresh checkpoints, which point at the previous server
+    os.chdir(tempfile.mkdtemp())
+    server = MockEventsAPI(events_per_poll=1, poll_delay=0.1)
+    await server.start()
+    feeds = tuple(
+        FeedConfig(f"feed-{number}", server.feed_url(f"user{number}"), ())
+        for number in range(feed_count)
+    )
+    light_ctrl = CountingLightController()
+    manager = FeedManager(feeds, light_ctrl)
+
+    tracemalloc.start()
+    cpu_started = time.process_time()
+    task = asyncio.create_task(manager.run())
+    await asyncio.sleep(RUN_SECONDS)
+    memory = tracemalloc.get_traced_memory()[0]
+    cpu = time.process_time() - cpu_started
+    tracemalloc.stop()
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await server.stop()
+    handled = sum(stats["handled"] for stats in manager.stats().values())
+    return memory, cpu, handled
+
+
+async def main():
+    results = {}
+    for feed_count in FEED_COUNTS:
+        results[feed_count] = await measure(feed_count)
+        memory, cpu, handled = results[feed_count]
+        print(
+            f"{feed_count:4} feeds: {memory / 1024:9.1f} KiB, "
+            f"{cpu:6.2f} s CPU, {handled} events"
+        )
+
+    base_memory, base_cpu, _ = results[FEED_COUNTS[0]]
+    memory, cpu, _ = results[FEED_COUNTS[-1]]
+    extra = FEED_COUNTS[-1] - FEED_COUNTS[0]
+    print(
+        f"Per additional feed: {(memory - base_memory) / extra / 1024:.1f} KiB, "
+        f"{(cpu - base_cpu) / extra / RUN_SECONDS * 100:.2f}% CPU"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+#
+# Replay benchmark of the event pipeline.
+#
+# Runs the real main() on a recording instead of the Events API, against the
+# local mock Hue bridge. Without a recording, one is synthesized from the mock
+# Events API script. Replaying as fast as possible measures the maximum
+# throughput of the pipeline, and replaying at 1x or Nx shows its latency, from
+# the release of an event until its effect is queued, under the recorded bursts.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_e2e import percentiles  # noqa: E402
+from mock_events_api import DEFAULT_SCRIPT, make_event  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+
+def synthesize_recording(file_path, script=DEFAULT_SCRIPT, poll_interval=0.1):
+    """
+    Write a recording of the events generated by a mock Events API script.
+
+    Args:
+        file_path (str): Path to the recording.
+        script (tuple): Phases of scripted events.
+        poll_interval (float): Time in seconds between recorded batches.
+    """
+    from event_decoder import decode_event
+    from recorder import EventRecorder
+
+    recorder = EventRecorder(file_path)
+    at = time.time()
+    event_id = 0
+    for phase in script:
+        batch = [
+            decode_event(make_event(str(event_id + n), phase.method))
+            for n in range(phase.burst)
+        ]
+        event_id += phase.burst
+        due = 0.0
+        for _ in range(round(phase.duration / poll_interval)):
+            due += phase.rate * poll_interval
+            count = int(due)
+            due -= count
+            batch += [
+                decode_event(make_event(str(event_id + n), phase.method))
+                for n in range(count)
+            ]
+            event_id += count
+            recorder.record(batch, at)
+            batch = []
+            at += poll_interval
+    recorder.close()
+
+
+async def run(args):
+    bridge = MockHueBridge(latency=args.latency, rate_limited=not args.no_rate_limit)
+    await bridge.start()
+
+    recording = Path(args.recording).resolve() if args.recording else None
+    os.chdir(tempfile.mkdtemp(prefix="bench-replay-"))
+    if recording is None:
+        recording = Path("recording.ndjson.gz").resolve()
+        synthesize_recording(recording)
+    with open("credentials.json", "w") as file:
+        json.dump({"ip": bridge.address, "username": bridge.username}, file)
+    shutil.copy(ROOT / "rules.yaml", "rules.yaml")
+    os.environ["REPLAY_FILE"] = str(recording)
+    os.environ["REPLAY_SPEED"] = str(args.speed)
+    os.environ.setdefault("LOG_LEVEL", "INFO")
+
+    # Imported here so logging writes into the working directory
+    import main as app
+    from event_handler import EventHandler
+    from metrics import DISPATCH_SECONDS
+    from recorder import read_recording
+
+    methods = {
+        event.method for _, _, events in read_recording(recording) for event in events
+    }
+    latencies = []
+    span = []
+    process_event = EventHandler.process_event
+
+    async def timed_process_event(self, event, light_controller):
+        await process_event(self, event, light_controller)
+        done = time.monotonic()
+        latencies.append(done - event.received_at)
+        # Replay span from the first release to the last dispatch
+        if not span:
+            span[:] = [event.received_at, done]
+        span[1] = done
+
+    EventHandler.process_event = timed_process_event
+
+    await app.main()
+    await bridge.stop()
+
+    handled = sum(DISPATCH_SECONDS.count(method) for method in methods)
+    elapsed = span[1] - span[0] if span else 0
+    p50, p90, p99 = percentiles(latencies)
+    speed = f"{args.speed}x" if args.speed else "as fast as possible"
+    print(f"Replay speed:           {speed}")
+    print(
+        f"Events handled:         {handled} in {elapsed:.2f} s "
+        f"({handled / max(elapsed, 1e-9):.1f}/s)"
+    )
+    if p50 is not None:
+        print(
+            f"Event to dispatch:      p50 {p50 * 1000:.2f} ms, "
+            f"p90 {p90 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms"
+        )
+    print(
+        f"Bridge commands:        {len(bridge.commands)} "
+        f"({bridge.rejected} rate limited)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event replay benchmark")
+    parser.add_argument(
+        "recording",
+        nargs="?",
+        help="recording to replay, synthesized from the mock script if omitted",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="replay speed, 1 for real time, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="bridge latency in seconds"
+    )
+    parser.add_argument(
+        "--no-rate-limit",
+        action="store_true",
+        help="accept every bridge command",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
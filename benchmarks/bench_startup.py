@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+#
+# Benchmarks program startup.
+#
+# Measures the time to import the entry point and the time from launching
+# src/main.py until its first long-poll reaches the local mock Events API, with
+# saved credentials pointing at the local mock Hue bridge. Also lists the heavy
+# optional modules that importing the entry point pulls in.
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_events_api import MockEventsAPI  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+RUNS = 5
+# Modules that are only needed by optional or first-run code paths
+HEAVY_MODULES = ("aiofiles", "qhue", "requests", "yaml", "zeroconf", "multi_feed")
+
+IMPORT_SCRIPT = f"""
+import sys, time
+sys.path.insert(0, {str(ROOT / "src")!r})
+started = time.perf_counter()
+import main
+print(time.perf_counter() - started)
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def measure_import(workdir):
+    """
+    Import the entry point in a fresh interpreter.
+
+    Args:
+        workdir (str): Working directory of the interpreter.
+
+    Returns:
+        tuple: Import time in seconds and heavy modules that were imported.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    return float(output[0]), output[1] if len(output) > 1 else ""
+
+
+async def measure_first_poll(workdir, env):
+    """
+    Launch the program and wait for its first long-poll.
+
+    Args:
+        workdir (str): Working directory of the program.
+        env (dict): Environment of the program.
+
+    Returns:
+        float: Time in seconds from launch to the first poll.
+    """
+    events_api = MockEventsAPI(script=(), poll_delay=0.5)
+    await events_api.start()
+    env = {**env, "EVENTS_API_URL": events_api.feed_url("{username}", "{token}")}
+    # Start every run from the base URL instead of a saved cursor
+    for name in ("checkpoint.json", "checkpoint.json.wal"):
+        Path(workdir, name).unlink(missing_ok=True)
+
+    started = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        str(ROOT / "src" / "main.py"),
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        while events_api.first_poll_at is None:
+            await asyncio.sleep(0.001)
+        return events_api.first_poll_at - started
+    finally:
+        process.terminate()
+        await process.wait()
+        await events_api.stop()
+
+
+async def main():
+    bridge = MockHueBridge(latency=0.02)
+    await bridge.start()
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    with open(Path(workdir, "credentials.json"), "w") as file:
+        json.dump({"ip": bridge.address, "username": bridge.username}, file)
+    env = {**os.environ, "USERNAME": "bench", "TOKEN": "token", "LOG_LEVEL": "INFO"}
+
+    imports = [measure_import(workdir) for _ in range(RUNS)]
+    first_polls = [await measure_first_poll(workdir, env) for _ in range(RUNS)]
+    await bridge.stop()
+
+    import_times = [seconds for seconds, _ in imports]
+    print(
+        f"Import main:     median {statistics.median(import_times) * 1000:.1f} ms, "
+        f"min {min(import_times) * 1000:.1f} ms"
+    )
+    print(f"Heavy modules:   {imports[0][1] or 'none'}")
+    print(
+        f"Time to poll:    median {statistics.median(first_polls) * 1000:.1f} ms, "
+        f"min {min(first_polls) * 1000:.1f} ms (including interpreter startup)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,221 @@
+#! /usr/bin/env python3
+#
+# Benchmark of streamed effects against REST commands.
+#
+# Plays effects on a light controller connected to the local mock Hue bridge,
+# once as REST commands and once streamed to the bridge's stand-in
+# entertainment receiver, then preempts a running effect with another one. The
+# "dtls" mode shows the fallback to REST when DTLS streaming is not available,
+# e.g. without python-mbedtls or a client key. Reports bridge commands, stream
+# handshakes, the time to the first light change, and the rate and jitter of
+# the frames the receiver captured.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_e2e import percentiles  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+MODES = ("rest", "stream", "dtls")
+
+
+def is_light_change(body):
+    """
+    Check whether a command changes the lights for an effect.
+
+    Args:
+        body (dict): Command body.
+
+    Returns:
+        bool: False for stream toggles, scene recalls restoring the lights and
+            commands stopping an alert.
+    """
+    return not (
+        "stream" in body or "scene" in body or body.get("alert") == "none"
+    )
+
+
+def first_change(bridge, commands, frames, started):
+    """
+    Get the time of the first light change since a mark.
+
+    Args:
+        bridge (MockHueBridge): Mock bridge.
+        commands (int): Number of commands before the mark.
+        frames (int): Number of frames before the mark.
+        started (float): Monotonic time of the mark.
+
+    Returns:
+        float: Time in seconds from the mark, or None without a change.
+    """
+    changes = [
+        at for at, _, _, body in bridge.commands[commands:] if is_light_change(body)
+    ]
+    # Idle frames repeat the previous colors
+    previous = bridge.entertainment.frames[frames - 1][2] if frames else None
+    for at, _, colors in bridge.entertainment.frames[frames:]:
+        if colors != previous:
+            changes.append(at)
+            break
+    return min(changes) - started if changes else None
+
+
+async def play(mode, args):
+    """
+    Play the effects in one mode.
+
+    Args:
+        mode (str): Either "rest", "stream" or "dtls".
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        dict: Measurements of the mode.
+    """
+    from effects import EFFECTS
+    from entertainment import EntertainmentStream
+    from hue_bridge import HueBridge
+    from light_controller import LightController
+
+    bridge = MockHueBridge(latency=args.latency)
+    await bridge.start()
+    os.chdir(tempfile.mkdtemp(prefix="bench-stream-"))
+    with open("credentials.json", "w") as file:
+        json.dump({"ip": bridge.address, "username": bridge.username}, file)
+
+    hue = HueBridge()
+    controller = LightController(hue)
+    if mode != "rest":
+        controller.entertainment = EntertainmentStream(
+            hue,
+            controller.state_cache,
+            transport="udp" if mode == "stream" else "dtls",
+            rate=args.rate,
+            port=bridge.entertainment.port,
+        )
+    await controller.connect()
+    engine = controller.effect_engine
+
+    first_light = []
+    intervals = []
+    started_at = time.monotonic()
+    for name in args.effects:
+        started = time.monotonic()
+        commands = len(bridge.commands)
+        frames = len(bridge.entertainment.frames)
+        await engine.run(EFFECTS[name], "0")
+
+        changed = first_change(bridge, commands, frames, started)
+        if changed is not None:
+            first_light.append(changed)
+        new_frames = [at for at, _, _ in bridge.entertainment.frames[frames:]]
+        intervals += [b - a for a, b in zip(new_frames, new_frames[1:])]
+    elapsed = time.monotonic() - started_at
+
+    # Preempt a running effect like the effect queue does, which first releases
+    # or restores the lights
+    running = asyncio.create_task(engine.run(EFFECTS[args.effects[0]], "0"))
+    await asyncio.sleep(args.preempt_after)
+    started = time.monotonic()
+    commands = len(bridge.commands)
+    frames = len(bridge.entertainment.frames)
+    running.cancel()
+    await asyncio.gather(running, return_exceptions=True)
+    await engine.run(EFFECTS[args.effects[-1]], "0")
+    preempted = first_change(bridge, commands, frames, started)
+    preempt_commands = len(bridge.commands) - commands
+
+    handshakes = controller.entertainment.handshakes if mode != "rest" else 0
+    await controller.close()
+    await hue.close()
+    await bridge.stop()
+    return {
+        "commands": sum("stream" not in body for _, _, _, body in bridge.commands),
+        "rejected": bridge.rejected,
+        "handshakes": handshakes,
+        "frames": len(bridge.entertainment.frames),
+        "first_light": first_light,
+        "intervals": intervals,
+        "preempted": preempted,
+        "preempt_commands": preempt_commands,
+        "elapsed": elapsed,
+    }
+
+
+def report(mode, result):
+    """
+    Print the measurements of a mode.
+
+    Args:
+        mode (str): Mode name.
+        result (dict): Measurements of the mode.
+    """
+    print(f"{mode}:")
+    print(
+        f"  Bridge commands:      {result['commands']} "
+        f"({result['rejected']} rate limited) in {result['elapsed']:.2f} s"
+    )
+    print(f"  Stream handshakes:    {result['handshakes']}")
+    first_light = result["first_light"]
+    if first_light:
+        print(
+            f"  First light change:   mean "
+            f"{sum(first_light) / len(first_light) * 1000:.1f} ms"
+        )
+    p50, _, p99 = percentiles(result["intervals"])
+    if p50 is not None:
+        rate = 1 / (sum(result["intervals"]) / len(result["intervals"]))
+        print(
+            f"  Frames:               {result['frames']} at {rate:.1f}/s, "
+            f"interval p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+        )
+    if result["preempted"] is not None:
+        print(
+            f"  Preempting effect:    first light change after "
+            f"{result['preempted'] * 1000:.1f} ms, "
+            f"{result['preempt_commands']} bridge commands"
+        )
+
+
+async def run(args):
+    for mode in args.modes:
+        report(mode, await play(mode, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entertainment streaming benchmark")
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=MODES, help="modes to compare"
+    )
+    parser.add_argument(
+        "--effects",
+        nargs="+",
+        default=["flash_green", "flash_red", "flash_green_burst"],
+        help="effects to play",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=25, help="frames per second when streaming"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="bridge latency in seconds"
+    )
+    parser.add_argument(
+        "--preempt-after",
+        type=float,
+        default=0.5,
+        help="time in seconds an effect runs before it is preempted",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+#
+# Check the bridge event stream subscriber against the mock Hue bridge.
+#
+# Subscribes a state cache to the mock bridge's server-sent event stream, then
+# changes lights outside the REST API, drops the connection, changes a light
+# while the subscriber is disconnected and finally moves the bridge to a new
+# address. Checks that changes reach the cache without reads, that the
+# subscriber reconnects and resumes after the last event it received, and that
+# it follows the new bridge address. Exits with status 1 if any check fails.
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+
+async def wait_for(condition, timeout):
+    """
+    Wait until a condition holds.
+
+    Args:
+        condition (callable): Returns True once the condition holds.
+        timeout (float): Time in seconds to wait.
+
+    Returns:
+        bool: True if the condition held in time.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def check(args):
+    """
+    Run the checks.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        list: Failed checks.
+    """
+    from bridge_client import BridgeClient
+    from event_stream import BridgeEventStream
+    from state_cache import LIGHTS, StateCache
+
+    bridge = MockHueBridge(latency=args.latency)
+    moved = MockHueBridge(latency=args.latency)
+    await bridge.start()
+    await moved.start()
+    client = BridgeClient(bridge.address, bridge.username)
+    cache = StateCache()
+    stream = BridgeEventStream(client, cache, scheme="http", retry_delay=0.1)
+    task = asyncio.create_task(stream.run())
+    failures = []
+
+    def expect(name, passed):
+        print(f"{'ok' if passed else 'FAIL'}: {name}")
+        if not passed:
+            failures.append(name)
+
+    def light_state(light_id):
+        light = cache.get(LIGHTS, light_id)
+        return light["state"] if light else {}
+
+    try:
+        expect("connects", await wait_for(lambda: cache.live, args.timeout))
+
+        requests = bridge.requests
+        started = time.monotonic()
+        bridge.change_light("1", bri=127, xy=[0.5, 0.4])
+        expect(
+            "applies pushed changes",
+            await wait_for(lambda: light_state("1").get("bri") == 127, args.timeout),
+        )
+        elapsed = time.monotonic() - started
+        print(f"  pushed change applied in {elapsed * 1000:.1f} ms")
+        expect("serves changes without reads", bridge.requests == requests)
+        last_event_id = stream.last_event_id
+        expect("tracks the event ID", last_event_id == bridge.stream_events[-1][0])
+
+        bridge.drop_event_streams()
+        await asyncio.sleep(0)
+        bridge.change_light("2", on=False)
+        events = stream.events
+        expect(
+            "reconnects after a drop",
+            await wait_for(lambda: stream.connections == 2, args.timeout),
+        )
+        expect(
+            "resumes from the last event",
+            bridge.stream_connections[-1] == last_event_id,
+        )
+        expect(
+            "applies the missed event",
+            await wait_for(lambda: stream.events > events, args.timeout)
+            and light_state("2").get("on") is False,
+        )
+
+        client.set_ip(moved.address)
+        bridge.drop_event_streams()
+        expect(
+            "follows a new bridge address",
+            await wait_for(lambda: moved.stream_connections, args.timeout),
+        )
+        await wait_for(lambda: cache.live, args.timeout)
+        moved.change_light("3", bri=1)
+        expect(
+            "applies changes from the new address",
+            await wait_for(lambda: light_state("3").get("bri") == 1, args.timeout),
+        )
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await client.close()
+        await bridge.stop()
+        await moved.stop()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge event stream check")
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="bridge latency in seconds"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=5, help="time in seconds to wait per check"
+    )
+    failures = asyncio.run(check(parser.parse_args()))
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#! /usr/bin/env python3
+#
+# Check that flashing lights does not stall the event loop.
+#
+# Plays flashes on a stub light controller, whose bridge commands only wait out
+# a simulated round trip, while a ticker measures how late the event loop wakes
+# it up. With --bridge, the flashes are sent by a real light controller to the
+# local mock Hue bridge instead. Exits with status 1 when the 99th percentile of
+# the lag exceeds a few milliseconds, or when any single tick is late by a
+# stall, so the check can run in CI. The stall limit is looser because a busy
+# machine alone delays single ticks by several milliseconds.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_e2e import percentiles  # noqa: E402
+from mock_hue_bridge import MockHueBridge  # noqa: E402
+
+
+class StubController:
+    """
+    Light controller stand-in that simulates the bridge round trip.
+
+    Attributes:
+        latency (float): Simulated round trip of a bridge command in seconds.
+        entertainment (None): No entertainment stream, effects use commands.
+        commands (int): Number of commands sent.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.entertainment = None
+        self.commands = 0
+
+    async def snapshot_group(self, group_id):
+        """
+        Read a fixed group state after a round trip.
+        """
+        await asyncio.sleep(self.latency)
+        return {"1": {"on": True, "bri": 100, "xy": [0.3, 0.3]}}
+
+    async def group_light_ids(self, group_id):
+        """
+        Get the only light of the stub.
+        """
+        return ["1"]
+
+    async def set_group_action(self, group_id, **state):
+        """
+        Count a group command and wait out its round trip.
+        """
+        self.commands += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def restore_snapshot(self, snapshot, group_id=None, **extra):
+        """
+        Count a restore and wait out its round trip.
+        """
+        self.commands += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+
+async def measure_lag(interval, stop):
+    """
+    Measure how late the event loop wakes up a sleeping task.
+
+    Args:
+        interval (float): Time in seconds between ticks.
+        stop (asyncio.Event): Set to end the measurement.
+
+    Returns:
+        list: Lag of each tick in seconds.
+    """
+    lags = []
+    while not stop.is_set():
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        lags.append(time.monotonic() - expected)
+    return lags
+
+
+async def flash(args):
+    """
+    Play the flashes while measuring the event loop lag.
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        tuple: Lag of each tick in seconds, and the number of bridge commands.
+    """
+    from effects import EFFECTS, EffectEngine
+
+    bridge = hue = None
+    if args.bridge:
+        from hue_bridge import HueBridge
+        from light_controller import LightController
+
+        bridge = MockHueBridge(latency=args.latency)
+        await bridge.start()
+        os.chdir(tempfile.mkdtemp(prefix="check-loop-lag-"))
+        with open("credentials.json", "w") as file:
+            json.dump({"ip": bridge.address, "username": bridge.username}, file)
+        hue = HueBridge()
+        controller = LightController(hue)
+        await controller.connect()
+    else:
+        controller = StubController(args.latency)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(args.interval, stop))
+    engine = EffectEngine(controller, native=not args.keyframes)
+    for name in args.effects:
+        await engine.run(EFFECTS[name], "0")
+    stop.set()
+    lags = await ticker
+
+    if bridge:
+        commands = len(bridge.commands)
+        await controller.close()
+        await hue.close()
+        await bridge.stop()
+    else:
+        commands = controller.commands
+    return lags, commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop lag during flashes")
+    parser.add_argument(
+        "--effects",
+        nargs="+",
+        default=["flash_green", "flash_red", "flash_green_burst"],
+        help="effects to play",
+    )
+    parser.add_argument(
+        "--keyframes",
+        action="store_true",
+        help="play the declared keyframes instead of bridge-native effects",
+    )
+    parser.add_argument(
+        "--bridge",
+        action="store_true",
+        help="send the flashes to the mock Hue bridge instead of a stub",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="bridge latency in seconds"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.005, help="ticker interval in seconds"
+    )
+    parser.add_argument(
+        "--max-lag",
+        type=float,
+        default=5,
+        help="allowed 99th percentile of the lag in milliseconds",
+    )
+    parser.add_argument(
+        "--max-stall",
+        type=float,
+        default=25,
+        help="allowed lag of any single tick in milliseconds",
+    )
+    args = parser.parse_args()
+
+    lags, commands = asyncio.run(flash(args))
+    p50, _, p99 = percentiles(lags)
+    worst = max(lags)
+    print(f"Ticks:        {len(lags)} during {commands} bridge commands")
+    print(
+        f"Loop lag:     p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, "
+        f"max {worst * 1000:.2f} ms"
+    )
+    if p99 * 1000 > args.max_lag:
+        print(f"FAIL: p99 loop lag above {args.max_lag} ms")
+        sys.exit(1)
+    if worst * 1000 > args.max_stall:
+        print(f"FAIL: loop stalled for more than {args.max_stall} ms")
+        sys.exit(1)
+    print(f"OK: p99 loop lag below {args.max_lag} ms, no stall")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#! /usr/bin/env python3
+#
+# Local stand-in for the Chaturbate Events API.
+#
+# Serves the long-poll endpoint /events/<username>/<token>/ and honors nextUrl
+# and the timeout parameter. By default each poll returns a fixed number of
+# events after a configurable delay. With a script, events are generated at
+# scripted rates and bursts, and each poll is held open until events are
+# available or the poll times out.
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from aiohttp import web
+
+# Interval in seconds at which scripted events are generated
+TICK = 0.01
+
+
+@dataclass(frozen=True)
+class Phase:
+    """
+    Step of an event script.
+
+    Attributes:
+        duration (float): Length of the phase in seconds.
+        rate (float): Events generated per second during the phase.
+        burst (int): Events generated at once when the phase starts.
+        method (str): Method of the generated events.
+    """
+
+    duration: float
+    rate: float = 0
+    burst: int = 0
+    method: str = "userEnter"
+
+
+# Steady traffic with a tip burst and a fan club raid
+DEFAULT_SCRIPT = (
+    Phase(5, rate=20),
+    Phase(1, rate=20, burst=200, method="tip"),
+    Phase(5, rate=50),
+    Phase(1, burst=500),
+    Phase(3, rate=5),
+)
+
+
+def make_event(event_id, method="userEnter"):
+    """
+    Build a raw event.
+
+    Args:
+        event_id (str): Event ID.
+        method (str): Event method.
+
+    Returns:
+        dict: Raw event as returned by the Events API.
+    """
+    payload = {"user": {"username": f"user{event_id}", "inFanclub": True}}
+    if method == "tip":
+        payload["tip"] = {"tokens": 100, "isAnon": False, "message": ""}
+    elif method in ("chatMessage", "privateMessage"):
+        payload["message"] = {"message": "hello"}
+    return {"method": method, "id": event_id, "object": payload}
+
+
+class MockEventsAPI:
+    """
+    Mock Events API long-poll server.
+
+    Attributes:
+        events_per_poll (int): Number of events returned by each unscripted poll.
+        poll_delay (float): Time in seconds each poll is held open at most, unless
+            the poll asks for a shorter timeout.
+        script (tuple): Phases of scripted events, or None for fixed polls.
+        max_batch (int): Maximum number of scripted events per response.
+        polls (int): Number of polls served.
+        served (int): Number of events served.
+        generated (int): Number of scripted events generated.
+        first_poll_at (float): Monotonic time the first poll arrived, or None.
+        base_url (str): URL the server listens on once started.
+    """
+
+    def __init__(self, events_per_poll=1, poll_delay=0.1, script=None, max_batch=100):
+        self.events_per_poll = events_per_poll
+        self.poll_delay = poll_delay
+        self.script = script
+        self.max_batch = max_batch
+        self.polls = 0
+        self.served = 0
+        self.generated = 0
+        self.first_poll_at = None
+        self.base_url = None
+        self._ids = itertools.count()
+        self._backlog = deque()
+        self._available = asyncio.Event()
+        self._generator = None
+        self._runner = None
+
+    @property
+    def script_duration(self):
+        """
+        Total length of the script in seconds.
+        """
+        return sum(phase.duration for phase in self.script or ())
+
+    def feed_url(self, username="user", token="token"):
+        """
+        Get the base URL of a feed.
+
+        Args:
+            username (str): Broadcaster username.
+            token (str): API token.
+
+        Returns:
+            str: Feed URL.
+        """
+        return f"{self.base_url}/events/{username}/{token}/"
+
+    def make_events(self):
+        """
+        Build the events returned by one unscripted poll.
+
+        Returns:
+            list: Raw events.
+        """
+        return [
+            make_event(str(next(self._ids))) for _ in range(self.events_per_poll)
+        ]
+
+    def generate(self, count, method):
+        """
+        Add scripted events to the backlog.
+
+        Args:
+            count (int): Number of events.
+            method (str): Event method.
+        """
+        for _ in range(count):
+            self._backlog.append(make_event(str(next(self._ids)), method))
+        self.generated += count
+        if count:
+            self._available.set()
+
+    async def run_script(self):
+        """
+        Generate the scripted events in real time.
+        """
+        for phase in self.script:
+            self.generate(phase.burst, phase.method)
+            started = time.monotonic()
+            due = 0.0
+            while (elapsed := time.monotonic() - started) < phase.duration:
+                # Carry fractions over so low rates are generated exactly
+                due += phase.rate * TICK
+                count = int(due)
+                due -= count
+                self.generate(count, phase.method)
+                await asyncio.sleep(min(TICK, phase.duration - elapsed))
+
+    async def next_batch(self, timeout):
+        """
+        Wait for scripted events and take the next batch from the backlog.
+
+        Args:
+            timeout (float): Time in seconds to wait for events.
+
+        Returns:
+            list: Raw events, empty if none arrived before the poll timed out.
+        """
+        if not self._backlog:
+            self._available.clear()
+            try:
+                await asyncio.wait_for(self._available.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        count = min(len(self._backlog), self.max_batch)
+        return [self._backlog.popleft() for _ in range(count)]
+
+    async def handle_poll(self, request):
+        """
+        Serve one long-poll request.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Batch of events with the next URL.
+        """
+        self.polls += 1
+        if self.first_poll_at is None:
+            self.first_poll_at = time.monotonic()
+        timeout = min(self.poll_delay, float(request.query.get("timeout", "inf")))
+        if self.script is None:
+            await asyncio.sleep(timeout)
+            events = self.make_events()
+        else:
+            events = await self.next_batch(timeout)
+        self.served += len(events)
+        cursor = int(request.query.get("i", 0)) + 1
+        next_url = f"{self.base_url}{request.path}?i={cursor}&timeout=10"
+        return web.json_response({"events": events, "nextUrl": next_url})
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start the server and the event script.
+
+        Args:
+            host (str): Host to listen on.
+            port (int): Port to listen on, 0 for a free port.
+
+        Returns:
+            str: Base URL of the server.
+        """
+        app = web.Application()
+        app.router.add_get("/events/{username}/{token}/", self.handle_poll)
+        app.router.add_get("/events/{username}/{token}", self.handle_poll)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        if self.script is not None:
+            self._generator = asyncio.create_task(self.run_script())
+        return self.base_url
+
+    async def stop(self):
+        """
+        Stop the server.
+        """
+        if self._generator:
+            self._generator.cancel()
+            await asyncio.gather(self._generator, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main():
+    server = MockEventsAPI(script=DEFAULT_SCRIPT, poll_delay=10)
+    await server.start(port=8081)
+    print(f"Mock Events API listening on {server.feed_url()}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,590 @@
+#! /usr/bin/env python3
+#
+# Local stand-in for a Philips Hue bridge.
+#
+# Serves the v1 REST API used by the light controller (lights, groups and
+# scenes under /api/<username>) with emulated latency. Commands above the bridge's
+# rate limits are rejected with status 429, like an overloaded bridge. A UDP
+# receiver stands in for the entertainment stream and captures the frames sent
+# while an entertainment group is streaming, unencrypted instead of over DTLS.
+# Light changes are pushed as v2 server-sent events on /eventstream/clip/v2,
+# over plain HTTP, and recent events are replayed to a client that reconnects
+# with a Last-Event-ID.
+
+import asyncio
+import json
+import random
+import struct
+import time
+
+from aiohttp import web
+
+# Rate limits of a real bridge in commands per second
+LIGHT_COMMAND_RATE = 10
+GROUP_COMMAND_RATE = 1
+
+# Number of recent server-sent events kept for resuming clients
+STREAM_EVENTS_KEPT = 100
+
+# HueStream v1 header and light entries
+STREAM_HEADER = struct.Struct(">9sBBBHBB")
+STREAM_LIGHT = struct.Struct(">BHHHH")
+
+
+class RateLimit:
+    """
+    Token bucket limiting commands per second.
+
+    Attributes:
+        rate (float): Commands allowed per second.
+        capacity (float): Maximum burst of commands.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def allow(self):
+        """
+        Take a token if one is available.
+
+        Returns:
+            bool: True if the command is allowed.
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class EntertainmentReceiver(asyncio.DatagramProtocol):
+    """
+    UDP stand-in for the bridge's entertainment stream.
+
+    Attributes:
+        active (bool): Whether an entertainment group is streaming.
+        frames (list): Frames received while streaming, as (time, sequence,
+            colors) tuples with colors as x, y and brightness for each light ID.
+        rejected (int): Datagrams received while not streaming or malformed.
+        port (int): UDP port, once started.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.frames = []
+        self.rejected = 0
+        self.port = None
+        self._transport = None
+
+    def datagram_received(self, data, addr):
+        if not self.active or not data.startswith(b"HueStream"):
+            self.rejected += 1
+            return
+        _, major, _, sequence, _, _, _ = STREAM_HEADER.unpack_from(data)
+        if major != 1:
+            self.rejected += 1
+            return
+        colors = {}
+        for offset in range(STREAM_HEADER.size, len(data), STREAM_LIGHT.size):
+            _, light_id, x, y, bri = STREAM_LIGHT.unpack_from(data, offset)
+            colors[str(light_id)] = (x / 0xFFFF, y / 0xFFFF, bri / 0xFFFF)
+        self.frames.append((time.monotonic(), sequence, colors))
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start receiving.
+
+        Args:
+            host (str): Host to listen on.
+            port (int): Port to listen on, 0 for a free port.
+        """
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=(host, port)
+        )
+        self.port = self._transport.get_extra_info("sockname")[1]
+
+    def stop(self):
+        """
+        Stop receiving.
+        """
+        if self._transport:
+            self._transport.close()
+
+
+def make_light(name):
+    """
+    Build a light resource.
+
+    Args:
+        name (str): Light name.
+
+    Returns:
+        dict: Light resource.
+    """
+    return {
+        "name": name,
+        "type": "Extended color light",
+        "state": {
+            "on": True,
+            "bri": 254,
+            "xy": [0.3227, 0.329],
+            "ct": 366,
+            "colormode": "xy",
+            "reachable": True,
+        },
+        "capabilities": {"streaming": {"renderer": True, "proxy": False}},
+    }
+
+
+class MockHueBridge:
+    """
+    Mock Hue bridge serving the v1 REST API and the v2 event stream.
+
+    Attributes:
+        username (str): Accepted application key.
+        bridge_id (str): Bridge ID reported by /api/config.
+        latency (float): Time in seconds added to each request.
+        jitter (float): Maximum random time in seconds added on top of the latency.
+        limits (dict): Rate limit of each command kind, or None for no limits.
+        lights (dict): Light resources by ID.
+        groups (dict): Group resources by ID.
+        scenes (dict): Scene resources by ID.
+        requests (int): Number of requests served.
+        commands (list): Accepted commands as (time, kind, ID, body) tuples.
+        rejected (int): Number of commands rejected by the rate limits.
+        entertainment (EntertainmentReceiver): Stand-in entertainment stream.
+        stream_events (list): Recent server-sent events as (ID, frame) tuples.
+        stream_connections (list): Last-Event-ID sent by each event stream
+            client, None for a fresh connection.
+        base_url (str): URL the server listens on once started.
+    """
+
+    def __init__(
+        self,
+        username="bench",
+        bridge_id="001788fffe000000",
+        light_count=3,
+        latency=0.02,
+        jitter=0.01,
+        rate_limited=True,
+    ):
+        self.username = username
+        self.bridge_id = bridge_id
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = (
+            {
+                "lights": RateLimit(LIGHT_COMMAND_RATE),
+                "groups": RateLimit(GROUP_COMMAND_RATE),
+            }
+            if rate_limited
+            else None
+        )
+        self.lights = {
+            str(number): make_light(f"Light {number}")
+            for number in range(1, light_count + 1)
+        }
+        self.groups = {
+            "1": {
+                "name": "Room",
+                "type": "Room",
+                "lights": list(self.lights),
+                "action": dict(self.lights["1"]["state"]),
+            }
+        }
+        self.scenes = {}
+        self.requests = 0
+        self.commands = []
+        self.rejected = 0
+        self.entertainment = EntertainmentReceiver()
+        self.stream_events = []
+        self.stream_connections = []
+        self.base_url = None
+        self._runner = None
+        self._stream_queues = set()
+        self._stream_sequence = 0
+
+    @property
+    def address(self):
+        """
+        Host and port to use as the bridge IP.
+        """
+        return self.base_url.removeprefix("http://")
+
+    async def delay(self):
+        """
+        Emulate the bridge's response time.
+        """
+        self.requests += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def check_username(self, request):
+        """
+        Check the application key of a request.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Error response, or None if the key is valid.
+        """
+        if request.match_info["username"] == self.username:
+            return None
+        error = {"type": 1, "address": "/", "description": "unauthorized user"}
+        return web.json_response([{"error": error}])
+
+    def group_lights(self, group_id):
+        """
+        Get the light IDs of a group.
+
+        Args:
+            group_id (str): Group ID, "0" for all lights.
+
+        Returns:
+            list: Light IDs.
+        """
+        if group_id == "0":
+            return list(self.lights)
+        return self.groups[group_id]["lights"]
+
+    def change_light(self, light_id, **state):
+        """
+        Change a light outside the REST API, e.g. with a switch or another app.
+
+        Args:
+            light_id (str): Light ID.
+            **state: v1 state attributes to set.
+        """
+        self.lights[light_id]["state"].update(state)
+        self.push_event([light_id])
+
+    def push_event(self, light_ids):
+        """
+        Send the state of lights as a v2 update event to the event streams.
+
+        Args:
+            light_ids (list): IDs of the changed lights.
+        """
+        data = []
+        for light_id in light_ids:
+            state = self.lights[light_id]["state"]
+            data.append(
+                {
+                    "id": f"light-{light_id}",
+                    "id_v1": f"/lights/{light_id}",
+                    "type": "light",
+                    "on": {"on": state["on"]},
+                    "dimming": {"brightness": round(state["bri"] / 2.54, 2)},
+                    "color": {"xy": {"x": state["xy"][0], "y": state["xy"][1]}},
+                }
+            )
+        self._stream_sequence += 1
+        event_id = f"{int(time.time())}:{self._stream_sequence}"
+        event = {"type": "update", "id": event_id, "data": data}
+        frame = f"id: {event_id}\ndata: {json.dumps([event])}\n\n".encode()
+        self.stream_events.append((event_id, frame))
+        del self.stream_events[:-STREAM_EVENTS_KEPT]
+        for queue in self._stream_queues:
+            queue.put_nowait(frame)
+
+    def drop_event_streams(self):
+        """
+        Drop the connection of every event stream client.
+        """
+        for queue in self._stream_queues:
+            queue.put_nowait(None)
+
+    async def handle_config(self, request):
+        """
+        Serve the bridge configuration.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Bridge name and ID.
+        """
+        await self.delay()
+        return web.json_response(
+            {"name": "Mock bridge", "bridgeid": self.bridge_id.upper()}
+        )
+
+    async def handle_get(self, request):
+        """
+        Serve reads of lights and groups.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Requested resource.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+
+        kind = request.match_info["kind"]
+        resources = self.lights if kind == "lights" else self.groups
+        resource_id = request.match_info.get("id")
+        if resource_id is None:
+            return web.json_response(resources)
+        if kind == "groups" and resource_id == "0":
+            all_lights = {"name": "All lights", "lights": list(self.lights)}
+            return web.json_response(all_lights)
+        if resource_id not in resources:
+            raise web.HTTPNotFound()
+        return web.json_response(resources[resource_id])
+
+    async def handle_put(self, request):
+        """
+        Serve light state and group action commands.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Success entry for each written attribute.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+
+        kind = request.match_info["kind"]
+        resource_id = request.match_info["id"]
+        if self.limits and not self.limits[kind].allow():
+            self.rejected += 1
+            raise web.HTTPTooManyRequests()
+
+        body = await request.json()
+        if kind == "lights":
+            light_ids = [resource_id]
+        else:
+            light_ids = self.group_lights(resource_id)
+        scene_id = body.get("scene")
+        if scene_id is not None:
+            if scene_id not in self.scenes:
+                address = f"/scenes/{scene_id}"
+                error = {"type": 3, "address": address, "description": "not available"}
+                return web.json_response([{"error": error}])
+            for light_id, state in self.scenes[scene_id]["lightstates"].items():
+                self.lights[light_id]["state"].update(state)
+        state = {
+            key: value
+            for key, value in body.items()
+            if key not in ("scene", "alert", "transitiontime")
+        }
+        for light_id in light_ids:
+            self.lights[light_id]["state"].update(state)
+        self.commands.append((time.monotonic(), kind, resource_id, body))
+        self.push_event(light_ids)
+
+        address = request.path.split(f"/{self.username}", 1)[1]
+        return web.json_response(
+            [{"success": {f"{address}/{key}": value}} for key, value in body.items()]
+        )
+
+    async def handle_create_group(self, request):
+        """
+        Serve group creation.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Success entry with the new group ID.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+
+        body = await request.json()
+        group_id = str(max(map(int, self.groups)) + 1)
+        self.groups[group_id] = {
+            **body,
+            "action": dict(self.lights[body["lights"][0]]["state"]),
+            "stream": {"active": False},
+        }
+        return web.json_response([{"success": {"id": group_id}}])
+
+    async def handle_put_group(self, request):
+        """
+        Serve group updates, which start and stop entertainment streaming.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Success entry for each written attribute.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+
+        group_id = request.match_info["id"]
+        if group_id not in self.groups:
+            raise web.HTTPNotFound()
+        body = await request.json()
+        stream = body.get("stream")
+        if stream is not None:
+            if self.groups[group_id].get("type") != "Entertainment":
+                address = f"/groups/{group_id}/stream"
+                error = {"type": 6, "address": address, "description": "not available"}
+                return web.json_response([{"error": error}])
+            self.groups[group_id]["stream"]["active"] = stream["active"]
+            self.entertainment.active = stream["active"]
+        self.commands.append((time.monotonic(), "groups", group_id, body))
+        return web.json_response(
+            [{"success": {f"/groups/{group_id}/{key}": body[key]}} for key in body]
+        )
+
+    async def handle_create_scene(self, request):
+        """
+        Serve scene creation.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Success entry with the new scene ID.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+        # Scene writes count against the group command limit
+        if self.limits and not self.limits["groups"].allow():
+            self.rejected += 1
+            raise web.HTTPTooManyRequests()
+
+        body = await request.json()
+        scene_id = f"mock{len(self.scenes) + 1:04d}"
+        self.scenes[scene_id] = body
+        return web.json_response([{"success": {"id": scene_id}}])
+
+    async def handle_delete_scene(self, request):
+        """
+        Serve scene deletion.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Success entry for the deleted scene.
+        """
+        await self.delay()
+        error = self.check_username(request)
+        if error:
+            return error
+        # Scene writes count against the group command limit
+        if self.limits and not self.limits["groups"].allow():
+            self.rejected += 1
+            raise web.HTTPTooManyRequests()
+
+        scene_id = request.match_info["id"]
+        self.scenes.pop(scene_id, None)
+        return web.json_response([{"success": f"/scenes/{scene_id} deleted"}])
+
+    async def handle_event_stream(self, request):
+        """
+        Serve the v2 event stream as server-sent events.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.StreamResponse: Event stream, until it is dropped.
+        """
+        if request.headers.get("hue-application-key") != self.username:
+            raise web.HTTPForbidden()
+
+        last_event_id = request.headers.get("Last-Event-ID")
+        self.stream_connections.append(last_event_id)
+        queue = asyncio.Queue()
+        # Events after the client's last event, if it is still kept
+        ids = [event_id for event_id, _ in self.stream_events]
+        if last_event_id in ids:
+            for _, frame in self.stream_events[ids.index(last_event_id) + 1 :]:
+                queue.put_nowait(frame)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": hi\n\n")
+        self._stream_queues.add(queue)
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    # Drop the connection without ending the response
+                    if request.transport is not None:
+                        request.transport.close()
+                    break
+                await response.write(frame)
+        finally:
+            self._stream_queues.discard(queue)
+        return response
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Start the server.
+
+        Args:
+            host (str): Host to listen on.
+            port (int): Port to listen on, 0 for a free port.
+
+        Returns:
+            str: Base URL of the server.
+        """
+        app = web.Application()
+        kinds = "{kind:lights|groups}"
+        app.router.add_get("/api/config", self.handle_config)
+        app.router.add_get("/api/{username}/config", self.handle_config)
+        app.router.add_get(f"/api/{{username}}/{kinds}", self.handle_get)
+        app.router.add_get(f"/api/{{username}}/{kinds}/{{id}}", self.handle_get)
+        app.router.add_put(
+            f"/api/{{username}}/{kinds}/{{id}}/{{path:state|action}}", self.handle_put
+        )
+        app.router.add_post("/api/{username}/groups", self.handle_create_group)
+        app.router.add_put("/api/{username}/groups/{id}", self.handle_put_group)
+        app.router.add_post("/api/{username}/scenes", self.handle_create_scene)
+        app.router.add_delete("/api/{username}/scenes/{id}", self.handle_delete_scene)
+        app.router.add_get("/eventstream/clip/v2", self.handle_event_stream)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        await self.entertainment.start(host)
+        return self.base_url
+
+    async def stop(self):
+        """
+        Stop the server.
+        """
+        self.drop_event_streams()
+        self.entertainment.stop()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main():
+    bridge = MockHueBridge()
+    await bridge.start(port=8082)
+    print(f"Mock Hue bridge listening on {bridge.base_url}/api/{bridge.username}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
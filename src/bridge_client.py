@@ -0,0 +1,193 @@
+import logging
+
+import aiohttp
+
+from constants import BRIDGE_TIMEOUT
+from http_session import create_session
+
+
+class BridgeError(Exception):
+    """
+    Error returned by the Hue bridge.
+
+    Attributes:
+        status (int): HTTP status of the response, or None for errors reported
+            inside a successful response.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class BridgeClient:
+    """
+    Async client for the Hue bridge REST API.
+
+    All requests share one persistent session, so TCP and HTTPS connections to
+    the bridge are kept alive and reused between commands.
+
+    Attributes:
+        scheme (str): Scheme of the v1 API, "http" or "https".
+        ip (str): IP address of the Hue bridge.
+        username (str): Username for the Hue bridge.
+        base_url (str): Base URL for the v1 API.
+        resource_url (str): Base URL for the v2 resource API.
+        timeout (aiohttp.ClientTimeout): Timeout for bridge requests.
+        session (aiohttp.ClientSession): Shared client session.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, ip, username, use_https=False, timeout=BRIDGE_TIMEOUT):
+        self.scheme = "https" if use_https else "http"
+        self.username = username
+        self.set_ip(ip)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def set_ip(self, ip):
+        """
+        Point the client at a bridge IP, e.g. after the bridge's IP changed.
+
+        Args:
+            ip (str): IP address of the Hue bridge.
+        """
+        self.ip = ip
+        self.base_url = f"{self.scheme}://{ip}/api/{self.username}"
+        self.resource_url = f"https://{ip}/clip/v2/resource"
+
+    def get_session(self):
+        """
+        Get the shared session, creating it on first use.
+
+        Returns:
+            aiohttp.ClientSession: Shared client session.
+        """
+        if self.session is None or self.session.closed:
+            self.session = create_session(
+                headers={"hue-application-key": self.username},
+                timeout=self.timeout,
+            )
+        return self.session
+
+    async def request(self, method, url, body=None):
+        """
+        Send a request to the bridge.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Request URL.
+            body (dict): JSON body. Defaults to None.
+
+        Returns:
+            dict or list: Decoded JSON response.
+
+        Raises:
+            BridgeError: If the bridge returned an error.
+        """
+        session = self.get_session()
+        # The bridge uses a self-signed certificate, so it cannot be verified
+        async with session.request(method, url, json=body, ssl=False) as response:
+            if response.status >= 400:
+                raise BridgeError(
+                    f"Bridge returned status {response.status}", response.status
+                )
+            result = await response.json(content_type=None)
+
+        # The v1 API reports errors inside a successful response
+        if isinstance(result, list):
+            errors = [item["error"] for item in result if "error" in item]
+            if errors:
+                raise BridgeError(errors[0].get("description", errors[0]))
+        return result
+
+    async def call(self, *path, **body):
+        """
+        Call a v1 API path, reading it if no body is given and writing otherwise.
+
+        Args:
+            *path: Path segments, e.g. "groups", 0, "action".
+            **body: Attributes to write.
+
+        Returns:
+            dict or list: Decoded JSON response.
+        """
+        url = "/".join([self.base_url, *map(str, path)])
+        method = "PUT" if body else "GET"
+        return await self.request(method, url, body or None)
+
+    async def create(self, *path, **body):
+        """
+        Create a v1 API resource.
+
+        Args:
+            *path: Path segments of the collection, e.g. "scenes".
+            **body: Attributes of the new resource.
+
+        Returns:
+            list: Decoded JSON response with the ID of the new resource.
+        """
+        url = "/".join([self.base_url, *map(str, path)])
+        return await self.request("POST", url, body)
+
+    async def delete(self, *path):
+        """
+        Delete a v1 API resource.
+
+        Args:
+            *path: Path segments of the resource, e.g. "scenes", scene_id.
+
+        Returns:
+            list: Decoded JSON response.
+        """
+        url = "/".join([self.base_url, *map(str, path)])
+        return await self.request("DELETE", url)
+
+    async def lights(self, *path, **body):
+        """
+        Read or update lights.
+
+        Args:
+            *path: Path segments below /lights, e.g. light_id, "state".
+            **body: Attributes to write.
+
+        Returns:
+            dict or list: Decoded JSON response.
+        """
+        return await self.call("lights", *path, **body)
+
+    async def groups(self, *path, **body):
+        """
+        Read or update groups.
+
+        Args:
+            *path: Path segments below /groups, e.g. group_id, "action".
+            **body: Attributes to write.
+
+        Returns:
+            dict or list: Decoded JSON response.
+        """
+        return await self.call("groups", *path, **body)
+
+    async def resource(self, *path, method="GET", **body):
+        """
+        Call the v2 resource API over HTTPS.
+
+        Args:
+            *path: Path segments below /clip/v2/resource.
+            method (str): HTTP method. Defaults to "GET".
+            **body: JSON body.
+
+        Returns:
+            dict: Decoded JSON response.
+        """
+        url = "/".join([self.resource_url, *map(str, path)])
+        return await self.request(method, url, body or None)
+
+    async def close(self):
+        """
+        Close the shared session.
+        """
+        if self.session and not self.session.closed:
+            await self.session.close()
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+from os import path
+
+from constants import BRIDGE_GROUPS_FILE_PATH, SCENE_CACHE_FILE_PATH
+from hue_bridge import HueBridge, read_credentials
+from light_controller import LightController
+
+
+def load_bridge_groups(file_path=BRIDGE_GROUPS_FILE_PATH):
+    """
+    Load the logical groups spanning several bridges.
+
+    The file maps each group name to a group on one or more bridges:
+
+        groups:
+          studio:
+            - bridge: 001788fffe000000
+              group: 1
+            - bridge: 001788fffe000001
+              group: 3
+
+    Args:
+        file_path (str): Path to the groups file.
+
+    Returns:
+        dict: Bridge key and group ID pairs for each logical group name.
+    """
+    if not path.exists(file_path):
+        return {}
+
+    import yaml
+
+    with open(file_path, "r") as file:
+        config = yaml.safe_load(file) or {}
+    return {
+        str(name): tuple(
+            (str(member["bridge"]).lower(), str(member["group"])) for member in members
+        )
+        for name, members in (config.get("groups") or {}).items()
+    }
+
+
+def scene_file_path(key, multiple):
+    """
+    Get the scene cache file of a bridge.
+
+    Args:
+        key (str): Key of the bridge in the credentials file.
+        multiple (bool): Whether several bridges are used.
+
+    Returns:
+        str: Path to the scene cache file.
+    """
+    if not multiple:
+        return SCENE_CACHE_FILE_PATH
+    base, extension = path.splitext(SCENE_CACHE_FILE_PATH)
+    return f"{base}-{key}{extension}"
+
+
+class BridgeFanout:
+    """
+    Class to play effects on lights spread across several Hue bridges.
+
+    Each bridge has its own light controller, with its own connection pool,
+    command scheduler and effect queue, so a slow or unreachable bridge does not
+    hold up the others. An effect is queued on every bridge of its group at
+    once and starts on all of them within one round trip.
+
+    A logical group maps a name to a group on each of its bridges. Any other
+    group ID is used as is on every bridge, so group 0 is every light on every
+    bridge.
+
+    Attributes:
+        bridges (dict): Hue bridge for each bridge key.
+        controllers (dict): Light controller for each bridge key.
+        groups (dict): Bridge key and group ID pairs for each logical group name.
+        streaming (bool): Whether effects are streamed with the Hue Entertainment
+            API where possible.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, bridges, groups=None, streaming=False):
+        self.bridges = {hue.key: hue for hue in bridges}
+        multiple = len(self.bridges) > 1
+        self.controllers = {
+            key: LightController(
+                hue,
+                scene_file_path=scene_file_path(key, multiple),
+                streaming=streaming,
+            )
+            for key, hue in self.bridges.items()
+        }
+        self.groups = groups or {}
+        self.streaming = streaming
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def from_credentials(cls, pair_ips=(), streaming=False):
+        """
+        Connect to every saved bridge and pair new ones.
+
+        Without saved bridges, one bridge is discovered and paired.
+
+        Args:
+            pair_ips (iterable): IP addresses of bridges to pair if they are not
+                saved yet. Defaults to none.
+            streaming (bool): Whether to stream effects with the Hue
+                Entertainment API where possible. Defaults to False.
+
+        Returns:
+            BridgeFanout: Fan-out over the connected bridges.
+        """
+        saved = read_credentials()
+        bridges = [HueBridge(key) for key in saved]
+        saved_ips = {entry["ip"] for entry in saved.values()}
+        bridges += [HueBridge(ip=ip) for ip in pair_ips if ip not in saved_ips]
+        if not bridges:
+            bridges.append(HueBridge())
+        return cls(bridges, load_bridge_groups(), streaming)
+
+    def targets(self, group_id):
+        """
+        Resolve a group to the controller and group ID on each of its bridges.
+
+        Args:
+            group_id (str): Logical group name or group ID.
+
+        Returns:
+            list: Light controller and bridge group ID pairs.
+        """
+        members = self.groups.get(str(group_id))
+        if members is None:
+            return [(controller, group_id) for controller in self.controllers.values()]
+        targets = []
+        for key, bridge_group_id in members:
+            controller = self.controllers.get(key)
+            if controller is None:
+                self.logger.warning(f"Group {group_id} uses unknown bridge {key}")
+                continue
+            targets.append((controller, bridge_group_id))
+        return targets
+
+    def play_effect(
+        self, effect, group_id, received_at=None, trace_id=None, priority=0
+    ):
+        """
+        Queue an effect on every bridge of a group.
+
+        Args:
+            effect (str): Name of the effect.
+            group_id (str): Logical group name or group ID.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+            priority (int): Priority, higher values are played first and preempt
+                lower ones. Defaults to 0.
+
+        Returns:
+            bool: True if the effect was queued on at least one bridge.
+        """
+        queued = [
+            controller.play_effect(
+                effect, bridge_group_id, received_at, trace_id, priority
+            )
+            for controller, bridge_group_id in self.targets(group_id)
+        ]
+        return any(queued)
+
+    def flash_group_lights(self, group_id):
+        """
+        Flash group lights on every bridge of a group.
+
+        Args:
+            group_id (str): Logical group name or group ID.
+
+        Returns:
+            bool: True if the flash was queued on at least one bridge.
+        """
+        self.logger.info("Flashing lights green")
+        return self.play_effect("flash_green", group_id)
+
+    async def connect(self):
+        """
+        Connect to every bridge concurrently.
+        """
+        await asyncio.gather(
+            *(
+                controller.connect()
+                for key, controller in self.controllers.items()
+                if self.bridges[key].client
+            )
+        )
+
+    def event_streams(self):
+        """
+        Create a bridge event stream for every connected bridge.
+
+        Returns:
+            list: Bridge event streams.
+        """
+        from event_stream import BridgeEventStream
+
+        return [
+            BridgeEventStream(self.bridges[key].client, controller.state_cache)
+            for key, controller in self.controllers.items()
+            if self.bridges[key].client
+        ]
+
+    async def close(self):
+        """
+        Stop queued and running effects and close every bridge connection.
+        """
+        await asyncio.gather(
+            *(controller.close() for controller in self.controllers.values())
+        )
+        await asyncio.gather(*(hue.close() for hue in self.bridges.values()))
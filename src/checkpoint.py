@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from constants import (
+    CHECKPOINT_COMPACT_RECORDS,
+    CHECKPOINT_DEDUPE_SIZE,
+    CHECKPOINT_FILE_PATH,
+    CHECKPOINT_FSYNC_INTERVAL,
+)
+
+
+class EventCheckpoint:
+    """
+    Durable cursor and dedupe index for the Chaturbate Events API.
+
+    The cursor is the nextUrl returned with each batch. Every committed batch is
+    appended to a small write-ahead file, which is fsynced on a configurable
+    cadence and periodically compacted into an atomically replaced snapshot.
+
+    Attributes:
+        file_path (str): Path to the snapshot file.
+        wal_path (str): Path to the write-ahead file.
+        fsync_interval (float): Minimum time in seconds between fsyncs.
+        dedupe_size (int): Number of recent event IDs remembered.
+        compact_records (int): Number of write-ahead records before compacting.
+        next_url (str): Last committed cursor.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        file_path=CHECKPOINT_FILE_PATH,
+        fsync_interval=CHECKPOINT_FSYNC_INTERVAL,
+        dedupe_size=CHECKPOINT_DEDUPE_SIZE,
+        compact_records=CHECKPOINT_COMPACT_RECORDS,
+    ):
+        self.file_path = file_path
+        self.wal_path = f"{file_path}.wal"
+        self.fsync_interval = fsync_interval
+        self.dedupe_size = dedupe_size
+        self.compact_records = compact_records
+        self.next_url = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._seen = OrderedDict()
+        self._wal = None
+        self._wal_records = 0
+        self._last_fsync = 0.0
+
+    def load(self):
+        """
+        Load the cursor and dedupe index from disk.
+
+        Returns:
+            str: Last committed cursor, or None if there is none.
+        """
+        try:
+            with open(self.file_path, "r") as file:
+                snapshot = json.load(file)
+            self.next_url = snapshot.get("nextUrl")
+            self._remember(snapshot.get("ids", []))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Error reading checkpoint {self.file_path}: {e}")
+
+        torn = False
+        try:
+            with open(self.wal_path, "r") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a partially written last record
+                        self.logger.debug("Ignoring incomplete checkpoint record")
+                        torn = True
+                        break
+                    self.next_url = record["u"]
+                    self._remember(record["ids"])
+                    self._wal_records += 1
+        except FileNotFoundError:
+            pass
+
+        if torn:
+            # Start a clean write-ahead file so new records stay readable
+            self.compact()
+
+        self.logger.debug(f"Loaded checkpoint with {len(self._seen)} recent events")
+        return self.next_url
+
+    def is_duplicate(self, event_id):
+        """
+        Check whether an event was already committed.
+
+        Args:
+            event_id (str): Event ID.
+
+        Returns:
+            bool: True if the event was seen before.
+        """
+        return event_id is not None and event_id in self._seen
+
+    def commit(self, next_url, event_ids):
+        """
+        Durably record a handled batch.
+
+        Args:
+            next_url (str): Cursor for the next batch.
+            event_ids (list): IDs of the events in the handled batch.
+        """
+        event_ids = [event_id for event_id in event_ids if event_id is not None]
+        self.next_url = next_url
+        self._remember(event_ids)
+
+        if self._wal is None:
+            self._wal = open(self.wal_path, "a")
+        self._wal.write(json.dumps({"u": next_url, "ids": event_ids}) + "\n")
+        self._wal.flush()
+        self._wal_records += 1
+
+        now = time.monotonic()
+        if now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._wal.fileno())
+            self._last_fsync = now
+
+        if self._wal_records >= self.compact_records:
+            self.compact()
+
+    def compact(self):
+        """
+        Write a snapshot of the checkpoint and truncate the write-ahead file.
+        """
+        snapshot = {"nextUrl": self.next_url, "ids": list(self._seen)}
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.file_path)
+
+        if self._wal is not None:
+            self._wal.close()
+        self._wal = open(self.wal_path, "w")
+        self._wal_records = 0
+
+    def close(self):
+        """
+        Compact the checkpoint and close the write-ahead file.
+        """
+        if self.next_url is not None:
+            self.compact()
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def _remember(self, event_ids):
+        """
+        Add event IDs to the bounded dedupe index.
+
+        Args:
+            event_ids (list): Event IDs.
+        """
+        for event_id in event_ids:
+            self._seen[event_id] = None
+            self._seen.move_to_end(event_id)
+        while len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
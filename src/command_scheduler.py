@@ -0,0 +1,490 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+
+from bridge_client import BridgeError
+from constants import (
+    BRIDGE_GROUP_RATE,
+    BRIDGE_LIGHT_RATE,
+    BRIDGE_MAX_RETRIES,
+    BRIDGE_RATE_HEADROOM,
+    BRIDGE_RETRY_DELAY,
+    BRIDGE_TARGET_GROUP_RATE,
+    BRIDGE_TARGET_LIGHT_RATE,
+    RETRY_FACTOR,
+)
+from metrics import (
+    BRIDGE_COMMAND_ERRORS,
+    BRIDGE_COMMAND_MAX_WAIT_SECONDS,
+    BRIDGE_COMMAND_QUEUE_DEPTH,
+    BRIDGE_COMMAND_SECONDS,
+    BRIDGE_COMMAND_WAIT_SECONDS,
+)
+
+LIGHTS = "lights"
+GROUPS = "groups"
+
+# Path segment the state is written to for each kind of target
+STATE_PATHS = {LIGHTS: "state", GROUPS: "action"}
+
+# HTTP statuses of a bridge that is throttling commands
+THROTTLED_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """
+    Token bucket limiting how often commands may be sent.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of stored tokens.
+        tokens (float): Currently available tokens.
+        updated (float): Monotonic time of the last refill.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self):
+        """
+        Time until a token is available.
+
+        Returns:
+            float: Delay in seconds, 0 if a token is available now.
+        """
+        now = time.monotonic()
+        refill = (now - self.updated) * self.rate
+        self.tokens = min(self.capacity, self.tokens + refill)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """
+        Take one token from the bucket.
+        """
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """
+        Hold back the next token for at least a given time.
+
+        Args:
+            seconds (float): Time in seconds until the next token.
+        """
+        self.delay()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+@dataclass
+class Command:
+    """
+    Command waiting to be sent to the bridge.
+
+    Attributes:
+        kind (str): Either "lights" or "groups".
+        target_id (str): Light or group ID.
+        state (dict): State to write.
+        priority (int): Priority, higher values are sent first.
+        seq (int): Sequence number used for ordering within a priority.
+        queued_at (float): Monotonic time the command was first queued.
+        futures (list): Futures resolved once the command was sent.
+        attempts (int): Number of times the bridge throttled the command.
+        key (tuple): Key of the command in the queue.
+        request (tuple): Client method and path of a write that is not a state
+            update, or None for state updates.
+    """
+
+    kind: str
+    target_id: str
+    state: dict
+    priority: int
+    seq: int
+    queued_at: float = field(default_factory=time.monotonic)
+    futures: list = field(default_factory=list)
+    attempts: int = 0
+    key: tuple = None
+    request: tuple = None
+
+    def __post_init__(self):
+        if self.key is None:
+            self.key = (self.kind, str(self.target_id))
+
+
+class CommandScheduler:
+    """
+    Class to pace commands to the Hue bridge with token buckets.
+
+    Each kind of target has a bucket for the bridge-wide ceiling and every light
+    or group has its own bucket. The buckets run slightly below the bridge's
+    limits, as uneven latency brings commands to the bridge closer together than
+    they were sent. A command queued for a target that already has a pending
+    command is merged into it, so each attribute is sent once with its latest
+    value and attributes set only by the earlier command are kept. Commands the
+    bridge throttles are queued again and the buckets paused, backing off
+    exponentially, before their futures fail. Other writes, such as creating a
+    scene, are queued with the commands and charged to a bridge-wide bucket.
+
+    Attributes:
+        client (BridgeClient): Client used to send commands.
+        kind_buckets (dict): Bridge-wide token bucket for each kind.
+        target_rates (dict): Rate of the per-target buckets for each kind.
+        target_buckets (dict): Token bucket for each light and group.
+        bridge (str): Key of the bridge, used to label the command metrics.
+        sent (int): Number of commands sent.
+        coalesced (int): Number of commands merged into a pending one.
+        retried (int): Number of throttled commands queued again.
+        total_wait (float): Total time commands spent queued in seconds.
+        max_wait (float): Longest time a command spent queued in seconds.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        client,
+        light_rate=BRIDGE_LIGHT_RATE,
+        group_rate=BRIDGE_GROUP_RATE,
+        target_light_rate=BRIDGE_TARGET_LIGHT_RATE,
+        target_group_rate=BRIDGE_TARGET_GROUP_RATE,
+        bridge="",
+        headroom=BRIDGE_RATE_HEADROOM,
+    ):
+        self.client = client
+        self.bridge = bridge
+        self.kind_buckets = {
+            LIGHTS: TokenBucket(light_rate * headroom),
+            GROUPS: TokenBucket(group_rate * headroom),
+        }
+        self.target_rates = {
+            LIGHTS: target_light_rate * headroom,
+            GROUPS: target_group_rate * headroom,
+        }
+        self.target_buckets = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._pending = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker = None
+
+    @property
+    def depth(self):
+        """
+        Number of commands waiting to be sent.
+
+        Returns:
+            int: Queue depth.
+        """
+        return len(self._pending)
+
+    def stats(self):
+        """
+        Snapshot of the scheduler counters.
+
+        Returns:
+            dict: Queue depth, sent, coalesced and retried counts and wait times.
+        """
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "average_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def set_light_state(self, light_id, priority=0, **state):
+        """
+        Queue a light state update and wait until it was sent.
+
+        Args:
+            light_id (str): Light ID.
+            priority (int): Priority, higher values are sent first. Defaults to 0.
+            **state: Light state attributes.
+        """
+        await self.submit(LIGHTS, light_id, state, priority)
+
+    async def set_group_action(self, group_id, priority=0, **state):
+        """
+        Queue a group action and wait until it was sent.
+
+        Args:
+            group_id (str): Group ID.
+            priority (int): Priority, higher values are sent first. Defaults to 0.
+            **state: Group action attributes.
+        """
+        await self.submit(GROUPS, group_id, state, priority)
+
+    def request(self, kind, method, *path, priority=0, **body):
+        """
+        Queue a bridge write that is not a state update, e.g. creating a scene.
+
+        The write is charged to the bridge-wide bucket of a kind and never merged
+        with other commands.
+
+        Args:
+            kind (str): Bucket charged for the write, "lights" or "groups".
+            method (str): Client method, e.g. "create" or "delete".
+            *path: Path segments, e.g. "scenes".
+            priority (int): Priority, higher values are sent first. Defaults to 0.
+            **body: Attributes to write.
+
+        Returns:
+            asyncio.Future: Future resolved with the response once it was sent.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        seq = next(self._seq)
+        command = Command(
+            kind,
+            None,
+            body,
+            priority,
+            seq,
+            futures=[future],
+            key=(method, seq),
+            request=(method, path),
+        )
+        self._pending[command.key] = command
+        heapq.heappush(self._heap, (-priority, seq, command.key))
+        BRIDGE_COMMAND_QUEUE_DEPTH.set(self.depth, self.bridge)
+        self._wakeup.set()
+        return future
+
+    def submit(self, kind, target_id, state, priority=0):
+        """
+        Queue a command, merging it into any pending command for the same target.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            target_id (str): Light or group ID.
+            state (dict): State to write.
+            priority (int): Priority, higher values are sent first. Defaults to 0.
+
+        Returns:
+            asyncio.Future: Future resolved once the command was sent.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        key = (kind, str(target_id))
+
+        command = self._pending.get(key)
+        if command:
+            self.coalesced += 1
+            command.state = {**command.state, **state}
+            if priority > command.priority:
+                command.priority = priority
+                command.seq = next(self._seq)
+                heapq.heappush(self._heap, (-priority, command.seq, key))
+        else:
+            command = Command(kind, target_id, state, priority, next(self._seq))
+            self._pending[key] = command
+            heapq.heappush(self._heap, (-priority, command.seq, key))
+            BRIDGE_COMMAND_QUEUE_DEPTH.set(self.depth, self.bridge)
+
+        command.futures.append(future)
+        self._wakeup.set()
+        return future
+
+    def _requeue(self, command):
+        """
+        Queue a throttled command again, under any command queued since.
+
+        Args:
+            command (Command): Command the bridge throttled.
+        """
+        key = command.key
+        pending = self._pending.get(key)
+        if pending:
+            # The state queued since is newer than the throttled state
+            pending.state = {**command.state, **pending.state}
+            pending.futures = command.futures + pending.futures
+            pending.queued_at = command.queued_at
+            pending.attempts = command.attempts
+            if command.priority > pending.priority:
+                pending.priority = command.priority
+                pending.seq = next(self._seq)
+                heapq.heappush(self._heap, (-pending.priority, pending.seq, key))
+        else:
+            command.seq = next(self._seq)
+            self._pending[key] = command
+            heapq.heappush(self._heap, (-command.priority, command.seq, key))
+            BRIDGE_COMMAND_QUEUE_DEPTH.set(self.depth, self.bridge)
+        self._wakeup.set()
+
+    async def close(self):
+        """
+        Stop the scheduler and cancel pending commands.
+        """
+        for command in self._pending.values():
+            for future in command.futures:
+                future.cancel()
+        self._pending.clear()
+        self._heap.clear()
+        BRIDGE_COMMAND_QUEUE_DEPTH.set(0, self.bridge)
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    def _ensure_worker(self):
+        """
+        Start the worker task if it is not running.
+        """
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def _peek(self):
+        """
+        Get the next command to send, skipping stale heap entries.
+
+        Returns:
+            Command: Next command, or None if nothing is queued.
+        """
+        while self._heap:
+            _, seq, key = self._heap[0]
+            command = self._pending.get(key)
+            if command and command.seq == seq:
+                return command
+            heapq.heappop(self._heap)
+        return None
+
+    def _target_bucket(self, command):
+        """
+        Get the token bucket for the target of a command.
+
+        Args:
+            command (Command): Queued command.
+
+        Returns:
+            TokenBucket: Bucket for the light or group, or None for other writes.
+        """
+        if command.request:
+            return None
+        key = command.key
+        bucket = self.target_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.target_rates[command.kind])
+            self.target_buckets[key] = bucket
+        return bucket
+
+    async def _run(self):
+        """
+        Send queued commands as fast as the token buckets allow.
+        """
+        while True:
+            command = self._peek()
+            if command is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            kind_bucket = self.kind_buckets[command.kind]
+            target_bucket = self._target_bucket(command)
+            delay = kind_bucket.delay()
+            if target_bucket:
+                delay = max(delay, target_bucket.delay())
+            if delay:
+                # Commands may be merged or reprioritised while waiting
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            del self._pending[command.key]
+            BRIDGE_COMMAND_QUEUE_DEPTH.set(self.depth, self.bridge)
+            kind_bucket.consume()
+            if target_bucket:
+                target_bucket.consume()
+            await self._send(command, kind_bucket, target_bucket)
+
+    async def _send(self, command, kind_bucket, target_bucket):
+        """
+        Send a command and resolve its futures.
+
+        Args:
+            command (Command): Command to send.
+            kind_bucket (TokenBucket): Bridge-wide bucket of the command's kind.
+            target_bucket (TokenBucket): Bucket of the command's target, or None.
+        """
+        wait = time.monotonic() - command.queued_at
+        self.sent += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        BRIDGE_COMMAND_WAIT_SECONDS.observe(wait, self.bridge)
+        BRIDGE_COMMAND_MAX_WAIT_SECONDS.set(self.max_wait, self.bridge)
+        self.logger.debug(
+            "Sending %s/%s after %.3fs, %d queued",
+            *self._describe(command),
+            wait,
+            self.depth,
+        )
+
+        started = time.monotonic()
+        try:
+            if command.request:
+                method, path = command.request
+                result = await getattr(self.client, method)(*path, **command.state)
+            else:
+                result = await self.client.call(
+                    command.kind,
+                    command.target_id,
+                    STATE_PATHS[command.kind],
+                    **command.state,
+                )
+        except Exception as e:
+            BRIDGE_COMMAND_ERRORS.inc(self.bridge, command.kind)
+            throttled = isinstance(e, BridgeError) and e.status in THROTTLED_STATUSES
+            if throttled and command.attempts < BRIDGE_MAX_RETRIES:
+                delay = BRIDGE_RETRY_DELAY * RETRY_FACTOR**command.attempts
+                command.attempts += 1
+                self.retried += 1
+                self.logger.warning(
+                    "Bridge throttled %s/%s with status %d, resending in %.1fs",
+                    *self._describe(command),
+                    e.status,
+                    delay,
+                )
+                kind_bucket.pause(delay)
+                if target_bucket:
+                    target_bucket.pause(delay)
+                self._requeue(command)
+                return
+            for future in command.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        BRIDGE_COMMAND_SECONDS.observe(
+            time.monotonic() - started, self.bridge, command.kind
+        )
+        for future in command.futures:
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _describe(command):
+        """
+        Describe a command for log messages.
+
+        Args:
+            command (Command): Queued command.
+
+        Returns:
+            tuple: Kind or client method, and target ID or path.
+        """
+        if command.request:
+            method, path = command.request
+            return method, "/".join(map(str, path))
+        return command.kind, command.target_id
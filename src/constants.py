@@ -4,4 +4,61 @@ CREDENTIALS_FILE_PATH = "credentials.json"
 MAX_RETRY_DELAY = 60  # Maximum delay between retries in seconds
 RETRY_FACTOR = 2  # Factor by which to increase retry delay
 INITIAL_RETRY_DELAY = 5  # Initial delay between retries in seconds
-API_TIMEOUT = 20  # Timeout for API requests in seconds
+API_TIMEOUT = 20  # Time in seconds the Events API holds a long-poll open
+EFFECT_QUEUE_MAX_DEPTH = 10  # Maximum number of queued light effects
+EFFECT_QUEUE_DROP_POLICY = "drop-oldest"  # Either "drop-oldest" or "drop-newest"
+EFFECT_MERGE_WINDOW = 5  # Window in seconds for merging identical effect triggers
+EFFECT_AGING_RATE = 0.5  # Priority gained per second by a waiting effect
+EFFECT_MAX_WAIT = 15  # Time in seconds after which a waiting effect is dropped
+BRIDGE_TIMEOUT = 5  # Timeout for Hue bridge requests in seconds
+HTTP_POOL_LIMIT = 10  # Maximum number of pooled HTTP connections per session
+HTTP_KEEPALIVE_TIMEOUT = 60  # Time in seconds idle HTTP connections are kept open
+BRIDGE_LIGHT_RATE = 10  # Maximum light commands per second across the bridge
+BRIDGE_GROUP_RATE = 1  # Maximum group commands per second across the bridge
+BRIDGE_TARGET_LIGHT_RATE = 5  # Maximum commands per second to a single light
+BRIDGE_TARGET_GROUP_RATE = 1  # Maximum commands per second to a single group
+BRIDGE_RATE_HEADROOM = 0.9  # Fraction of the bridge rate limits commands are sent at
+BRIDGE_RETRY_DELAY = 0.5  # Initial delay before resending a throttled command
+BRIDGE_MAX_RETRIES = 3  # Times a command throttled by the bridge is resent
+STATE_CACHE_TTL = 60  # Time in seconds cached light and group state stays fresh
+CHECKPOINT_FILE_PATH = "checkpoint.json"  # Path to the Events API cursor checkpoint
+CHECKPOINT_FSYNC_INTERVAL = 1.0  # Minimum time in seconds between checkpoint fsyncs
+CHECKPOINT_DEDUPE_SIZE = 10000  # Number of recent event IDs kept for deduplication
+CHECKPOINT_COMPACT_RECORDS = 1000  # Checkpoint records written before compacting
+PIPELINE_QUEUE_SIZE = 100  # Maximum number of events waiting to be handled
+PIPELINE_WORKERS = 2  # Number of concurrent event handler workers
+PIPELINE_DRAIN_TIMEOUT = 10  # Time in seconds to handle queued events on shutdown
+RULES_FILE_PATH = "rules.yaml"  # Path to the event to effect rules
+COOLDOWN_INDEX_SIZE = 100_000  # Maximum number of keys tracked for rule cooldowns
+FEEDS_FILE_PATH = "feeds.yaml"  # Path to the multi-feed configuration
+EVENTS_API_URL = "https://eventsapi.chaturbate.com/events/{username}/{token}"
+LOG_FILE_PATH = "app.log"  # Path to the application log file
+LOG_BATCH_SIZE = 100  # Log records written before flushing in queued logging mode
+LOG_FLUSH_INTERVAL = 1.0  # Maximum time in seconds between log flushes in queued mode
+LOG_ALIGN_CHUNK_SIZE = 65536  # Bytes of the log file read at a time when aligning
+LOG_ROTATE_BYTES = 10 * 1024 * 1024  # Log file size in bytes that triggers rotation
+LOG_ROTATE_INTERVAL = 7 * 24 * 3600  # Time in seconds between log file rotations
+METRICS_HOST = "127.0.0.1"  # Address the metrics endpoint listens on
+METRICS_PORT = 9464  # Port the metrics endpoint listens on
+DISCOVERY_TIMEOUT = 5  # Timeout for each bridge discovery method in seconds
+DISCOVERY_HEAD_START = 0.25  # Time in seconds a cached bridge IP races alone
+BRIDGE_PROBE_TIMEOUT = 2  # Timeout for checking a bridge at a known IP in seconds
+SCENE_CACHE_FILE_PATH = "scenes.json"  # Path to the cache of provisioned bridge scenes
+SCENE_CACHE_SIZE = 50  # Maximum number of bridge scenes provisioned for restoring
+BRIDGE_GROUPS_FILE_PATH = "bridge_groups.yaml"  # Path to groups spanning bridges
+POLL_CONNECT_TIMEOUT = 5  # Timeout for connecting to the Events API in seconds
+POLL_READ_MARGIN = 10  # Time in seconds a long-poll may take beyond API_TIMEOUT
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failed polls that pause polling
+CIRCUIT_RESET_TIMEOUT = 120  # Time in seconds polling pauses before a trial poll
+RECORD_FLUSH_INTERVAL = 1.0  # Minimum time in seconds between event recording flushes
+TRACE_BUFFER_SIZE = 1000  # Number of event traces kept in each ring buffer
+TRACE_SLOW_SECONDS = 1.0  # Event trace latency in seconds that is logged as slow
+TRACE_DUMP_FILE_PATH = "slow_traces.ndjson"  # Path slow event traces are dumped to
+PROFILE_SECONDS = 10  # Time in seconds an on-demand profile runs by default
+PROFILE_FILE_PATH = "profile-{timestamp}.prof"  # Path of on-demand profiles
+ENTERTAINMENT_FRAME_RATE = 25  # Frames per second streamed to entertainment lights
+ENTERTAINMENT_PORT = 2100  # UDP port of the bridge's entertainment stream
+ENTERTAINMENT_GROUP_NAME = "python-hue-events"  # Name of the streaming group
+ENTERTAINMENT_MAX_LIGHTS = 10  # Maximum number of lights in an entertainment group
+ENTERTAINMENT_RETRY_INTERVAL = 60  # Time in seconds before retrying failed streaming
+ENTERTAINMENT_IDLE_INTERVAL = 0.2  # Time in seconds between frames of an idle stream
@@ -0,0 +1,90 @@
+import logging
+import time
+from collections import OrderedDict
+
+from constants import COOLDOWN_INDEX_SIZE
+
+# Event fields a rule cooldown can be keyed by
+COOLDOWN_KEYS = {
+    "user": ("username",),
+    "method": ("method",),
+    "both": ("method", "username"),
+}
+
+
+class CooldownIndex:
+    """
+    Memory-bounded index of when users and events last triggered an effect.
+
+    Keys are kept in an ordered dictionary in the order they last triggered, so
+    checking a key, recording it and evicting the oldest key are all O(1). Keys
+    older than the longest cooldown can no longer suppress anything and are
+    evicted from the front as new keys are recorded. When the index is full, the
+    least recently triggered key is evicted early, so memory stays bounded
+    however many distinct users are seen during a broadcast.
+
+    Attributes:
+        capacity (int): Maximum number of keys tracked.
+        ttl (float): Longest cooldown in seconds checked so far.
+        suppressed (int): Number of triggers suppressed.
+        evicted (int): Number of keys evicted before their cooldown ended.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, capacity=COOLDOWN_INDEX_SIZE):
+        self.capacity = capacity
+        self.ttl = 0.0
+        self.suppressed = 0
+        self.evicted = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._triggered = OrderedDict()
+
+    def __len__(self):
+        return len(self._triggered)
+
+    def check(self, key, cooldown, now=None):
+        """
+        Check whether a key is cooling down, and start its cooldown if not.
+
+        Suppressed triggers do not extend the cooldown, so a steady stream of
+        triggers still plays the effect once per cooldown.
+
+        Args:
+            key (tuple): Key of the trigger.
+            cooldown (float): Time in seconds the key stays cooling down.
+            now (float): Monotonic time of the trigger. Defaults to now.
+
+        Returns:
+            bool: True if the trigger is suppressed.
+        """
+        now = time.monotonic() if now is None else now
+        triggered = self._triggered.get(key)
+        if triggered is not None and now - triggered < cooldown:
+            self.suppressed += 1
+            return True
+
+        self._triggered[key] = now
+        self._triggered.move_to_end(key)
+        self.ttl = max(self.ttl, cooldown)
+        self._evict(now)
+        return False
+
+    def _evict(self, now):
+        """
+        Evict expired keys, and the oldest keys while the index is over capacity.
+
+        Args:
+            now (float): Monotonic time.
+        """
+        while self._triggered:
+            key = next(iter(self._triggered))
+            if now - self._triggered[key] < self.ttl:
+                if len(self._triggered) <= self.capacity:
+                    break
+                if not self.evicted:
+                    self.logger.warning(
+                        f"Cooldown index full at {self.capacity} keys, "
+                        "ending the oldest cooldowns early"
+                    )
+                self.evicted += 1
+            self._triggered.popitem(last=False)
@@ -0,0 +1,357 @@
+import logging
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from operator import attrgetter
+from os import path
+
+from constants import RULES_FILE_PATH
+from cooldown import COOLDOWN_KEYS
+from effects import EFFECTS
+
+# Default rules used when no rules file exists
+DEFAULT_RULES = [
+    {
+        "name": "fanclub-enter",
+        "method": "userEnter",
+        "when": {"in_fanclub": True},
+        "effect": "flash_green",
+        "cooldown": 60,
+    },
+]
+
+
+def load_rules(file_path=RULES_FILE_PATH):
+    """
+    Read rule definitions from a YAML file.
+
+    Args:
+        file_path (str): Path to the rules file.
+
+    Returns:
+        list: Rule definitions, or the default rules if the file does not exist.
+    """
+    if not path.exists(file_path):
+        return DEFAULT_RULES
+    # yaml is only imported when there is a rules file to read
+    import yaml
+
+    with open(file_path, "r") as file:
+        config = yaml.safe_load(file) or {}
+    return config.get("rules", [])
+
+
+def equals(value):
+    """
+    Build a check that the field equals the rule value.
+    """
+    return lambda actual: actual == value
+
+
+def at_least(value):
+    """
+    Build a check that the field is at least the rule value.
+    """
+    return lambda actual: actual >= value
+
+
+def at_most(value):
+    """
+    Build a check that the field is at most the rule value.
+    """
+    return lambda actual: actual <= value
+
+
+def one_of(value):
+    """
+    Build a check that the field is one of the rule values.
+    """
+    return frozenset([value] if isinstance(value, str) else value).__contains__
+
+
+def contains(value):
+    """
+    Build a case-insensitive check that the field contains the rule value.
+    """
+    value = value.lower()
+    return lambda actual: value in actual.lower()
+
+
+# Condition name mapped to the event field it reads and how it is compared
+CONDITIONS = {
+    "in_fanclub": (attrgetter("in_fanclub"), equals),
+    "username": (attrgetter("username"), one_of),
+    "is_anon": (attrgetter("is_anon"), equals),
+    "min_tokens": (attrgetter("tokens"), at_least),
+    "max_tokens": (attrgetter("tokens"), at_most),
+    "message_contains": (attrgetter("message"), contains),
+}
+
+
+def compile_conditions(conditions):
+    """
+    Compile rule conditions into a single predicate.
+
+    Args:
+        conditions (dict): Condition names mapped to their expected values.
+
+    Returns:
+        callable: Predicate taking an event, or None if there are no conditions.
+
+    Raises:
+        ValueError: If a condition is unknown.
+    """
+    predicates = []
+    for name, value in conditions.items():
+        if name not in CONDITIONS:
+            raise ValueError(f"Unknown condition: {name}")
+        getter, compare = CONDITIONS[name]
+        check = compare(value)
+        predicates.append(
+            lambda event, getter=getter, check=check: check(getter(event))
+        )
+
+    if not predicates:
+        return None
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda event: all(predicate(event) for predicate in predicates)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Compiled rule mapping matching events to an effect.
+
+    Attributes:
+        name (str): Name of the rule.
+        method (str): Event method the rule applies to.
+        effect (str): Name of the effect to play.
+        group (str): Group ID the effect is played on.
+        priority (int): Priority of the effect, higher values are played first.
+        cooldown (float): Time in seconds the rule does not fire again for the
+            same cooldown key, or 0 for no cooldown.
+        cooldown_by (str): Either "user", "method" or "both", the event fields
+            the cooldown is keyed by.
+        cooldown_group (str): Name shared by rules that count each other's
+            triggers, or None to cool down the rule on its own.
+        predicate (callable): Compiled conditions, or None to match every event.
+    """
+
+    name: str
+    method: str
+    effect: str
+    group: str = "0"
+    priority: int = 0
+    cooldown: float = 0
+    cooldown_by: str = "user"
+    cooldown_group: str = None
+    predicate: object = None
+
+    def matches(self, event):
+        """
+        Check whether an event matches the rule.
+
+        Args:
+            event (Event): Decoded event.
+
+        Returns:
+            bool: True if the event matches.
+        """
+        return self.predicate is None or self.predicate(event)
+
+    def cooldown_key(self, event):
+        """
+        Get the key an event is cooled down by.
+
+        Events without a username cannot be told apart, so they are not cooled
+        down by keys that include the user rather than all sharing one key.
+
+        Args:
+            event (Event): Decoded event.
+
+        Returns:
+            tuple: Rule or cooldown group, kind of key and the values of its
+                event fields, or None if the event is not cooled down.
+        """
+        fields = COOLDOWN_KEYS[self.cooldown_by]
+        if "username" in fields and event.username is None:
+            return None
+        return (
+            self.cooldown_group or self.name,
+            self.cooldown_by,
+            *(getattr(event, name) for name in fields),
+        )
+
+
+@dataclass
+class TierTable:
+    """
+    Run of consecutive rules whose only condition is min_tokens.
+
+    The tiers are searched by bisection, so dispatch stays flat however many
+    tiers there are, and the highest tier reached by an event is used.
+
+    Attributes:
+        thresholds (list): Sorted min_tokens thresholds of the tier rules.
+        tiers (list): Tier rules in the same order as the thresholds.
+    """
+
+    thresholds: list = field(default_factory=list)
+    tiers: list = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def add(self, threshold, rule):
+        """
+        Add a tier rule.
+
+        Args:
+            threshold (int): min_tokens threshold of the rule.
+            rule (Rule): Compiled rule.
+        """
+        position = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(position, threshold)
+        self.tiers.insert(position, rule)
+
+    def match(self, event):
+        """
+        Find the highest tier reached by an event.
+
+        Args:
+            event (Event): Decoded event.
+
+        Returns:
+            Rule: Matching tier rule, or None if no tier is reached.
+        """
+        position = bisect_right(self.thresholds, event.tokens)
+        return self.tiers[position - 1] if position else None
+
+
+@dataclass
+class MethodRules:
+    """
+    Rules for a single event method, in file order.
+
+    Attributes:
+        entries (list): Rules, and tier tables in place of each run of
+            consecutive tier rules.
+    """
+
+    entries: list = field(default_factory=list)
+
+    def __len__(self):
+        return sum(
+            len(entry) if isinstance(entry, TierTable) else 1 for entry in self.entries
+        )
+
+
+class DispatchRegistry:
+    """
+    Registry mapping event methods to compiled rules.
+
+    Attributes:
+        methods (dict): Rules for each event method.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.methods = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        for index, rule in enumerate(rules):
+            self.add(rule, index)
+
+    @classmethod
+    def from_file(cls, file_path=RULES_FILE_PATH):
+        """
+        Load rules from a YAML file, falling back to the default rules.
+
+        Args:
+            file_path (str): Path to the rules file.
+
+        Returns:
+            DispatchRegistry: Registry with the compiled rules.
+        """
+        registry = cls(load_rules(file_path))
+        registry.logger.info(f"Loaded {registry.rule_count} rules")
+        return registry
+
+    @property
+    def rule_count(self):
+        """
+        Number of compiled rules.
+
+        Returns:
+            int: Number of rules across all methods.
+        """
+        return sum(len(method_rules) for method_rules in self.methods.values())
+
+    def add(self, rule, index=0):
+        """
+        Compile a rule and add it to the registry.
+
+        Args:
+            rule (dict): Rule definition with method, effect, group, priority,
+                cooldown, cooldown_by, cooldown_group and when.
+            index (int): Position of the rule, used for its default name.
+
+        Raises:
+            ValueError: If the rule is invalid.
+        """
+        try:
+            method = rule["method"]
+            effect = rule["effect"]
+        except KeyError as e:
+            raise ValueError(f"Rule {index} is missing {e}") from e
+        if effect not in EFFECTS:
+            raise ValueError(f"Rule {index} uses unknown effect: {effect}")
+        cooldown_by = rule.get("cooldown_by", "user")
+        if cooldown_by not in COOLDOWN_KEYS:
+            raise ValueError(f"Rule {index} uses unknown cooldown_by: {cooldown_by}")
+
+        conditions = rule.get("when") or {}
+        compiled = Rule(
+            name=rule.get("name", f"{method}-{index}"),
+            method=method,
+            effect=effect,
+            group=str(rule.get("group", 0)),
+            priority=int(rule.get("priority", 0)),
+            cooldown=float(rule.get("cooldown", 0)),
+            cooldown_by=cooldown_by,
+            cooldown_group=rule.get("cooldown_group"),
+            predicate=compile_conditions(conditions),
+        )
+
+        entries = self.methods.setdefault(method, MethodRules()).entries
+        if list(conditions) == ["min_tokens"]:
+            if not entries or not isinstance(entries[-1], TierTable):
+                entries.append(TierTable())
+            entries[-1].add(conditions["min_tokens"], compiled)
+        else:
+            entries.append(compiled)
+
+    def match(self, event):
+        """
+        Find the rule for an event.
+
+        The first matching rule in file order wins. Consecutive tier rules are
+        checked together, and the highest tier reached by the event is used.
+
+        Args:
+            event (Event): Decoded event.
+
+        Returns:
+            Rule: Matching rule, or None if no rule matches.
+        """
+        method_rules = self.methods.get(event.method)
+        if method_rules is None:
+            return None
+
+        for entry in method_rules.entries:
+            if isinstance(entry, TierTable):
+                rule = entry.match(event)
+                if rule is not None:
+                    return rule
+            elif entry.matches(event):
+                return entry
+        return None
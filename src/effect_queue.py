@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from constants import (
+    EFFECT_AGING_RATE,
+    EFFECT_MAX_WAIT,
+    EFFECT_MERGE_WINDOW,
+    EFFECT_QUEUE_DROP_POLICY,
+    EFFECT_QUEUE_MAX_DEPTH,
+)
+from effects import EFFECTS
+from metrics import EFFECT_QUEUE_DEPTH, EFFECT_QUEUE_DISCARDED
+from tracing import TRACER
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+
+
+@dataclass(frozen=True)
+class MergeRule:
+    """
+    Rule for collapsing identical triggers into a single effect.
+
+    Attributes:
+        effect (str): Name of the effect the rule applies to.
+        window (float): Time in seconds during which identical triggers are merged.
+        count_effect (str): Effect played instead when enough triggers were merged.
+        count_threshold (int): Number of merged triggers needed for the count effect.
+    """
+
+    effect: str
+    window: float = EFFECT_MERGE_WINDOW
+    count_effect: str = None
+    count_threshold: int = 2
+
+
+DEFAULT_MERGE_RULES = (
+    MergeRule("flash_green", count_effect="flash_green_burst", count_threshold=3),
+)
+
+
+@dataclass
+class QueuedEffect:
+    """
+    Effect waiting in the queue.
+
+    Attributes:
+        effect (str): Name of the effect.
+        group_id (str): Group ID.
+        priority (int): Priority, higher values are played first.
+        count (int): Number of triggers merged into this entry.
+        queued_at (float): Monotonic time the first trigger was queued.
+        received_at (float): Monotonic time the first triggering event was
+            received, or None.
+        trace_id (str): ID of the trace of the first triggering event, or None.
+    """
+
+    effect: str
+    group_id: str
+    priority: int = 0
+    count: int = 1
+    queued_at: float = field(default_factory=time.monotonic)
+    received_at: float = None
+    trace_id: str = None
+
+
+class EffectQueue:
+    """
+    Bounded queue of effects between the event handler and the light controller.
+
+    Triggers for the same effect and group that arrive within a merge window are
+    collapsed into one queued entry.
+
+    Effects are played one at a time, highest priority first. A waiting effect
+    gains priority as it ages so low-priority effects are not starved, and is
+    dropped once it has waited too long to still be relevant. An effect with a
+    higher priority than the one playing preempts it: the running effect is
+    cancelled and restores the lights before the new one starts, so important
+    events wait at most for one restore.
+
+    When the queue is full, the lowest-priority entry is dropped. Between
+    entries of equal priority, either the oldest queued entry or the incoming
+    trigger is dropped.
+
+    Attributes:
+        effect_engine (EffectEngine): Engine used to play queued effects.
+        max_depth (int): Maximum number of queued effects.
+        drop_policy (str): Either "drop-oldest" or "drop-newest".
+        merge_rules (dict): Merge rule for each effect name.
+        aging_rate (float): Priority gained per second by a waiting effect.
+        max_wait (float): Time in seconds after which a waiting effect is dropped.
+        bridge (str): Key of the bridge the effects are played on, used to label
+            the queue metrics.
+        dropped (int): Number of triggers dropped because the queue was full.
+        merged (int): Number of triggers merged into an already queued effect.
+        expired (int): Number of effects dropped after waiting too long.
+        preempted (int): Number of running effects cancelled for a higher
+            priority effect.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        effect_engine,
+        max_depth=EFFECT_QUEUE_MAX_DEPTH,
+        drop_policy=EFFECT_QUEUE_DROP_POLICY,
+        merge_rules=DEFAULT_MERGE_RULES,
+        aging_rate=EFFECT_AGING_RATE,
+        max_wait=EFFECT_MAX_WAIT,
+        bridge="",
+    ):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Invalid drop policy: {drop_policy}")
+        self.effect_engine = effect_engine
+        self.max_depth = max_depth
+        self.drop_policy = drop_policy
+        self.merge_rules = {rule.effect: rule for rule in merge_rules}
+        self.aging_rate = aging_rate
+        self.max_wait = max_wait
+        self.bridge = bridge
+        self.dropped = 0
+        self.merged = 0
+        self.expired = 0
+        self.preempted = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self._playing = None
+        self._playing_task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, effect, group_id, received_at=None, trace_id=None, priority=0):
+        """
+        Queue an effect for a group.
+
+        Args:
+            effect (str): Name of the effect.
+            group_id (str): Group ID.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+            priority (int): Priority, higher values are played first and preempt
+                lower ones. Defaults to 0.
+
+        Returns:
+            bool: True if the trigger was queued or merged, False if it was dropped.
+        """
+        self._ensure_worker()
+
+        if self._merge(effect, group_id, priority):
+            self.merged += 1
+            # The trace of a merged trigger ends here, the first trigger's goes on
+            TRACER.end(trace_id)
+            self._preempt(priority)
+            return True
+
+        if len(self._pending) >= self.max_depth:
+            self.dropped += 1
+            EFFECT_QUEUE_DISCARDED.inc(self.bridge, "dropped")
+            # The first of the lowest-priority entries is the oldest
+            queued = min(self._pending, key=lambda queued: queued.priority)
+            if priority < queued.priority or (
+                priority == queued.priority and self.drop_policy == DROP_NEWEST
+            ):
+                self.logger.debug("Effect queue full, dropping new '%s'", effect)
+                TRACER.end(trace_id)
+                return False
+            self._pending.remove(queued)
+            self.logger.debug("Effect queue full, dropping queued '%s'", queued.effect)
+            TRACER.add(queued.trace_id, "effect_queue_dropped", queued.queued_at)
+            TRACER.end(queued.trace_id)
+
+        self._pending.append(
+            QueuedEffect(
+                effect,
+                group_id,
+                priority,
+                received_at=received_at,
+                trace_id=trace_id,
+            )
+        )
+        EFFECT_QUEUE_DEPTH.set(len(self._pending), self.bridge)
+        self._wakeup.set()
+        self._preempt(priority)
+        return True
+
+    async def close(self):
+        """
+        Stop the queue worker and discard queued effects.
+        """
+        self._pending.clear()
+        EFFECT_QUEUE_DEPTH.set(0, self.bridge)
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    def _merge(self, effect, group_id, priority=0):
+        """
+        Merge a trigger into a matching queued entry.
+
+        The merged entry keeps the higher of both priorities.
+
+        Args:
+            effect (str): Name of the effect.
+            group_id (str): Group ID.
+            priority (int): Priority of the trigger. Defaults to 0.
+
+        Returns:
+            bool: True if the trigger was merged, False otherwise.
+        """
+        rule = self.merge_rules.get(effect)
+        if not rule:
+            return False
+
+        now = time.monotonic()
+        for queued in reversed(self._pending):
+            if now - queued.queued_at > rule.window:
+                break
+            if queued.effect == effect and queued.group_id == group_id:
+                queued.count += 1
+                queued.priority = max(queued.priority, priority)
+                return True
+        return False
+
+    def _preempt(self, priority):
+        """
+        Cancel the running effect if it has a lower priority.
+
+        The cancelled effect restores the lights before the worker moves on.
+
+        Args:
+            priority (int): Priority of the newly queued effect.
+        """
+        playing = self._playing
+        if playing is None or priority <= playing.priority:
+            return
+        self.preempted += 1
+        EFFECT_QUEUE_DISCARDED.inc(self.bridge, "preempted")
+        self.logger.info(
+            "Preempting '%s' on group %s", playing.effect, playing.group_id
+        )
+        # Later triggers do not cancel the effect again
+        self._playing = None
+        self._playing_task.cancel()
+
+    def _next(self):
+        """
+        Take the queued entry to play next.
+
+        Entries that waited longer than the maximum wait are dropped. Of the
+        others, the entry with the highest priority after aging is taken, the
+        oldest first when tied.
+
+        Returns:
+            QueuedEffect: Entry to play, or None if nothing is left.
+        """
+        now = time.monotonic()
+        expired = [
+            queued for queued in self._pending if now - queued.queued_at > self.max_wait
+        ]
+        for queued in expired:
+            self._pending.remove(queued)
+            self.expired += 1
+            EFFECT_QUEUE_DISCARDED.inc(self.bridge, "expired")
+            self.logger.debug("Dropping '%s' after waiting too long", queued.effect)
+            TRACER.add(queued.trace_id, "effect_queue_expired", queued.queued_at)
+            TRACER.end(queued.trace_id)
+
+        if not self._pending:
+            return None
+        # max() keeps the first, oldest entry of equal priorities
+        queued = max(
+            self._pending,
+            key=lambda queued: queued.priority
+            + (now - queued.queued_at) * self.aging_rate,
+        )
+        self._pending.remove(queued)
+        return queued
+
+    def _resolve(self, queued):
+        """
+        Resolve a queued entry to the effect that should be played.
+
+        Args:
+            queued (QueuedEffect): Queued entry.
+
+        Returns:
+            Effect: Effect to play.
+        """
+        rule = self.merge_rules.get(queued.effect)
+        if rule and rule.count_effect and queued.count >= rule.count_threshold:
+            return EFFECTS[rule.count_effect]
+        return EFFECTS[queued.effect]
+
+    def _ensure_worker(self):
+        """
+        Start the worker task if it is not running.
+        """
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """
+        Play queued effects one after another.
+        """
+        while True:
+            queued = self._next()
+            EFFECT_QUEUE_DEPTH.set(len(self._pending), self.bridge)
+            if queued is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            TRACER.add(queued.trace_id, "effect_queue", queued.queued_at)
+            try:
+                effect = self._resolve(queued)
+            except KeyError:
+                self.logger.error(f"Unknown effect: {queued.effect}")
+                TRACER.end(queued.trace_id)
+                continue
+
+            if queued.count > 1:
+                self.logger.debug(
+                    "Playing '%s' for %d merged triggers", effect.name, queued.count
+                )
+            task = asyncio.create_task(
+                self.effect_engine.run(
+                    effect,
+                    queued.group_id,
+                    received_at=queued.received_at,
+                    trace_id=queued.trace_id,
+                )
+            )
+            self._playing, self._playing_task = queued, task
+            try:
+                # Unlike awaiting the task, waiting does not raise when it is
+                # preempted
+                await asyncio.wait((task,))
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                self._playing = self._playing_task = None
@@ -0,0 +1,506 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from metrics import EVENT_TO_LIGHT_SECONDS
+from tracing import TRACER
+
+
+@dataclass(frozen=True)
+class Keyframe:
+    """
+    Single step of a light effect.
+
+    Attributes:
+        state (dict): Group action sent to the bridge for this step.
+        hold (float): Time in seconds to hold the state before the next step.
+        transition (float): Time in seconds the bridge fades into the state.
+            Defaults to 0, which uses the bridge's default transition.
+    """
+
+    state: dict
+    hold: float = 0.0
+    transition: float = 0.0
+
+
+@dataclass(frozen=True)
+class Effect:
+    """
+    Light effect declared as a timed sequence of keyframes.
+
+    Attributes:
+        name (str): Name of the effect.
+        keyframes (tuple): Keyframes played in order.
+        restore (bool): Whether to restore the previous light state afterwards.
+        frames (callable): Generator function taking the frame rate and yielding
+            (x, y, brightness) colors, used when the effect is streamed. Defaults
+            to None, which streams the keyframes.
+    """
+
+    name: str
+    keyframes: tuple
+    restore: bool = False
+    frames: object = None
+
+    @property
+    def duration(self):
+        """
+        Total duration of the effect in seconds.
+
+        Returns:
+            float: Sum of the keyframe hold times.
+        """
+        return sum(keyframe.hold for keyframe in self.keyframes)
+
+
+GREEN = {"on": True, "bri": 200, "xy": [0.1, 0.8]}
+GOLD = {"on": True, "bri": 254, "xy": [0.52, 0.44]}
+RED = {"on": True, "bri": 254, "xy": [0.675, 0.322]}
+PURPLE = {"on": True, "bri": 200, "xy": [0.25, 0.1]}
+BLUE = {"on": True, "bri": 200, "xy": [0.15, 0.06]}
+PINK = {"on": True, "bri": 200, "xy": [0.45, 0.22]}
+NEUTRAL = {"on": True, "bri": 254, "xy": [0.413, 0.395]}
+DIM = {"on": True, "bri": 80, "xy": [0.413, 0.395]}
+OFF = {"on": False}
+
+# Bridge alerts: one breathe cycle, or breathe cycles until stopped
+SHORT_ALERT = "select"
+LONG_ALERT = "lselect"
+
+
+def flash(name, color, times=2, on_time=0.6, off_time=1):
+    """
+    Build an effect that flashes a color and then restores the lights.
+
+    Args:
+        name (str): Name of the effect.
+        color (dict): Group action for the flash color.
+        times (int): Number of flashes. Defaults to 2.
+        on_time (float): Time in seconds each flash is shown. Defaults to 0.6.
+        off_time (float): Time in seconds the lights are off in between.
+            Defaults to 1.
+
+    Returns:
+        Effect: Flash effect.
+    """
+    keyframes = []
+    for _ in range(times):
+        keyframes.append(Keyframe(color, on_time))
+        keyframes.append(Keyframe(OFF, off_time))
+    return Effect(
+        name=name,
+        keyframes=tuple(keyframes),
+        restore=True,
+        frames=pulse(color, times, on_time + off_time),
+    )
+
+
+def frame_color(state, previous=(0.0, 0.0, 0.0)):
+    """
+    Get the streamed color of a group action.
+
+    Args:
+        state (dict): Group action.
+        previous (tuple): Color shown before, whose attributes are kept where the
+            action does not set them. Defaults to black.
+
+    Returns:
+        tuple: Color as x, y and brightness between 0 and 1.
+    """
+    x, y, bri = previous
+    if "xy" in state:
+        x, y = state["xy"]
+    if "bri" in state:
+        bri = state["bri"] / 254
+    if state.get("on") is False:
+        bri = 0.0
+    return (x, y, bri)
+
+
+def pulse(color, times, period):
+    """
+    Build a frame generator that fades a color in and out.
+
+    Args:
+        color (dict): Group action for the color.
+        times (int): Number of pulses.
+        period (float): Time in seconds of each pulse.
+
+    Returns:
+        callable: Generator function taking the frame rate.
+    """
+    x, y, bri = frame_color(color)
+
+    def frames(rate):
+        per_pulse = period * rate
+        for frame in range(round(times * per_pulse)):
+            phase = (frame % per_pulse) / per_pulse
+            yield (x, y, bri * math.sin(math.pi * phase) ** 2)
+
+    return frames
+
+
+def keyframe_frames(effect, rate):
+    """
+    Render the keyframes of an effect as frames.
+
+    Each keyframe is shown for its hold time. Transitions fade from the previous
+    keyframe within the hold time, drawn frame by frame instead of by the bridge.
+
+    Args:
+        effect (Effect): Effect to render.
+        rate (float): Frames per second.
+
+    Yields:
+        tuple: Color as x, y and brightness between 0 and 1.
+    """
+    color = None
+    for keyframe in effect.keyframes:
+        target = frame_color(keyframe.state, color or (0.0, 0.0, 0.0))
+        origin = color or target
+        fade = keyframe.transition * rate
+        for frame in range(max(round(keyframe.hold * rate), 1)):
+            progress = min((frame + 1) / fade, 1) if fade else 1
+            yield tuple(a + (b - a) * progress for a, b in zip(origin, target))
+        color = target
+
+
+def effect_frames(effect, rate):
+    """
+    Get the frames streamed for an effect.
+
+    Args:
+        effect (Effect): Effect to stream.
+        rate (float): Frames per second.
+
+    Returns:
+        iterator: Colors as x, y and brightness between 0 and 1.
+    """
+    if effect.frames is not None:
+        return effect.frames(rate)
+    return keyframe_frames(effect, rate)
+
+
+FLASH_GREEN = Effect(
+    name="flash_green",
+    keyframes=(
+        Keyframe(GREEN, 0.6),
+        Keyframe(OFF, 1),
+        Keyframe(GREEN, 0.6),
+        Keyframe(OFF, 1),
+    ),
+    restore=True,
+    frames=pulse(GREEN, 2, 1.6),
+)
+
+FLASH_GREEN_BURST = Effect(
+    name="flash_green_burst",
+    keyframes=(
+        Keyframe(GREEN, 0.4),
+        Keyframe(OFF, 0.4),
+        Keyframe(GREEN, 0.4),
+        Keyframe(OFF, 0.4),
+        Keyframe(GREEN, 0.4),
+        Keyframe(OFF, 0.4),
+        Keyframe(GREEN, 1),
+    ),
+    restore=True,
+)
+
+EFFECTS = {
+    effect.name: effect
+    for effect in (
+        FLASH_GREEN,
+        FLASH_GREEN_BURST,
+        flash("flash_gold", GOLD),
+        flash("flash_red", RED, times=4, on_time=0.4, off_time=0.4),
+        flash("flash_purple", PURPLE),
+        flash("flash_blue", BLUE, times=1),
+        flash("flash_pink", PINK, times=1),
+        Effect("neutral", (Keyframe(NEUTRAL, transition=1),)),
+        Effect("dim", (Keyframe(DIM, transition=2),)),
+    )
+}
+
+
+def native_state(keyframe):
+    """
+    Get the group action of a keyframe with its transition in bridge units.
+
+    Args:
+        keyframe (Keyframe): Keyframe.
+
+    Returns:
+        dict: Group action.
+    """
+    if not keyframe.transition:
+        return keyframe.state
+    # The bridge counts transition time in multiples of 100 ms
+    return {**keyframe.state, "transitiontime": round(keyframe.transition * 10)}
+
+
+def compile_effect(effect):
+    """
+    Compile an effect to bridge-native primitives.
+
+    A flash, alternating one color with off, becomes a single command setting
+    the color with a bridge alert that breathes the lights for the duration of
+    the effect. Transitions become bridge transition times, so fades are
+    interpolated on the bridge instead of being drawn with many commands.
+
+    Args:
+        effect (Effect): Effect to compile.
+
+    Returns:
+        Effect: Effect with the same timing and fewer commands.
+    """
+    keyframes = effect.keyframes
+    colors, gaps = keyframes[0::2], keyframes[1::2]
+    is_flash = (
+        len(keyframes) >= 2
+        and colors[0].state.get("on")
+        and all(keyframe.state == colors[0].state for keyframe in colors)
+        and all(keyframe.state == OFF for keyframe in gaps)
+    )
+    if not is_flash:
+        return Effect(
+            effect.name,
+            tuple(Keyframe(native_state(k), k.hold) for k in keyframes),
+            effect.restore,
+        )
+
+    alert = SHORT_ALERT if len(colors) == 1 else LONG_ALERT
+    state = {**native_state(colors[0]), "alert": alert}
+    return Effect(effect.name, (Keyframe(state, effect.duration),), effect.restore)
+
+
+async def run_to_completion(coro):
+    """
+    Run a coroutine to the end even if the caller is cancelled meanwhile.
+
+    Args:
+        coro (coroutine): Coroutine to run.
+
+    Raises:
+        asyncio.CancelledError: After the coroutine finished, if the caller was
+            cancelled while waiting for it.
+    """
+    task = asyncio.ensure_future(coro)
+    cancelled = False
+    while not task.done():
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError
+    task.result()
+
+
+class EffectEngine:
+    """
+    Class to play light effects.
+
+    The effect queue runs each effect as a task, and a cancelled effect restores
+    the lights before it stops.
+
+    Effects that restore the lights are streamed as frames when the light
+    controller has an entertainment stream covering the group, and are sent as
+    REST commands otherwise.
+
+    Attributes:
+        light_controller (LightController): Light controller used to send commands.
+        native (bool): Whether to compile effects to bridge-native primitives.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, light_controller, native=True):
+        self.light_controller = light_controller
+        self.native = native
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._compiled = {}
+
+    def plan(self, effect):
+        """
+        Get the effect to play, compiled to bridge-native primitives if enabled.
+
+        Args:
+            effect (Effect): Effect as declared.
+
+        Returns:
+            Effect: Effect to play.
+        """
+        if not self.native:
+            return effect
+        compiled = self._compiled.get(effect.name)
+        if compiled is None:
+            compiled = self._compiled[effect.name] = compile_effect(effect)
+        return compiled
+
+    async def run(self, effect, group_id, received_at=None, trace_id=None):
+        """
+        Play an effect on a group.
+
+        Effects that restore state snapshot the group first and return every
+        light to its previous state when they finish or are cancelled. When the
+        entertainment stream covers the group, they are streamed instead and
+        the lights are released back to their state when they end.
+
+        Args:
+            effect (Effect): Effect to run.
+            group_id (str): Group ID.
+            received_at (float): Monotonic time the triggering event was received,
+                used to record the event to light latency. Defaults to None.
+            trace_id (str): ID of the trace of the triggering event, which ends
+                when the bridge accepts the first command or the first frame is
+                sent. Defaults to None.
+        """
+        self.logger.info("Running effect '%s' on group %s", effect.name, group_id)
+        # Effects that do not restore leave a new state, which is sent as
+        # commands so the stream keeps showing it from the state cache
+        stream = self.light_controller.entertainment if effect.restore else None
+        restore = effect.restore
+        stop_alert = False
+        snapshot = None
+        try:
+            if stream is not None and stream.active:
+                started = time.monotonic()
+                light_ids = await self.light_controller.group_light_ids(group_id)
+                if stream.covers(light_ids):
+                    restore = False
+                    await self._stream(
+                        effect, stream, light_ids, started, received_at, trace_id
+                    )
+                    return
+            if restore:
+                started = time.monotonic()
+                snapshot = await self.light_controller.snapshot_group(group_id)
+                TRACER.add(trace_id, "snapshot", started)
+            effect = self.plan(effect)
+            # A long alert keeps breathing until it is stopped
+            stop_alert = any(
+                keyframe.state.get("alert") == LONG_ALERT
+                for keyframe in effect.keyframes
+            )
+            await self._play(effect, group_id, received_at, trace_id)
+        except asyncio.CancelledError:
+            self.logger.debug(
+                "Effect '%s' on group %s cancelled", effect.name, group_id
+            )
+            raise
+        except Exception as e:
+            self.logger.error("Error running effect '%s': %s", effect.name, e)
+        finally:
+            # Ends the trace if the effect stopped before reaching the bridge
+            TRACER.end(trace_id)
+            # The lights are restored even if the effect is cancelled meanwhile
+            if restore:
+                await run_to_completion(self._restore(snapshot, group_id, stop_alert))
+            elif stop_alert:
+                await run_to_completion(self._stop_alert(group_id))
+
+    async def _play(self, effect, group_id, received_at=None, trace_id=None):
+        """
+        Send the keyframes of an effect as group commands.
+
+        Args:
+            effect (Effect): Effect to play.
+            group_id (str): Group ID.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+        """
+        for keyframe in effect.keyframes:
+            started = time.monotonic()
+            try:
+                await self.light_controller.set_group_action(
+                    group_id, **keyframe.state
+                )
+            finally:
+                # Also recorded when the bridge rejects the command
+                TRACER.add(trace_id, "bridge", started)
+                TRACER.end(trace_id)
+                trace_id = None
+            if received_at is not None:
+                EVENT_TO_LIGHT_SECONDS.observe(time.monotonic() - received_at)
+                received_at = None
+            if keyframe.hold:
+                await asyncio.sleep(keyframe.hold)
+
+    async def _stream(
+        self, effect, stream, light_ids, started, received_at=None, trace_id=None
+    ):
+        """
+        Stream the frames of an effect at the stream's frame rate.
+
+        The lights are released back to their state when the effect ends or is
+        cancelled, so a preempting effect can stream right away.
+
+        Args:
+            effect (Effect): Effect to stream.
+            stream (EntertainmentStream): Open entertainment stream.
+            light_ids (list): IDs of the lights to stream to.
+            started (float): Monotonic time the effect started.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+        """
+        interval = 1 / stream.rate
+        next_frame = time.monotonic()
+        try:
+            for color in effect_frames(effect, stream.rate):
+                stream.send(light_ids, color)
+                if trace_id is not None:
+                    TRACER.add(trace_id, "stream", started)
+                    TRACER.end(trace_id)
+                    trace_id = None
+                if received_at is not None:
+                    EVENT_TO_LIGHT_SECONDS.observe(time.monotonic() - received_at)
+                    received_at = None
+                # Paced by deadline so the rate does not drift with send times
+                next_frame += interval
+                await asyncio.sleep(next_frame - time.monotonic())
+        finally:
+            stream.release(light_ids)
+
+    async def _restore(self, snapshot, group_id, stop_alert=False):
+        """
+        Restore the lights of a group after an effect.
+
+        Falls back to the neutral color when no snapshot could be taken.
+
+        Args:
+            snapshot (dict): Restorable state for each light ID, or None.
+            group_id (str): Group ID.
+            stop_alert (bool): Whether to stop a running alert in the same command.
+        """
+        extra = {"alert": "none"} if stop_alert else {}
+        try:
+            if snapshot:
+                self.logger.info("Restoring previous state of group %s", group_id)
+                await self.light_controller.restore_snapshot(
+                    snapshot, group_id, **extra
+                )
+            else:
+                self.logger.info("Returning lights to neutral color")
+                await self.light_controller.set_group_action(
+                    group_id, **NEUTRAL, **extra
+                )
+        except Exception as e:
+            self.logger.error("Error restoring group %s: %s", group_id, e)
+
+    async def _stop_alert(self, group_id):
+        """
+        Stop a running alert on a group.
+
+        Args:
+            group_id (str): Group ID.
+        """
+        try:
+            await self.light_controller.set_group_action(group_id, alert="none")
+        except Exception as e:
+            self.logger.error("Error stopping alert on group %s: %s", group_id, e)
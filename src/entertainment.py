@@ -0,0 +1,481 @@
+import asyncio
+import logging
+import socket
+import struct
+import time
+from urllib.parse import urlsplit
+
+from constants import (
+    BRIDGE_TIMEOUT,
+    ENTERTAINMENT_FRAME_RATE,
+    ENTERTAINMENT_GROUP_NAME,
+    ENTERTAINMENT_IDLE_INTERVAL,
+    ENTERTAINMENT_MAX_LIGHTS,
+    ENTERTAINMENT_PORT,
+    ENTERTAINMENT_RETRY_INTERVAL,
+)
+from effects import frame_color
+from state_cache import LIGHTS
+
+# python-mbedtls is optional and only needed to stream to a real bridge
+try:
+    from mbedtls import tls
+except ImportError:
+    tls = None
+
+# HueStream v1 message: protocol name, version 1.0, sequence number, two
+# reserved bytes, color space and one reserved byte, followed by each light as
+# device type, light ID and three 16-bit color values
+PROTOCOL_NAME = b"HueStream"
+HEADER = struct.Struct(">9sBBBHBB")
+LIGHT = struct.Struct(">BHHHH")
+LIGHT_DEVICE = 0x00
+XY_BRIGHTNESS = 0x01
+
+# Cipher suite required by the bridge
+PSK_CIPHER = "TLS-PSK-WITH-AES-128-GCM-SHA256"
+
+
+def scale(value):
+    """
+    Convert a color value between 0 and 1 to a 16-bit integer.
+    """
+    return min(max(round(value * 0xFFFF), 0), 0xFFFF)
+
+
+def encode_frame(sequence, colors):
+    """
+    Encode a HueStream message setting the color of each light.
+
+    Args:
+        sequence (int): Sequence number of the message.
+        colors (dict): Color as x, y and brightness between 0 and 1 for each
+            light ID.
+
+    Returns:
+        bytes: Encoded message.
+    """
+    header = HEADER.pack(PROTOCOL_NAME, 1, 0, sequence % 256, 0, XY_BRIGHTNESS, 0)
+    return header + b"".join(
+        LIGHT.pack(LIGHT_DEVICE, int(light_id), scale(x), scale(y), scale(bri))
+        for light_id, (x, y, bri) in colors.items()
+    )
+
+
+def decode_frame(data):
+    """
+    Decode a HueStream message.
+
+    Args:
+        data (bytes): Encoded message.
+
+    Returns:
+        tuple: Sequence number, and color as x, y and brightness between 0 and 1
+            for each light ID.
+
+    Raises:
+        ValueError: If the message is not a HueStream message.
+    """
+    if len(data) < HEADER.size or not data.startswith(PROTOCOL_NAME):
+        raise ValueError("Not a HueStream message")
+    _, _, _, sequence, _, _, _ = HEADER.unpack_from(data)
+    colors = {}
+    for offset in range(HEADER.size, len(data) - LIGHT.size + 1, LIGHT.size):
+        _, light_id, x, y, bri = LIGHT.unpack_from(data, offset)
+        colors[str(light_id)] = (x / 0xFFFF, y / 0xFFFF, bri / 0xFFFF)
+    return sequence, colors
+
+
+class UdpTransport:
+    """
+    Unencrypted datagram transport, accepted only by local stand-in receivers.
+    """
+
+    def __init__(self):
+        self._transport = None
+
+    async def open(self, host, port, identity=None, psk=None):
+        """
+        Open the transport.
+
+        Args:
+            host (str): Host of the receiver.
+            port (int): UDP port of the receiver.
+            identity (str): Unused.
+            psk (bytes): Unused.
+        """
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(host, port)
+        )
+
+    def send(self, data):
+        """
+        Send a datagram.
+
+        Args:
+            data (bytes): Datagram to send.
+        """
+        self._transport.sendto(data)
+
+    def close(self):
+        """
+        Close the transport.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+class DtlsTransport:
+    """
+    DTLS 1.2 transport with a pre-shared key, as required by the bridge.
+
+    The handshake runs in a thread. Sending a datagram does not block, so frames
+    are sent from the event loop.
+    """
+
+    def __init__(self):
+        self._socket = None
+
+    async def open(self, host, port, identity, psk):
+        """
+        Open the transport and complete the DTLS handshake.
+
+        Args:
+            host (str): Host of the bridge.
+            port (int): UDP port of the bridge.
+            identity (str): PSK identity, the bridge username.
+            psk (bytes): Pre-shared key, the client key created when pairing.
+        """
+        config = tls.DTLSConfiguration(
+            pre_shared_key=(identity, psk),
+            ciphers=(PSK_CIPHER,),
+            lowest_supported_version=tls.DTLSVersion.DTLSv1_2,
+            highest_supported_version=tls.DTLSVersion.DTLSv1_2,
+            validate_certificates=False,
+        )
+        raw = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        raw.settimeout(BRIDGE_TIMEOUT)
+        sock = tls.ClientContext(config).wrap_socket(raw, server_hostname=None)
+        try:
+            await asyncio.to_thread(self._handshake, sock, (host, port))
+        except BaseException:
+            sock.close()
+            raise
+        self._socket = sock
+
+    @staticmethod
+    def _handshake(sock, address):
+        """
+        Connect a DTLS socket and complete the handshake.
+
+        Args:
+            sock (mbedtls.tls.TLSWrappedSocket): DTLS socket.
+            address (tuple): Host and port of the bridge.
+        """
+        sock.connect(address)
+        sock.do_handshake()
+
+    def send(self, data):
+        """
+        Send a datagram.
+
+        Args:
+            data (bytes): Datagram to send.
+        """
+        self._socket.send(data)
+
+    def close(self):
+        """
+        Close the transport.
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+TRANSPORTS = {"dtls": DtlsTransport, "udp": UdpTransport}
+
+
+class EntertainmentStream:
+    """
+    Class to stream effect frames to lights with the Hue Entertainment API.
+
+    Every REST command is a round trip counted against the bridge rate limits,
+    so effects sent as commands are drawn in coarse steps. A stream instead
+    activates an entertainment group on the bridge and sends a color for each
+    light as a datagram at a fixed frame rate, without round trips or rate
+    limits. The bridge only accepts DTLS, using the client key created when
+    pairing.
+
+    The entertainment group is found by name, or created with the bridge's
+    streaming-capable lights. One session is kept open from open() until
+    close(), so an effect, or an effect preempting another, starts with its
+    first frame. Between effects, idle frames keep the session alive and show
+    each light's last known state from the state cache, so commands sent to
+    the lights while streaming still show. The handshake is only repeated when
+    sending fails. While the session is down, effects are sent as REST
+    commands and the session is opened again after a while.
+
+    Attributes:
+        bridge (HueBridge): Hue bridge instance.
+        state_cache (StateCache): Cache holding the state lights rest in.
+        transport (str): Either "dtls" or "udp". UDP is only accepted by local
+            stand-in receivers.
+        rate (float): Frames per second.
+        port (int): UDP port of the stream.
+        idle_interval (float): Time in seconds between idle frames.
+        group_id (str): ID of the entertainment group, once known.
+        lights (list): IDs of the lights in the entertainment group.
+        frames_sent (int): Number of frames sent.
+        handshakes (int): Number of times the transport was opened.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        bridge,
+        state_cache,
+        transport="dtls",
+        rate=ENTERTAINMENT_FRAME_RATE,
+        port=ENTERTAINMENT_PORT,
+        idle_interval=ENTERTAINMENT_IDLE_INTERVAL,
+    ):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Invalid transport: {transport}")
+        self.bridge = bridge
+        self.state_cache = state_cache
+        self.transport = transport
+        self.rate = rate
+        self.port = port
+        self.idle_interval = idle_interval
+        self.group_id = None
+        self.lights = []
+        self.frames_sent = 0
+        self.handshakes = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._transport = None
+        self._active = False
+        self._sequence = 0
+        self._sent_at = 0.0
+        self._retry_at = 0.0
+        # Colors of the lights an effect is streamed to
+        self._overrides = {}
+        self._session = None
+        if transport == "dtls" and tls is None:
+            self.logger.warning("Install python-mbedtls to stream effects")
+        elif transport == "dtls" and not bridge.clientkey:
+            self.logger.warning(f"Pair bridge {bridge.key} again to stream effects")
+
+    @property
+    def available(self):
+        """
+        Whether a session can be opened.
+        """
+        if self.bridge.client is None:
+            return False
+        if self.transport == "dtls":
+            return tls is not None and bool(self.bridge.clientkey)
+        return True
+
+    @property
+    def active(self):
+        """
+        Whether the session is open and frames are sent.
+        """
+        return self._transport is not None
+
+    @property
+    def host(self):
+        """
+        Host of the bridge, without the port of its REST API.
+        """
+        return urlsplit(f"//{self.bridge.ip}").hostname
+
+    def covers(self, light_ids):
+        """
+        Check whether an effect on lights can be streamed.
+
+        Args:
+            light_ids (list): IDs of the lights.
+
+        Returns:
+            bool: True if the session is open and streams to every light.
+        """
+        return self.active and bool(light_ids) and set(light_ids) <= set(self.lights)
+
+    async def open(self):
+        """
+        Open the session and keep it alive in the background until closed.
+
+        Returns:
+            bool: True if the session was opened, False if effects are sent as
+                REST commands until a later attempt succeeds.
+        """
+        if self._session is not None or not self.available:
+            return self.active
+        opened = await self._connect()
+        self._session = asyncio.create_task(self._keep_alive(), name="entertainment")
+        return opened
+
+    def send(self, light_ids, color):
+        """
+        Show a color on lights until they are released.
+
+        Args:
+            light_ids (list): IDs of the lights.
+            color (tuple): Color as x, y and brightness between 0 and 1.
+        """
+        for light_id in light_ids:
+            self._overrides[light_id] = color
+        self._send_frame()
+
+    def release(self, light_ids):
+        """
+        Return lights to their last known state.
+
+        Args:
+            light_ids (list): IDs of the lights.
+        """
+        for light_id in light_ids:
+            self._overrides.pop(light_id, None)
+        self._send_frame()
+
+    async def close(self):
+        """
+        Close the session and hand the lights back to REST commands.
+        """
+        if self._session is not None:
+            self._session.cancel()
+            await asyncio.gather(self._session, return_exceptions=True)
+            self._session = None
+        # Leave the lights in their last known state
+        self._overrides.clear()
+        self._send_frame()
+        await self._disconnect()
+
+    def _send_frame(self):
+        """
+        Send the current color of every light in the entertainment group.
+
+        A failed send closes the transport, which is opened again by the keep
+        alive task.
+        """
+        if self._transport is None:
+            return
+        colors = {}
+        for light_id in self.lights:
+            if light_id in self._overrides:
+                colors[light_id] = self._overrides[light_id]
+                continue
+            # A light left out of a frame keeps its color
+            state = self.state_cache.last_state(LIGHTS, light_id)
+            if state:
+                colors[light_id] = frame_color(state)
+        try:
+            self._transport.send(encode_frame(self._sequence, colors))
+        except Exception as e:
+            self.logger.warning(f"Error sending frame, reconnecting: {e}")
+            self._transport.close()
+            self._transport = None
+            return
+        self._sequence = (self._sequence + 1) % 256
+        self._sent_at = time.monotonic()
+        self.frames_sent += 1
+
+    async def _keep_alive(self):
+        """
+        Send idle frames between effects and reopen the session when it fails.
+        """
+        while True:
+            if self._transport is None:
+                delay = self._retry_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                if not await self._connect():
+                    continue
+            idle = time.monotonic() - self._sent_at
+            if idle >= self.idle_interval:
+                self._send_frame()
+                idle = 0.0
+            await asyncio.sleep(self.idle_interval - idle)
+
+    async def _connect(self):
+        """
+        Activate streaming on the bridge and complete the handshake.
+
+        Returns:
+            bool: True if frames can be sent.
+        """
+        try:
+            if self.group_id is None:
+                await self._find_group()
+            if not self._active:
+                await self.bridge.client.groups(self.group_id, stream={"active": True})
+                self._active = True
+            transport = TRANSPORTS[self.transport]()
+            psk = bytes.fromhex(self.bridge.clientkey or "")
+            await transport.open(self.host, self.port, self.bridge.username, psk)
+        except asyncio.CancelledError:
+            await self._disconnect()
+            raise
+        except Exception as e:
+            self.logger.warning(f"Streaming failed, using REST commands: {e}")
+            self._retry_at = time.monotonic() + ENTERTAINMENT_RETRY_INTERVAL
+            await self._disconnect()
+            return False
+        self._transport = transport
+        self.handshakes += 1
+        self.logger.info(f"Streaming to entertainment group {self.group_id}")
+        return True
+
+    async def _disconnect(self):
+        """
+        Close the transport and deactivate streaming on the bridge.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._active:
+            self._active = False
+            try:
+                await self.bridge.client.groups(self.group_id, stream={"active": False})
+            except Exception as e:
+                self.logger.warning(f"Error stopping the stream: {e}")
+
+    async def _find_group(self):
+        """
+        Find the entertainment group, creating it if it does not exist.
+        """
+        groups = await self.bridge.client.groups()
+        for group_id, group in groups.items():
+            if (
+                group.get("type") == "Entertainment"
+                and group.get("name") == ENTERTAINMENT_GROUP_NAME
+            ):
+                self.group_id, self.lights = str(group_id), list(group["lights"])
+                return
+
+        lights = await self.bridge.client.lights()
+        capable = [
+            light_id
+            for light_id, light in lights.items()
+            if light.get("capabilities", {}).get("streaming", {}).get("renderer")
+        ][:ENTERTAINMENT_MAX_LIGHTS]
+        if not capable:
+            raise ValueError("No lights can be streamed to")
+        result = await self.bridge.client.create(
+            "groups",
+            **{
+                "name": ENTERTAINMENT_GROUP_NAME,
+                "type": "Entertainment",
+                "class": "Other",
+                "lights": capable,
+            },
+        )
+        self.group_id, self.lights = str(result[0]["success"]["id"]), capable
+        self.logger.info(
+            f"Created entertainment group {self.group_id} with {len(capable)} lights"
+        )
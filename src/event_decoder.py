@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+from dataclasses import dataclass
+
+# orjson is optional and only used when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("EventDecoder")
+
+
+@dataclass(slots=True)
+class Event:
+    """
+    Compact event holding only the fields used by the handlers.
+
+    Attributes:
+        id (str): Event ID.
+        method (str): Event method, e.g. "userEnter" or "tip".
+        username (str): Username of the user that caused the event.
+        in_fanclub (bool): Whether the user is in the fan club.
+        tokens (int): Number of tipped tokens.
+        is_anon (bool): Whether the tip was anonymous.
+        message (str): Message text.
+        received_at (float): Monotonic time the event was received.
+    """
+
+    id: str
+    method: str
+    username: str = None
+    in_fanclub: bool = False
+    tokens: int = 0
+    is_anon: bool = False
+    message: str = ""
+    received_at: float = 0.0
+
+
+def loads(body):
+    """
+    Parse JSON, using orjson when it is installed.
+
+    Args:
+        body (bytes): JSON document.
+
+    Returns:
+        object: Parsed document.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def decode_event(raw):
+    """
+    Convert a raw event to a compact event, dropping unused fields.
+
+    Args:
+        raw (dict): Event as returned by the Events API.
+
+    Returns:
+        Event: Compact event.
+    """
+    payload = raw.get("object") or {}
+    user = payload.get("user") or {}
+    tip = payload.get("tip") or {}
+    message = payload.get("message") or {}
+    # Positional arguments keep construction cheap on large batches
+    return Event(
+        raw.get("id"),
+        raw["method"],
+        user.get("username"),
+        user.get("inFanclub", False),
+        tip.get("tokens", 0),
+        tip.get("isAnon", False),
+        message.get("message", "") if isinstance(message, dict) else "",
+    )
+
+
+def decode_batch(body, received_at=None):
+    """
+    Decode an Events API response into the next URL and compact events.
+
+    Events without a method are skipped.
+
+    Args:
+        body (bytes): Response body.
+        received_at (float): Monotonic time the response was received.
+            Defaults to now.
+
+    Returns:
+        tuple: Next URL and list of events.
+    """
+    if received_at is None:
+        received_at = time.monotonic()
+    data = loads(body)
+    events = []
+    for raw in data["events"]:
+        try:
+            event = decode_event(raw)
+            event.received_at = received_at
+            events.append(event)
+        except KeyError as e:
+            logger.error(f"Key error in event data: {e}")
+    return data["nextUrl"], events
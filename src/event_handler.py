@@ -1,4 +1,10 @@
 import logging
+import time
+
+from cooldown import CooldownIndex
+from dispatch import DispatchRegistry
+from metrics import DISPATCH_SECONDS, EVENTS_SUPPRESSED
+from tracing import TRACER
 
 
 class EventHandler:
@@ -6,10 +12,14 @@ class EventHandler:
     Class to process events.
 
     Attributes:
+        registry (DispatchRegistry): Rules mapping events to effects.
+        cooldowns (CooldownIndex): Recent triggers of rules with a cooldown.
         logger (logging.Logger): Logger instance.
     """
 
-    def __init__(self):
+    def __init__(self, registry=None, cooldowns=None):
+        self.registry = registry or DispatchRegistry()
+        self.cooldowns = CooldownIndex() if cooldowns is None else cooldowns
         self.logger = logging.getLogger(self.__class__.__name__)
 
     async def process_events(self, events_gen, light_controller):
@@ -22,38 +32,39 @@ class EventHandler:
         """
         async for events in events_gen:
             for event in events:
-                try:
-                    event_method = event["method"]
-                    self.logger.debug(f"Received event: {event_method}")
-                    if event_method == "userEnter":
-                        await self.process_user_enter(
-                            event, light_controller
-                        )  # Await the async method
-
-                except KeyError as e:
-                    self.logger.error(f"Key error in event data: {e}")
-
-    async def process_user_enter(self, event_dict, light_controller):
+                await self.process_event(event, light_controller)
+
+    async def process_event(self, event, light_controller):
         """
-        Process user enter event.
+        Process a single event.
 
         Args:
-            event_dict (dict): Event data.
+            event (Event): Decoded event.
             light_controller (LightController): Light controller instance.
         """
-        try:
-            self.logger.info("User entered the room.")
-            user_data = event_dict.get("object", {}).get("user", {})
-            username = user_data.get("username", "Unknown")
-            in_fanclub = user_data.get("inFanclub", False)
-
-            self.logger.debug(f"User entered: {username}, In Fan Club: {in_fanclub}")
-
-            if in_fanclub:
-                light_controller.flash_group_lights(0)
-
-            else:
-                self.logger.debug("User is not in the fan club. Ignoring.")
-
-        except Exception as e:
-            self.logger.error(f"Error processing user enter event: {e}")
+        started = time.monotonic()
+        self.logger.debug("Received event: %s", event.method)
+        rule = self.registry.match(event)
+        key = rule.cooldown_key(event) if rule and rule.cooldown else None
+        if key is not None:
+            if self.cooldowns.check(key, rule.cooldown, started):
+                self.logger.debug(
+                    "Event %s suppressed by the cooldown of rule '%s'",
+                    event.method,
+                    rule.name,
+                )
+                EVENTS_SUPPRESSED.inc(event.method)
+                rule = None
+        TRACER.add(event.id, "dispatch", started)
+        if rule:
+            self.logger.info("Event %s matched rule '%s'", event.method, rule.name)
+            light_controller.play_effect(
+                rule.effect,
+                rule.group,
+                received_at=event.received_at,
+                trace_id=event.id,
+                priority=rule.priority,
+            )
+        else:
+            TRACER.end(event.id)
+        DISPATCH_SECONDS.observe(time.monotonic() - started, event.method)
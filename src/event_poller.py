@@ -1,10 +1,30 @@
 import asyncio
 import logging
+import time
+from collections import deque
 
 import aiohttp
-import backoff
 
-from constants import INITIAL_RETRY_DELAY, MAX_RETRY_DELAY, RETRY_FACTOR
+from event_decoder import decode_batch
+from metrics import POLL_BATCH_SIZE, POLL_SECONDS
+from poll_connection import PollConnection
+from tracing import TRACER
+
+
+def retry_after(headers):
+    """
+    Read the delay requested by a Retry-After header.
+
+    Args:
+        headers (Mapping): Response headers.
+
+    Returns:
+        float: Delay in seconds, or None if there is no valid header.
+    """
+    try:
+        return float(headers.get("Retry-After", ""))
+    except ValueError:
+        return None
 
 
 class EventPoller:
@@ -13,67 +33,127 @@ class EventPoller:
 
     Attributes:
         base_url (str): Base URL for the Chaturbate Events API.
-        timeout (int): Timeout for HTTP requests in seconds.
-        retry_delay (int): Delay between retries in seconds.
+        timeout (int): Time in seconds the Events API holds a long-poll open.
+        checkpoint (EventCheckpoint): Durable cursor and dedupe index, or None.
+        connection (PollConnection): Long-poll connection with retry handling.
         logger (logging.Logger): Logger instance.
     """
 
-    def __init__(self, base_url, timeout):
+    def __init__(self, base_url, timeout, checkpoint=None, session=None):
         self.base_url = base_url
         self.timeout = timeout
-        self.retry_delay = INITIAL_RETRY_DELAY
+        self.checkpoint = checkpoint
+        self.connection = PollConnection(session, server_timeout=timeout)
         self.logger = logging.getLogger(self.__class__.__name__)
+        # Cursor and event IDs of each yielded batch not committed yet
+        self._uncommitted = deque()
 
-    @backoff.on_exception(backoff.expo, aiohttp.ClientError, max_tries=5)
     async def poll_events(self):
         """
         Poll events from the Chaturbate Events API.
 
-        Args:
-            base_url (str): Base URL for the Chaturbate Events API.
-            timeout (int): Timeout for HTTP requests in seconds.
+        With a checkpoint, polling resumes from the last committed cursor, events
+        that were already handled are skipped, and the consumer commits each
+        batch with commit() once its events are handled. Failed polls are
+        retried until the generator is closed.
 
         Yields:
-            list: List of events.
+            list: List of decoded events.
         """
-        async with aiohttp.ClientSession() as session:
-            url = self.base_url
+        connection = self.connection
+        async with connection.open() as session:
+            url = self.resume_url()
+            resumed = url != self.base_url
             # self.logger.debug(f"Initial URL: {url}") # Uncomment to see initial URL
             while True:
                 try:
-                    async with session.get(
-                        url, timeout=aiohttp.ClientTimeout(total=self.timeout)
-                    ) as response:
+                    started = time.monotonic()
+                    async with connection.get(session, url) as response:
                         if response.status == 200:
-                            data = await response.json()
-                            url = data["nextUrl"]
+                            responded_at = time.monotonic()
+                            body = await response.read()
+                            received_at = time.monotonic()
+                            POLL_SECONDS.observe(received_at - started)
+                            url, events = decode_batch(body, received_at)
+                            POLL_BATCH_SIZE.observe(len(events))
+                            spans = (
+                                ("poll", started, responded_at),
+                                ("read", responded_at, received_at),
+                                ("decode", received_at, time.monotonic()),
+                            )
+                            resumed = False
                             # self.logger.debug(f"Next URL: {url}") # Commented out to reduce log spam
-                            self.retry_delay = INITIAL_RETRY_DELAY
-                            yield data["events"]
-                        # If response status is any 5xx error
-                        elif response.status >= 500:
+                            connection.succeeded()
+                            events = self.filter_duplicates(events)
+                            TRACER.begin_batch(events, received_at, spans)
+                            if self.checkpoint:
+                                self._uncommitted.append(
+                                    (url, [event.id for event in events])
+                                )
+                            yield events
+                        # If response status is any 5xx error or rate limiting
+                        elif response.status >= 500 or response.status == 429:
                             self.logger.debug(f"Server error: Status {response.status}")
-                            await self.handle_error(server_error=True)
+                            await connection.failed(
+                                "server", retry_after(response.headers)
+                            )
+                        elif resumed:
+                            # The stored cursor is no longer accepted
+                            self.logger.error(
+                                f"Checkpoint rejected: Status {response.status}"
+                            )
+                            url = self.base_url
+                            resumed = False
                         else:
                             self.logger.error(
                                 f"Error fetching events: Status {response.status}"
                             )
-                            await self.handle_error()
+                            await connection.failed("client")
+
+                # Checked before ClientError, aiohttp's socket timeouts are both
+                except asyncio.TimeoutError as error:
+                    self.logger.error(f"Poll timed out: {error!r}")
+                    await connection.failed("timeout")
 
                 except aiohttp.ClientError as error:
                     self.logger.error(f"Client error: {error}")
-                    await self.handle_error()
+                    await connection.failed("client")
+
+    def commit(self):
+        """
+        Commit the oldest yielded batch that is not committed yet.
+
+        Batches must be committed in the order they were yielded, once every
+        event of the batch has been handled.
+        """
+        if self.checkpoint and self._uncommitted:
+            self.checkpoint.commit(*self._uncommitted.popleft())
 
-    async def handle_error(self, server_error=False):
+    def resume_url(self):
         """
-        Handle errors.
+        Get the URL to start polling from.
+
+        Returns:
+            str: Last committed cursor, or the base URL if there is none.
+        """
+        if self.checkpoint:
+            return self.checkpoint.next_url or self.checkpoint.load() or self.base_url
+        return self.base_url
+
+    def filter_duplicates(self, events):
+        """
+        Remove events that were already handled.
 
         Args:
-            server_error (bool): If the error is a server error.
+            events (list): List of events.
+
+        Returns:
+            list: Events not seen before.
         """
-        if server_error:
-            self.retry_delay = INITIAL_RETRY_DELAY
-        else:
-            self.retry_delay = min(self.retry_delay * RETRY_FACTOR, MAX_RETRY_DELAY)
-        self.logger.debug(f"Waiting {self.retry_delay} seconds before retrying...")
-        await asyncio.sleep(self.retry_delay)
+        if not self.checkpoint:
+            return events
+        is_duplicate = self.checkpoint.is_duplicate
+        fresh = [event for event in events if not is_duplicate(event.id)]
+        if len(fresh) < len(events):
+            self.logger.debug("Skipped %d duplicate events", len(events) - len(fresh))
+        return fresh
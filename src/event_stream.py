@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+from constants import INITIAL_RETRY_DELAY, MAX_RETRY_DELAY, RETRY_FACTOR
+from state_cache import GROUPS, LIGHTS
+
+# v2 resource types mirrored into the v1 state cache
+RESOURCE_KINDS = {"light": LIGHTS, "grouped_light": GROUPS}
+
+
+def convert_resource_state(resource):
+    """
+    Convert the state of a v2 resource update to v1 state attributes.
+
+    Args:
+        resource (dict): Resource from a v2 event.
+
+    Returns:
+        dict: v1 state attributes present in the update.
+    """
+    state = {}
+    if "on" in resource:
+        state["on"] = resource["on"]["on"]
+    if "dimming" in resource:
+        brightness = resource["dimming"]["brightness"]
+        state["bri"] = max(1, min(254, round(brightness * 2.54)))
+    if "color" in resource:
+        xy = resource["color"]["xy"]
+        state["xy"] = [xy["x"], xy["y"]]
+    if resource.get("color_temperature", {}).get("mirek_valid"):
+        state["ct"] = resource["color_temperature"]["mirek"]
+    return state
+
+
+class BridgeEventStream:
+    """
+    Class to keep the state cache current from the Hue bridge v2 event stream.
+
+    The bridge pushes server-sent events for every state change, so while the
+    stream is connected the cache is live and reads never reach the bridge. A
+    reconnect sends the ID of the last received event, so a bridge that keeps
+    recent events can resume the stream where it broke off.
+
+    Attributes:
+        client (BridgeClient): Client whose session and credentials are used.
+        state_cache (StateCache): Cache to keep current.
+        scheme (str): Scheme of the event stream, "https" on a real bridge.
+        initial_retry_delay (float): Delay before the first reconnect in seconds.
+        retry_delay (float): Delay before the next reconnect in seconds.
+        last_event_id (str): ID of the last received event, or None.
+        connections (int): Number of times the stream connected.
+        events (int): Number of state updates applied.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self, client, state_cache, scheme="https", retry_delay=INITIAL_RETRY_DELAY
+    ):
+        self.client = client
+        self.state_cache = state_cache
+        self.scheme = scheme
+        self.initial_retry_delay = retry_delay
+        self.retry_delay = retry_delay
+        self.last_event_id = None
+        self.connections = 0
+        self.events = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def url(self):
+        """
+        URL of the event stream, following the client when the bridge IP changes.
+        """
+        return f"{self.scheme}://{self.client.ip}/eventstream/clip/v2"
+
+    async def run(self):
+        """
+        Subscribe to the event stream, reconnecting until cancelled.
+        """
+        try:
+            while True:
+                try:
+                    await self.subscribe()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    self.logger.error(f"Event stream error: {error}")
+                except ValueError as error:
+                    self.logger.error(f"Invalid event stream data: {error}")
+
+                self.state_cache.live = False
+                self.logger.debug(f"Reconnecting in {self.retry_delay} seconds...")
+                await asyncio.sleep(self.retry_delay)
+                self.retry_delay = min(self.retry_delay * RETRY_FACTOR, MAX_RETRY_DELAY)
+        finally:
+            self.state_cache.live = False
+
+    async def subscribe(self):
+        """
+        Connect to the event stream and apply events until it closes.
+        """
+        session = self.client.get_session()
+        headers = {"Accept": "text/event-stream"}
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = self.last_event_id
+        async with session.get(
+            self.url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5),
+            ssl=False,
+        ) as response:
+            if response.status != 200:
+                self.logger.error(f"Event stream returned status {response.status}")
+                return
+
+            await self.load_state()
+            self.state_cache.live = True
+            self.retry_delay = self.initial_retry_delay
+            self.connections += 1
+            self.logger.info("Connected to the bridge event stream.")
+
+            data = []
+            event_id = None
+            async for line in response.content:
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif line.startswith("id:"):
+                    event_id = line[3:].strip()
+                elif not line and data:
+                    self.apply_events(json.loads("\n".join(data)))
+                    # Only an event received in full is resumed after
+                    if event_id is not None:
+                        self.last_event_id = event_id
+                    data = []
+                    event_id = None
+
+        self.logger.info("Bridge event stream closed.")
+
+    async def load_state(self):
+        """
+        Load the full light and group state the stream will keep current.
+        """
+        self.state_cache.put_all(LIGHTS, await self.client.lights())
+        self.state_cache.put_all(GROUPS, await self.client.groups())
+
+    def apply_events(self, events):
+        """
+        Apply a batch of v2 events to the state cache.
+
+        Args:
+            events (list): Events decoded from one server-sent event.
+        """
+        for event in events:
+            if event.get("type") != "update":
+                continue
+            for resource in event.get("data", []):
+                kind = RESOURCE_KINDS.get(resource.get("type"))
+                id_v1 = resource.get("id_v1")
+                if not kind or not id_v1:
+                    continue
+
+                state = convert_resource_state(resource)
+                if state:
+                    # Member lights receive their own events
+                    resource_id = id_v1.rsplit("/", 1)[-1]
+                    self.state_cache.update(kind, resource_id, state, propagate=False)
+                    self.events += 1
@@ -0,0 +1,23 @@
+import aiohttp
+
+from constants import HTTP_KEEPALIVE_TIMEOUT, HTTP_POOL_LIMIT
+
+
+def create_session(
+    limit=HTTP_POOL_LIMIT, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT, **kwargs
+):
+    """
+    Create an aiohttp session backed by a keep-alive connection pool.
+
+    Args:
+        limit (int): Maximum number of pooled connections.
+        keepalive_timeout (float): Time in seconds idle connections are kept open.
+        **kwargs: Extra arguments passed to aiohttp.ClientSession.
+
+    Returns:
+        aiohttp.ClientSession: New client session.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit, keepalive_timeout=keepalive_timeout, ttl_dns_cache=300
+    )
+    return aiohttp.ClientSession(connector=connector, **kwargs)
@@ -1,12 +1,77 @@
+import asyncio
 import json
 import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from os import path
 
-import requests
-import zeroconf
-from qhue import Bridge, QhueException, create_new_username
+import aiohttp
 
-from constants import CREDENTIALS_FILE_PATH
+from bridge_client import BridgeClient, BridgeError
+from command_scheduler import CommandScheduler
+from constants import (
+    BRIDGE_PROBE_TIMEOUT,
+    CREDENTIALS_FILE_PATH,
+    DISCOVERY_HEAD_START,
+    DISCOVERY_TIMEOUT,
+)
+
+HUE_SERVICE_TYPE = "_hue._tcp.local."
+
+# Application and device name registered when pairing, at most 20 and 19 chars
+DEVICE_TYPE = f"python-hue-events#{socket.gethostname()[:19]}"
+
+# v1 API error type returned while the link button has not been pressed
+LINK_BUTTON_NOT_PRESSED = 101
+
+
+def probe_bridge(ip, timeout=BRIDGE_PROBE_TIMEOUT):
+    """
+    Check that a Hue bridge answers at an IP address.
+
+    Args:
+        ip (str): IP address to check.
+        timeout (float): Timeout in seconds.
+
+    Returns:
+        str: Lowercase bridge ID, or None if no bridge answered.
+    """
+    # Discovery modules are imported on first use to keep startup fast
+    import requests
+
+    try:
+        response = requests.get(f"http://{ip}/api/config", timeout=timeout)
+        response.raise_for_status()
+        bridge_id = response.json().get("bridgeid")
+    except (requests.exceptions.RequestException, ValueError, AttributeError):
+        return None
+    return bridge_id.lower() if bridge_id else None
+
+
+def read_credentials(file_path=CREDENTIALS_FILE_PATH):
+    """
+    Read the credentials of every paired bridge.
+
+    Credentials are keyed by bridge ID, or by IP address while the ID is not
+    known. A file holding a single bridge, as written by earlier versions, is
+    read as one entry.
+
+    Args:
+        file_path (str): Path to the credentials file.
+
+    Returns:
+        dict: IP address, username and, if known, client key for each bridge key.
+    """
+    if not path.exists(file_path):
+        return {}
+    with open(file_path, "r") as file:
+        credentials = json.load(file)
+    if "bridges" in credentials:
+        return credentials["bridges"]
+    key = credentials.get("bridge_id") or credentials["ip"]
+    return {key: {"ip": credentials["ip"], "username": credentials["username"]}}
 
 
 class HueBridge:
@@ -16,19 +81,44 @@ class HueBridge:
     Attributes:
         logger (logging.Logger): Logger instance.
         discovered_ip (str): Discovered IP address of the Hue bridge.
-        ip (str): IP address of the Hue bridge.
+        key (str): Key of the bridge in the credentials file. Defaults to the
+            first saved bridge.
+        ip (str): IP address of the Hue bridge. When given and not saved yet,
+            the bridge at this IP is paired.
         username (str): Username for the Hue bridge.
-        bridge (Bridge): Bridge instance.
+        clientkey (str): Key for entertainment streaming, created when pairing,
+            or None for bridges paired by earlier versions.
+        bridge_id (str): ID of the Hue bridge, used to recognize it at a new IP.
+        bridge (Bridge): qhue Bridge instance, created on first use.
+        client (BridgeClient): Async client sharing one keep-alive session.
+        scheduler (CommandScheduler): Rate-limited scheduler for light commands.
     """
 
-    def __init__(self):
+    def __init__(self, key=None, ip=None):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.discovered_ip = None
-        self.ip = None
+        self.key = key
+        self.ip = ip
         self.username = None
-        self.bridge = None
+        self.clientkey = None
+        self.bridge_id = None
+        self._bridge = None
+        self.client = None
+        self.scheduler = None
+        self._revalidation = None
         self.connect_to_bridge()
 
+    @property
+    def bridge(self):
+        """
+        qhue Bridge instance, created on first use so qhue is only imported when needed.
+        """
+        if self._bridge is None and self.ip and self.username:
+            from qhue import Bridge
+
+            self._bridge = Bridge(self.ip, self.username)
+        return self._bridge
+
     def load_credentials(self):
         """
         Load credentials from file.
@@ -36,55 +126,137 @@ class HueBridge:
         Returns:
             bool: True if credentials were loaded, False otherwise.
         """
-        if path.exists(CREDENTIALS_FILE_PATH):
-            with open(CREDENTIALS_FILE_PATH, "r") as file:
-                credentials = json.load(file)
-                self.ip = credentials["ip"]
-                self.username = credentials["username"]
-                return True
+        bridges = read_credentials()
+        if self.ip:
+            keys = [key for key, entry in bridges.items() if entry["ip"] == self.ip]
+            key = keys[0] if keys else None
         else:
+            key = self.key if self.key is not None else next(iter(bridges), None)
+        if key not in bridges:
             return False
 
-    def discover_hue_bridge_mdns(self):
+        credentials = bridges[key]
+        self.key = key
+        self.ip = credentials["ip"]
+        self.username = credentials["username"]
+        self.clientkey = credentials.get("clientkey")
+        self.bridge_id = key if key != self.ip else None
+        return True
+
+    def discover_hue_bridge_mdns(self, timeout=DISCOVERY_TIMEOUT):
         """
         Discover the Hue bridge using mDNS.
 
+        Args:
+            timeout (float): Time in seconds to wait for a bridge to announce itself.
+
         Returns:
-            bool: True if the bridge was discovered, False otherwise.
+            str: IP address of the discovered bridge, or None.
         """
+        import zeroconf
+
+        zeroconf_instance = None
+        names = []
+        found = threading.Event()
+        added = zeroconf.ServiceStateChange.Added
+
+        def on_service_state_change(zeroconf, service_type, name, state_change):
+            if state_change is added:
+                names.append(name)
+                found.set()
+
         try:
             zeroconf_instance = zeroconf.Zeroconf()
-            services = zeroconf_instance.get_service_info(
-                "_hue._tcp.local.", "_hue._tcp.local."
+            zeroconf.ServiceBrowser(
+                zeroconf_instance,
+                HUE_SERVICE_TYPE,
+                handlers=[on_service_state_change],
             )
-            if services:
-                self.discovered_ip = services.addresses[0]
-                return True
-            else:
-                return False
+            if not found.wait(timeout):
+                return None
+            info = zeroconf_instance.get_service_info(
+                HUE_SERVICE_TYPE, names[0], timeout=int(timeout * 1000)
+            )
+            addresses = info.parsed_addresses() if info else []
+            return addresses[0] if addresses else None
         except Exception as e:
             self.logger.error(f"Error during mDNS discovery: {str(e)}")
-            return False
+            return None
+        finally:
+            if zeroconf_instance:
+                zeroconf_instance.close()
 
-    def discover_hue_bridges_cloud(self):
+    def discover_hue_bridges_cloud(self, timeout=DISCOVERY_TIMEOUT):
         """
         Discover the Hue bridge using the cloud.
 
+        Args:
+            timeout (float): Timeout of the discovery request in seconds.
+
         Returns:
-            bool: True if the bridge was discovered, False otherwise.
+            str: IP address of the discovered bridge, or None.
         """
+        import requests
+
         try:
-            response = requests.get("https://discovery.meethue.com/")
+            response = requests.get("https://discovery.meethue.com/", timeout=timeout)
             response.raise_for_status()
             data = response.json()
-            if data:
-                self.discovered_ip = data[0]["internalipaddress"]
-                return True
-            else:
-                return False
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             self.logger.error(f"Error during cloud discovery: {str(e)}")
-            return False
+            return None
+
+        # Prefer the known bridge when several are registered on the network
+        for entry in data:
+            if self.bridge_id and entry.get("id", "").lower() == self.bridge_id:
+                return entry["internalipaddress"]
+        return data[0]["internalipaddress"] if data else None
+
+    def discover_concurrently(self):
+        """
+        Race the discovery methods and keep the first bridge that answers.
+
+        mDNS and the cloud are tried at the same time. Each candidate is checked
+        against the bridge, and must have the known bridge ID if there is one.
+
+        Returns:
+            tuple: IP address and bridge ID, or (None, None) if nothing answered.
+        """
+        methods = [self.discover_hue_bridge_mdns, self.discover_hue_bridges_cloud]
+        executor = ThreadPoolExecutor(
+            max_workers=len(methods), thread_name_prefix="discovery"
+        )
+        futures = [executor.submit(self._check_candidate, method) for method in methods]
+        try:
+            for future in as_completed(
+                futures, timeout=DISCOVERY_TIMEOUT + BRIDGE_PROBE_TIMEOUT
+            ):
+                if future.result():
+                    return future.result()
+        except FutureTimeoutError:
+            self.logger.warning("Bridge discovery timed out.")
+        finally:
+            # Do not wait for the slower methods, they stop at their own timeouts
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None, None
+
+    def _check_candidate(self, method):
+        """
+        Run a discovery method and check the bridge at the IP it found.
+
+        Args:
+            method (callable): Discovery method returning an IP address or None.
+
+        Returns:
+            tuple: IP address and bridge ID, or None if it is not the bridge.
+        """
+        ip = method()
+        if not ip:
+            return None
+        bridge_id = probe_bridge(ip)
+        if bridge_id and (self.bridge_id is None or bridge_id == self.bridge_id):
+            return ip, bridge_id
+        return None
 
     def enter_manual_ip(self):
         """
@@ -109,36 +281,61 @@ class HueBridge:
         Find the Hue bridge.
 
         Returns:
-            str: IP address of the Hue bridge.
+            str: IP address of the Hue bridge, or None if none was found.
         """
-        if self.discover_hue_bridge_mdns():
-            return self.discovered_ip
-        elif self.discover_hue_bridges_cloud():
+        ip, bridge_id = self.discover_concurrently()
+        if ip:
+            self.discovered_ip = ip
+            self.bridge_id = bridge_id
+            return ip
+        if self.enter_manual_ip():
+            self.bridge_id = probe_bridge(self.discovered_ip)
             return self.discovered_ip
-        else:
-            return self.enter_manual_ip()
+        return None
 
     def create_new_user(self, ip):
         """
         Create a new user for the Hue bridge.
 
+        The user is created with a client key, which encrypts entertainment
+        streams. The link button on the bridge must be pressed.
+
         Args:
             ip (str): IP address of the Hue bridge.
 
         Returns:
             str: Username for the Hue bridge.
         """
-        try:
-            username = create_new_username(ip)
-            return username
-        except QhueException as e:
-            self.logger.error(f"Error creating new user: {str(e)}")
-            return None
+        import requests
+
+        body = {"devicetype": DEVICE_TYPE, "generateclientkey": True}
+        while True:
+            try:
+                response = requests.post(
+                    f"http://{ip}/api", json=body, timeout=BRIDGE_PROBE_TIMEOUT
+                )
+                response.raise_for_status()
+                result = response.json()[0]
+            except (requests.exceptions.RequestException, ValueError, LookupError) as e:
+                self.logger.error(f"Error creating new user: {str(e)}")
+                return None
+            if "success" in result:
+                self.clientkey = result["success"].get("clientkey")
+                return result["success"]["username"]
+            error = result.get("error", {})
+            if error.get("type") != LINK_BUTTON_NOT_PRESSED:
+                description = error.get("description")
+                self.logger.error(f"Error creating new user: {description}")
+                return None
+            input("Press the link button on the Hue bridge, then press Enter.")
 
     def save_credentials(self, ip, username):
         """
         Save credentials to file.
 
+        The credentials are keyed by the bridge ID, so the bridge can be found
+        again at a new IP. Other saved bridges are kept.
+
         Args:
             ip (str): IP address of the Hue bridge.
             username (str): Username for the Hue bridge.
@@ -146,9 +343,14 @@ class HueBridge:
         Returns:
             str: Path to the credentials file.
         """
-        credentials = {"ip": ip, "username": username}
+        bridges = read_credentials()
+        bridges.pop(self.key, None)
+        self.key = self.bridge_id or ip
+        bridges[self.key] = {"ip": ip, "username": username}
+        if self.clientkey:
+            bridges[self.key]["clientkey"] = self.clientkey
         with open(CREDENTIALS_FILE_PATH, "w") as file:
-            json.dump(credentials, file)
+            json.dump({"bridges": bridges}, file)
         return CREDENTIALS_FILE_PATH
 
     def connect_to_bridge(self):
@@ -156,11 +358,132 @@ class HueBridge:
         Connect to the Hue bridge.
         """
         if self.load_credentials():
-            self.bridge = Bridge(self.ip, self.username)
+            self.client = BridgeClient(self.ip, self.username)
+            self.scheduler = CommandScheduler(self.client, bridge=self.key)
+            # Start with the stored IP and check it without blocking startup
+            self.start_revalidation()
         else:
-            self.ip = self.find_hue_bridge()
+            if self.ip:
+                # Pair the bridge at the given IP instead of discovering one
+                self.bridge_id = probe_bridge(self.ip)
+            else:
+                self.ip = self.find_hue_bridge()
             if self.ip:
                 self.username = self.create_new_user(self.ip)
                 if self.username:
-                    self.bridge = Bridge(self.ip, self.username)
+                    self.client = BridgeClient(self.ip, self.username)
+                    # Saving the credentials sets the bridge key
                     self.save_credentials(self.ip, self.username)
+                    self.scheduler = CommandScheduler(self.client, bridge=self.key)
+
+    def start_revalidation(self):
+        """
+        Check the stored IP in the background if an event loop is running.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._revalidation = loop.create_task(self.revalidate())
+
+    async def revalidate(self):
+        """
+        Check that the bridge still answers at its IP, and find it again if not.
+
+        The stored IP is raced against mDNS and cloud discovery, which join
+        after a short head start, so a bridge that still answers there costs no
+        mDNS query or rate-limited cloud lookup. A bridge whose IP changed, e.g.
+        after a new DHCP lease, is found again by its bridge ID without waiting
+        for the stored IP to time out, and the new IP is saved.
+        """
+        check = asyncio.create_task(self.check_ip())
+        discovery = None
+        try:
+            await asyncio.wait({check}, timeout=DISCOVERY_HEAD_START)
+            if check.done() and check.result():
+                self.confirm_ip(check.result())
+                return
+
+            discovery = asyncio.ensure_future(
+                asyncio.to_thread(self.discover_concurrently)
+            )
+            pending = {check, discovery}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                if check in done and check.result():
+                    self.confirm_ip(check.result())
+                    return
+                if discovery in done:
+                    ip, bridge_id = discovery.result()
+                    if ip == self.ip:
+                        self.confirm_ip(bridge_id)
+                        return
+                    if ip:
+                        self.update_ip(ip, bridge_id)
+                        return
+            self.logger.error(f"Bridge not found at {self.ip} or by discovery.")
+        finally:
+            # Discovery threads stop at their own timeouts
+            for task in (check, discovery):
+                if task:
+                    task.cancel()
+
+    async def check_ip(self):
+        """
+        Check that the bridge answers at its current IP.
+
+        The client's keep-alive session is used, so the check also opens the
+        connection for the first command.
+
+        Returns:
+            str: Lowercase bridge ID, or None if the bridge did not answer.
+        """
+        try:
+            config = await self.client.call("config")
+        except (BridgeError, aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        bridge_id = (config.get("bridgeid") or "").lower() or None
+        if bridge_id and (self.bridge_id is None or bridge_id == self.bridge_id):
+            return bridge_id
+        return None
+
+    def confirm_ip(self, bridge_id):
+        """
+        Record that the bridge answered at its current IP.
+
+        Args:
+            bridge_id (str): Bridge ID.
+        """
+        if self.bridge_id is None:
+            self.bridge_id = bridge_id
+            self.save_credentials(self.ip, self.username)
+        self.logger.debug(f"Bridge {bridge_id} answered at {self.ip}.")
+
+    def update_ip(self, ip, bridge_id):
+        """
+        Switch to a new IP address of the bridge and save it.
+
+        Args:
+            ip (str): New IP address of the Hue bridge.
+            bridge_id (str): Bridge ID.
+        """
+        self.logger.info(f"Bridge moved from {self.ip} to {ip}.")
+        self.ip = ip
+        self.bridge_id = bridge_id
+        self._bridge = None
+        self.client.set_ip(ip)
+        self.save_credentials(ip, self.username)
+
+    async def close(self):
+        """
+        Close the connection to the Hue bridge.
+        """
+        if self._revalidation:
+            self._revalidation.cancel()
+            await asyncio.gather(self._revalidation, return_exceptions=True)
+        if self.scheduler:
+            await self.scheduler.close()
+        if self.client:
+            await self.client.close()
@@ -1,8 +1,38 @@
+import asyncio
 import json
 import logging
-import time
 
-import yaml
+from constants import SCENE_CACHE_FILE_PATH
+from effect_queue import EffectQueue
+from effects import EffectEngine
+from entertainment import EntertainmentStream
+from scenes import SceneCache
+from state_cache import ALL_LIGHTS_GROUP, GROUPS, LIGHTS, StateCache
+
+# Color attributes to restore for each color mode
+COLOR_MODE_ATTRIBUTES = {"xy": ("xy",), "ct": ("ct",), "hs": ("hue", "sat")}
+
+
+def restorable_state(state):
+    """
+    Extract the attributes needed to restore a light state.
+
+    Args:
+        state (dict): Light state as returned by the bridge.
+
+    Returns:
+        dict: Attributes to send to restore the state.
+    """
+    if not state.get("on"):
+        return {"on": False}
+
+    restored = {"on": True}
+    if "bri" in state:
+        restored["bri"] = state["bri"]
+    for attribute in COLOR_MODE_ATTRIBUTES.get(state.get("colormode"), ()):
+        if attribute in state:
+            restored[attribute] = state[attribute]
+    return restored
 
 
 class LightController:
@@ -11,26 +41,118 @@ class LightController:
 
     Attributes:
         bridge (HueBridge): Hue bridge instance.
+        effect_engine (EffectEngine): Engine running light effects.
+        effect_queue (EffectQueue): Bounded queue of effects waiting to run.
+        state_cache (StateCache): Cache of light and group state.
+        use_scenes (bool): Whether to restore groups by recalling bridge scenes.
+        scene_file_path (str): Path to the cache of provisioned bridge scenes.
+        entertainment (EntertainmentStream): Stream effects are sent over instead
+            of REST commands when possible, or None to only use REST.
         logger (logging.Logger): Logger instance.
     """
 
-    def __init__(self, bridge):
+    def __init__(
+        self,
+        bridge,
+        use_scenes=True,
+        scene_file_path=SCENE_CACHE_FILE_PATH,
+        streaming=False,
+    ):
         self.bridge = bridge
+        self.effect_engine = EffectEngine(self)
+        self.effect_queue = EffectQueue(self.effect_engine, bridge=bridge.key or "")
+        self.state_cache = StateCache()
+        self.use_scenes = use_scenes
+        self.scene_file_path = scene_file_path
+        self.entertainment = (
+            EntertainmentStream(bridge, self.state_cache) if streaming else None
+        )
         self.logger = logging.getLogger(self.__class__.__name__)
+        self._scene_cache = None
+
+    @property
+    def scene_cache(self):
+        """
+        Cache of bridge scenes, or None if scenes are not used.
+        """
+        if self._scene_cache is None and self.use_scenes and self.bridge.client:
+            self._scene_cache = SceneCache(
+                self.bridge.client, self.bridge.scheduler, self.scene_file_path
+            )
+        return self._scene_cache
+
+    async def connect(self):
+        """
+        Open the bridge connection and load light and group state into the cache.
+
+        Doing this ahead of the first effect keeps the connection setup, the
+        state reads and the entertainment handshake off the path of the first
+        event.
+        """
+        try:
+            await self.get_lights()
+            await self.get_groups()
+        except Exception as e:
+            self.logger.error(f"Error connecting to the bridge: {e}")
+            return
+        if self.entertainment is not None:
+            await self.entertainment.open()
+
+    async def get_lights(self):
+        """
+        Get all lights, reading them from the cache when it is fresh.
+
+        Returns:
+            dict: Dictionary of lights.
+        """
+        lights = self.state_cache.get_all(LIGHTS)
+        if lights is None:
+            lights = await self.bridge.client.lights()
+            self.state_cache.put_all(LIGHTS, lights)
+        return lights
 
-    def list_lights(self):
+    async def get_light(self, light_id):
+        """
+        Get a light, reading it from the cache when it is fresh.
+
+        Args:
+            light_id (str): Light ID.
+
+        Returns:
+            dict: Light resource.
+        """
+        light = self.state_cache.get(LIGHTS, light_id)
+        if light is None:
+            light = await self.bridge.client.lights(light_id)
+            self.state_cache.put(LIGHTS, light_id, light)
+        return light
+
+    async def get_groups(self):
+        """
+        Get all groups, reading them from the cache when it is fresh.
+
+        Returns:
+            dict: Dictionary of groups.
+        """
+        groups = self.state_cache.get_all(GROUPS)
+        if groups is None:
+            groups = await self.bridge.client.groups()
+            self.state_cache.put_all(GROUPS, groups)
+        return groups
+
+    async def list_lights(self):
         """
         List lights.
 
         Returns:
             dict: Dictionary of lights.
         """
-        lights = self.bridge.bridge.lights()
+        lights = await self.get_lights()
         for light_id, light in lights.items():
             self.logger.info(f"Light {light_id}: {light['name']}")
         return lights
 
-    def list_light_details(self, light_id, format="json"):
+    async def list_light_details(self, light_id, format="json"):
         """
         List light details.
 
@@ -41,16 +163,18 @@ class LightController:
         Returns:
             dict: Dictionary of light details.
         """
-        light = self.bridge.bridge.lights[light_id]()
+        light = await self.get_light(light_id)
         if format == "json":
             self.logger.info(json.dumps(light["state"], indent=4))
         elif format == "yaml":
+            import yaml
+
             self.logger.info(yaml.safe_dump(light["state"], indent=4))
         else:
             self.logger.error(f"Invalid format: {format}")
         return light["state"]
 
-    def get_light_state(self, light_id):
+    async def get_light_state(self, light_id):
         """
         Get light state.
 
@@ -60,32 +184,154 @@ class LightController:
         Returns:
             bool: True if light is on, False if light is off.
         """
-        light = self.bridge.bridge.lights[light_id]()
+        light = await self.get_light(light_id)
         state = light["state"]["on"]
         self.logger.info(f"Light {light_id} is {'on' if state else 'off'}")
         return state
 
+    async def set_light_state(self, light_id, **state):
+        """
+        Send a state update to a light.
+
+        The update is paced by the bridge command scheduler and written through
+        to the state cache.
+
+        Args:
+            light_id (str): Light ID.
+            **state: Light state attributes, e.g. on, bri, xy.
+        """
+        await self.bridge.scheduler.set_light_state(light_id, **state)
+        self.state_cache.update(LIGHTS, light_id, state)
+
+    async def set_group_action(self, group_id, **state):
+        """
+        Send an action to a group.
+
+        The action is paced by the bridge command scheduler and written through
+        to the state cache.
+
+        Args:
+            group_id (str): Group ID.
+            **state: Group action attributes, e.g. on, bri, xy.
+        """
+        await self.bridge.scheduler.set_group_action(group_id, **state)
+        self.state_cache.update(GROUPS, group_id, state)
+
+    async def group_light_ids(self, group_id):
+        """
+        Get the IDs of the lights in a group.
+
+        Args:
+            group_id (str): Group ID.
+
+        Returns:
+            list: Light IDs.
+        """
+        await self.get_lights()
+        if str(group_id) != ALL_LIGHTS_GROUP:
+            await self.get_groups()
+        return self.state_cache.group_lights(group_id)
+
+    async def snapshot_group(self, group_id):
+        """
+        Capture the restorable state of every light in a group.
+
+        Args:
+            group_id (str): Group ID.
+
+        Returns:
+            dict: Restorable state for each light ID.
+        """
+        light_ids = await self.group_light_ids(group_id)
+        lights = await self.get_lights()
+
+        snapshot = {}
+        for light_id in light_ids:
+            light = lights.get(light_id)
+            if light:
+                snapshot[light_id] = restorable_state(light["state"])
+        return snapshot
+
+    async def restore_snapshot(self, snapshot, group_id=None, **extra):
+        """
+        Return lights to a captured state.
+
+        With a group ID, the states are recalled as a bridge scene with a single
+        group command. Otherwise, or if the scene cannot be used, each light is
+        set on its own.
+
+        Args:
+            snapshot (dict): Restorable state for each light ID.
+            group_id (str): Group the lights belong to. Defaults to None.
+            **extra: Attributes added to every command, e.g. alert="none".
+        """
+        scene_cache = self.scene_cache
+        if group_id is not None and scene_cache is not None:
+            scene_id = None
+            try:
+                scene_id = await scene_cache.scene_for(snapshot)
+                await self.bridge.scheduler.set_group_action(
+                    group_id, scene=scene_id, **extra
+                )
+            except Exception as e:
+                self.logger.warning(f"Error recalling scene, restoring lights: {e}")
+                if scene_id:
+                    scene_cache.forget(scene_id)
+            else:
+                for light_id, state in snapshot.items():
+                    self.state_cache.update(LIGHTS, light_id, state)
+                return
+
+        await asyncio.gather(
+            *(
+                self.set_light_state(light_id, **{**state, **extra})
+                for light_id, state in snapshot.items()
+            )
+        )
+
+    def play_effect(
+        self, effect, group_id, received_at=None, trace_id=None, priority=0
+    ):
+        """
+        Queue an effect for a group.
+
+        The effect is played in the background so the caller is not blocked.
+
+        Args:
+            effect (str): Name of the effect.
+            group_id (str): Group ID.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+            priority (int): Priority, higher values are played first and preempt
+                lower ones. Defaults to 0.
+
+        Returns:
+            bool: True if the effect was queued, False if it was dropped.
+        """
+        return self.effect_queue.put(effect, group_id, received_at, trace_id, priority)
+
     def flash_group_lights(self, group_id):
         """
         Flash group lights.
 
+        The effect is queued and played in the background so the caller is not
+        blocked. Bursts of flashes are merged by the effect queue.
+
         Args:
             group_id (str): Group ID.
-        """
 
-        # Flash green
+        Returns:
+            bool: True if the flash was queued, False if it was dropped.
+        """
         self.logger.info("Flashing lights green")
+        return self.play_effect("flash_green", group_id)
 
-        self.bridge.bridge.groups(group_id, "action", on=True, bri=200, xy=[0.1, 0.8])
-        time.sleep(0.6)
-        self.bridge.bridge.groups(group_id, "action", on=False)
-        time.sleep(1)
-        self.bridge.bridge.groups(group_id, "action", on=True, bri=200, xy=[0.1, 0.8])
-        time.sleep(0.6)
-        self.bridge.bridge.groups(group_id, "action", on=False)
-        time.sleep(1)
-
-        self.logger.info("Returning lights to neutral color")
-        self.bridge.bridge.groups(
-            group_id, "action", on=True, bri=254, xy=[0.413, 0.395]
-        )
+    async def close(self):
+        """
+        Stop queued and running effects and close the entertainment stream.
+        """
+        await self.effect_queue.close()
+        if self.entertainment is not None:
+            await self.entertainment.close()
@@ -1,103 +1,311 @@
+import json
 import logging
 import os
 import re
+import time
 from datetime import datetime
 from pathlib import Path
 
 import aiofiles
 
+from constants import (
+    LOG_ALIGN_CHUNK_SIZE,
+    LOG_FILE_PATH,
+    LOG_ROTATE_BYTES,
+    LOG_ROTATE_INTERVAL,
+)
+
 
 class LogAligner:
     """
     Aligns log lines in a log file.
 
+    The log file is read in chunks from the offset reached by the previous run,
+    so each run only aligns new lines and takes the same time however long the
+    deployment has been running. The new lines are read twice, once to size the
+    columns and once to write them, and appended to the output file of the day as
+    one aligned block. Rotation renames the log file, so records the logger writes
+    to it afterwards are aligned from the rotated file on the next run.
+
     Attributes:
         file_path (Path): Path to the log file.
+        rotated_path (Path): Path the log file is renamed to on rotation.
+        state_path (Path): Path to the file storing the offsets.
         delete_original (bool): Whether to delete the original file after alignment.
+        chunk_size (int): Number of bytes read at a time.
+        rotate_bytes (int): Size in bytes of aligned log lines that triggers rotation.
+        rotate_interval (float): Time in seconds between rotations.
+        name_width (int): Width of the logger name column of the current block.
+        level_width (int): Width of the level column of the current block.
     """
 
     LOG_LINE_PATTERN = re.compile(r" - ")
 
-    def __init__(self, file_path="app.log", delete_original=False):
+    def __init__(
+        self,
+        file_path=LOG_FILE_PATH,
+        delete_original=False,
+        chunk_size=LOG_ALIGN_CHUNK_SIZE,
+        rotate_bytes=LOG_ROTATE_BYTES,
+        rotate_interval=LOG_ROTATE_INTERVAL,
+    ):
         self.file_path = Path(file_path)
+        self.rotated_path = Path(f"{file_path}.1")
+        self.state_path = Path(f"{file_path}.offset")
         self.delete_original = delete_original
+        self.chunk_size = chunk_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.name_width = 0
+        self.level_width = 0
         self.logger = logging.getLogger(self.__class__.__name__)
 
     async def align_log_entries(self):
         """
-        Aligns the log lines in the file asynchronously.
+        Aligns the log lines written since the last run asynchronously.
         """
-        lines = await self._read_logs()
-        if not lines:
+        if not self.file_path.exists() and not self.rotated_path.exists():
             return
 
-        max_name_length, max_level_length = self._analyze_log_lines(lines)
+        state = self._load_state()
+        rotated_at = state.get("rotated_at") or time.time()
+        # Lines logged to the rotated file after the last rotation come first
+        sources = [
+            (path, self._start_offset(path, state.get(key, 0)))
+            for path, key in (
+                (self.rotated_path, "rotated_offset"),
+                (self.file_path, "offset"),
+            )
+            if path.exists()
+        ]
         output_file = Path(f"hue-alerts_{datetime.now().strftime('%Y%m%d')}.log")
-        await self._write_aligned_logs(
-            lines, max_name_length, max_level_length, output_file
-        )
+        offsets = await self._write_aligned_logs(sources, output_file)
+        rotated_offset = offsets.get(self.rotated_path, 0)
+        offset = offsets.get(self.file_path, 0)
 
         if self.delete_original:
-            self._delete_file(self.file_path)
+            for path in (self.file_path, self.rotated_path, self.state_path):
+                if path.exists():
+                    self._delete_file(path)
+            return
+
+        if self._should_rotate(offset, rotated_at) and self._rotate(offset):
+            rotated_offset, offset, rotated_at = offset, 0, time.time()
+        self._save_state(offset, rotated_offset, rotated_at)
+
+    def _start_offset(self, path, offset):
+        """
+        Checks the saved offset of a log file against its size.
+
+        Args:
+            path (Path): Path to the log file.
+            offset (int): Byte offset reached by the previous run.
 
-    async def _read_logs(self):
+        Returns:
+            int: Byte offset to align from, 0 if the file was truncated.
         """
-        Reads the logs from the file asynchronously.
+        if path.stat().st_size < offset:
+            self.logger.info(f"'{path}' was truncated, aligning from start.")
+            return 0
+        return offset
+
+    def _split_line(self, line):
+        """
+        Splits a log line into its time, name, level and message.
+
+        Args:
+            line (str): Log line without its line ending.
 
         Returns:
-            list: List of log lines.
+            list: The four parts, or None if the line is not a log record.
+        """
+        parts = self.LOG_LINE_PATTERN.split(line, maxsplit=3)
+        return parts if len(parts) == 4 else None
+
+    def _align_line(self, line):
+        """
+        Aligns a single log line to the column widths of the current block.
+
+        Args:
+            line (str): Log line without its line ending.
+
+        Returns:
+            str: Aligned log line, or the line unchanged if it is not a log record.
+        """
+        parts = self._split_line(line)
+        if parts is None:
+            return line
+        return (
+            f"{parts[0]} - {parts[1]:<{self.name_width}} - "
+            f"{parts[2]:<{self.level_width}} - {parts[3]}"
+        )
+
+    async def _read_lines(self, path, offset, end=None):
+        """
+        Reads the complete lines of a log file after an offset in chunks.
+
+        A trailing line without a line ending is left for the next run.
+
+        Args:
+            path (Path): Path to the log file.
+            offset (int): Byte offset of the first line.
+            end (int): Byte offset to stop at, or None to read to the end.
+
+        Yields:
+            tuple: Lines of a chunk without line endings, and the byte offset
+                after them.
         """
-        self.logger.debug(f"Reading logs from '{self.file_path}' and aligning them.")
         try:
-            async with aiofiles.open(
-                self.file_path, mode="r", encoding="utf-8"
-            ) as file:
-                return await file.readlines()
+            async with aiofiles.open(path, mode="rb") as source:
+                await source.seek(offset)
+                position = offset
+                pending = b""
+                while end is None or position < end:
+                    size = self.chunk_size
+                    if end is not None:
+                        size = min(size, end - position)
+                    chunk = await source.read(size)
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    data = pending + chunk
+                    *lines, pending = data.split(b"\n")
+                    offset += len(data) - len(pending)
+                    yield [
+                        line.decode("utf-8", "replace").rstrip("\r") for line in lines
+                    ], offset
         except IOError as e:
-            raise IOError(f"Error reading file {self.file_path}: {e}") from e
+            raise IOError(f"Error reading file {path}: {e}") from e
 
-    def _analyze_log_lines(self, lines):
+    async def _analyze_log_lines(self, sources):
         """
-        Analyzes the log lines to determine the maximum length of the name and level.
+        Sizes the columns for the new lines of the log files.
 
         Args:
-            lines (list): List of log lines.
+            sources (list): Path and byte offset of the first new line of each
+                log file.
 
         Returns:
-            tuple: Tuple containing the maximum name and level lengths.
-        """
-        max_name_length, max_level_length = 0, 0
-        for line in lines:
-            parts = self.LOG_LINE_PATTERN.split(line)
-            if len(parts) >= 4:
-                max_name_length, max_level_length = (
-                    max(max_name_length, len(parts[1])),
-                    max(max_level_length, len(parts[2])),
-                )
-        return max_name_length, max_level_length
-
-    async def _write_aligned_logs(
-        self, lines, max_name_length, max_level_length, output_file
-    ):
+            dict: Byte offset after the last complete line of each log file.
         """
-        Writes the aligned log lines to a new file asynchronously.
+        self.name_width, self.level_width = 0, 0
+        ends = {}
+        for path, offset in sources:
+            ends[path] = offset
+            async for lines, end in self._read_lines(path, offset):
+                ends[path] = end
+                for line in lines:
+                    parts = self._split_line(line)
+                    if parts:
+                        self.name_width = max(self.name_width, len(parts[1]))
+                        self.level_width = max(self.level_width, len(parts[2]))
+        return ends
+
+    async def _write_aligned_logs(self, sources, output_file):
+        """
+        Appends the new lines of the log files to the output file as one block.
+
+        Lines logged while aligning are left for the next run.
 
         Args:
-            lines (list): List of log lines.
-            max_name_length (int): Maximum length of the name.
-            max_level_length (int): Maximum length of the level.
+            sources (list): Path and byte offset of the first new line of each
+                log file.
             output_file (Path): Path to the output file.
+
+        Returns:
+            dict: Byte offset after the last aligned line of each log file.
         """
+        ends = await self._analyze_log_lines(sources)
+        if all(ends[path] == offset for path, offset in sources):
+            return ends
 
+        self.logger.debug(f"Aligning '{self.file_path}' into '{output_file}'.")
         try:
-            async with aiofiles.open(output_file, mode="w", encoding="utf-8") as file:
-                for line in lines:
-                    parts = self.LOG_LINE_PATTERN.split(line, maxsplit=3)
-                    if len(parts) >= 4:
-                        aligned_line = f"{parts[0]} - {parts[1]:<{max_name_length}} - {parts[2]:<{max_level_length}} - {parts[3]}"
-                        await file.write(aligned_line)
+            async with aiofiles.open(output_file, mode="a", encoding="utf-8") as output:
+                for path, offset in sources:
+                    async for lines, _ in self._read_lines(path, offset, ends[path]):
+                        await output.write(
+                            "".join(self._align_line(line) + "\n" for line in lines)
+                        )
         except IOError as e:
             raise IOError(f"Error writing to file {output_file}: {e}") from e
+        return ends
+
+    def _should_rotate(self, offset, rotated_at):
+        """
+        Checks whether the log file is due for rotation.
+
+        Args:
+            offset (int): Byte offset of the aligned part of the log file.
+            rotated_at (float): Time of the last rotation.
+
+        Returns:
+            bool: True if the log file is large or old enough to rotate.
+        """
+        if not offset:
+            return False
+        return (
+            offset >= self.rotate_bytes
+            or time.time() - rotated_at >= self.rotate_interval
+        )
+
+    def _rotate(self, offset):
+        """
+        Renames the log file, replacing the previous rotated file.
+
+        The rotated file was aligned up to its last complete line by this run.
+        Records written to the renamed file by a logger that still has it open
+        are aligned on the next run, so no record is lost.
+
+        Args:
+            offset (int): Byte offset of the aligned part of the log file.
+
+        Returns:
+            bool: True if the log file was renamed.
+        """
+        try:
+            os.replace(self.file_path, self.rotated_path)
+        except OSError as e:
+            self.logger.error(f"Error rotating file {self.file_path}: {e}")
+            return False
+        self.logger.info(f"Rotated '{self.file_path}' after {offset} bytes.")
+        return True
+
+    def _load_state(self):
+        """
+        Loads the offsets of the previous run.
+
+        Returns:
+            dict: State of the previous run, empty if there is none.
+        """
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, offset, rotated_offset, rotated_at):
+        """
+        Saves the offsets for the next run.
+
+        Args:
+            offset (int): Byte offset after the last aligned line of the log file.
+            rotated_offset (int): Byte offset after the last aligned line of the
+                rotated file.
+            rotated_at (float): Time of the last rotation.
+        """
+        state = {
+            "offset": offset,
+            "rotated_offset": rotated_offset,
+            "rotated_at": rotated_at,
+        }
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            raise OSError(f"Error writing file {self.state_path}: {e}") from e
 
     def _delete_file(self, file_path):
         """
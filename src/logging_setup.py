@@ -0,0 +1,194 @@
+import atexit
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from constants import LOG_BATCH_SIZE, LOG_FILE_PATH, LOG_FLUSH_INTERVAL
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Third-party loggers that are too chatty at DEBUG level
+QUIET_LOGGERS = ("aiohttp", "asyncio", "qhue", "zeroconf", "urllib3")
+
+
+class BatchingFileHandler(logging.FileHandler):
+    """
+    File handler that flushes to disk in batches instead of after every record.
+
+    Attributes:
+        batch_size (int): Number of records written before flushing.
+        flush_interval (float): Maximum time in seconds between flushes.
+    """
+
+    def __init__(
+        self,
+        filename,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        encoding="utf-8",
+    ):
+        super().__init__(filename, encoding=encoding)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def emit(self, record):
+        """
+        Write a record, flushing once the batch is full or the interval passed.
+
+        Args:
+            record (logging.LogRecord): Record to write.
+        """
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self._pending += 1
+            now = time.monotonic()
+            if (
+                self._pending >= self.batch_size
+                or now - self._last_flush >= self.flush_interval
+            ):
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        Flush written records to disk.
+        """
+        super().flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves all formatting to the listener thread.
+
+    Records are queued with their arguments, so callers should pass immutable
+    values such as strings and numbers as log arguments.
+    """
+
+    def prepare(self, record):
+        """
+        Prepare a record for queuing without formatting it.
+
+        Args:
+            record (logging.LogRecord): Record to queue.
+
+        Returns:
+            logging.LogRecord: The same record.
+        """
+        return record
+
+
+class FlushingQueueListener(QueueListener):
+    """
+    Queue listener that flushes its handlers while the queue is idle.
+
+    Attributes:
+        flush_interval (float): Time in seconds to wait for a record before flushing.
+    """
+
+    def __init__(self, log_queue, *handlers, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        """
+        Wait for the next record, flushing the handlers whenever the queue is idle.
+
+        Args:
+            block (bool): Whether to block until a record is available.
+
+        Returns:
+            logging.LogRecord: Next record.
+        """
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+    def stop(self):
+        """
+        Write out the queued records and flush the handlers.
+
+        Stopping a listener that is not running does nothing, so a shard can stop
+        its listener before the one registered to run at exit.
+        """
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+def parse_component_levels(spec):
+    """
+    Parse per-component log levels, e.g. "EventHandler=INFO,EventPoller=DEBUG".
+
+    Args:
+        spec (str): Comma-separated logger name and level pairs.
+
+    Returns:
+        dict: Level name for each logger name.
+    """
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(
+    file_path=LOG_FILE_PATH, level="DEBUG", component_levels=None, queued=False
+):
+    """
+    Configure logging to a file.
+
+    In queued mode records are handed to a background thread through a queue,
+    and the file is written in batches, so logging does not block the event loop.
+
+    Args:
+        file_path (str): Path to the log file.
+        level (str): Root log level. Defaults to "DEBUG".
+        component_levels (dict): Level name for each logger name. Defaults to None.
+        queued (bool): Whether to log through a background thread.
+            Defaults to False.
+
+    Returns:
+        QueueListener: Running listener in queued mode, otherwise None.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    root = logging.getLogger()
+    root.setLevel(level)
+    # Replace handlers inherited by a forked process instead of adding to them
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for name, component_level in (component_levels or {}).items():
+        logging.getLogger(name).setLevel(component_level)
+
+    if not queued:
+        handler = logging.FileHandler(file_path, encoding="utf-8")
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+        return None
+
+    handler = BatchingFileHandler(file_path)
+    handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener = FlushingQueueListener(log_queue, handler)
+    listener.start()
+    # Write out queued records when the program exits
+    atexit.register(listener.stop)
+    return listener
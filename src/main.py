@@ -2,30 +2,51 @@ import asyncio
 import logging
 import os
 import re
+from os import path
 
 import dotenv
 
-from constants import API_TIMEOUT
+from bridge_fanout import BridgeFanout
+from checkpoint import EventCheckpoint
+from constants import API_TIMEOUT, EVENTS_API_URL, FEEDS_FILE_PATH, LOG_FILE_PATH
+from dispatch import DispatchRegistry
 from event_handler import EventHandler
 from event_poller import EventPoller
-from hue_bridge import HueBridge
-from light_controller import LightController
-from log_formatter import LogAligner
-
-# Configure logging to a file
-logging.basicConfig(
-    filename="app.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-
-# Suppress log spam from third-party libraries
-logging.getLogger("aiohttp").setLevel(logging.WARNING)
-logging.getLogger("asyncio").setLevel(logging.WARNING)
-logging.getLogger("backoff").setLevel(logging.WARNING)
-logging.getLogger("qhue").setLevel(logging.WARNING)
-logging.getLogger("zeroconf").setLevel(logging.WARNING)
-logging.getLogger("urllib3").setLevel(logging.WARNING)
+from logging_setup import configure_logging, parse_component_levels
+from metrics import MetricsServer
+from pipeline import EventPipeline
+from profiling import Profiler, install_signal_handlers
+from tracing import TRACER
+
+# Modules only needed by optional features (multi-feed mode, the bridge event
+# stream and log alignment) are imported where they are used, so the common
+# path of polling with saved credentials starts quickly.
+
+
+def env_flag(name):
+    """
+    Read a boolean flag from the environment.
+
+    Args:
+        name (str): Name of the environment variable.
+
+    Returns:
+        bool: True if the variable is set to 1, true or yes.
+    """
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
+
+
+# Load the environment variables before logging reads its settings
+dotenv.load_dotenv()
+
+# Configure logging to a file, optionally through a background writer thread
+LOG_SETTINGS = {
+    "file_path": LOG_FILE_PATH,
+    "level": os.getenv("LOG_LEVEL", "DEBUG").upper(),
+    "component_levels": parse_component_levels(os.getenv("LOG_LEVELS", "")),
+    "queued": env_flag("LOG_QUEUE"),
+}
+configure_logging(**LOG_SETTINGS)
 
 
 def extract_user_and_token(url):
@@ -72,39 +93,135 @@ async def main():
     try:
         # Load the environment variables for the username and token
         dotenv.load_dotenv()
-        user = os.getenv("USERNAME")
-        token = os.getenv("TOKEN")
 
-        # Check if username and token are set, and if not, prompt the user for the API token URL
-        if not user or not token:
-            user, token = prompt_for_api_url_and_save()
+        # Optionally keep light state current from the bridge event stream
+        use_event_stream = env_flag("HUE_EVENT_STREAM")
+
+        # A feeds file switches to multi-feed mode with one feed per account
+        feeds_config = None
+        if path.exists(FEEDS_FILE_PATH):
+            from multi_feed import load_feeds_config
+
+            feeds_config = load_feeds_config()
+
+        # Optionally serve Prometheus metrics on the given port
+        metrics_port = os.getenv("METRICS_PORT")
+
+        # Event tracing is on unless TRACING is set to false
+        TRACER.enabled = env_flag("TRACING") or not os.getenv("TRACING")
+
+        # Optionally stream effects with the Hue Entertainment API
+        streaming = env_flag("HUE_ENTERTAINMENT")
+
+        # IP addresses of further bridges to pair, separated by commas
+        pair_ips = [ip.strip() for ip in os.getenv("HUE_BRIDGE_IPS", "").split(",")]
+        pair_ips = [ip for ip in pair_ips if ip]
 
-        # Construct the URL for the Chaturbate Events API
-        url = f"https://eventsapi.chaturbate.com/events/{user}/{token}"
+        # Optionally record the polled events, or replay a recording instead
+        record_file = os.getenv("RECORD_FILE")
+        replay_file = os.getenv("REPLAY_FILE")
+        replay_speed = float(os.getenv("REPLAY_SPEED", "1"))
+        if feeds_config and (record_file or replay_file):
+            raise ValueError(
+                "RECORD_FILE and REPLAY_FILE are not supported in multi-feed mode"
+            )
+
+        if not feeds_config and not replay_file:
+            user = os.getenv("USERNAME")
+            token = os.getenv("TOKEN")
+
+            # Check if username and token are set, and if not,
+            # prompt the user for the API token URL
+            if not user or not token:
+                user, token = prompt_for_api_url_and_save()
+
+            # Construct the URL for the Chaturbate Events API, which can be
+            # pointed at a local mock server with EVENTS_API_URL
+            url = os.getenv("EVENTS_API_URL", EVENTS_API_URL).format(
+                username=user, token=token
+            )
 
     except Exception as e:
         logging.getLogger("Main").error(f"Error loading environment variables: {e}")
         print("Please check the environment variables and try again.")
         return
 
+    light_ctrl = connect_task = checkpoint = recorder = commit = None
+    stream_tasks = []
+    metrics_server = None
+    profiler = Profiler()
     try:
-        # Initialize the Hue Bridge and Light Controller
-        logging.getLogger("Main").debug("Initializing Hue Bridge and Light Controller.")
-        hue = HueBridge()
-        light_ctrl = LightController(hue)
+        # Profile on SIGUSR1 and dump slow traces on SIGUSR2
+        install_signal_handlers(profiler, TRACER)
+
+        if metrics_port:
+            metrics_server = MetricsServer(
+                port=int(metrics_port), tracer=TRACER, profiler=profiler
+            )
+            await metrics_server.start()
+
+        if feeds_config:
+            from multi_feed import run_feeds
+
+            logging.getLogger("Main").info(
+                f"Starting multi-feed mode with {len(feeds_config.feeds)} feeds."
+            )
+            print("Starting program.")
+            await run_feeds(
+                feeds_config,
+                use_event_stream,
+                LOG_SETTINGS,
+                pair_ips=pair_ips,
+                streaming=streaming,
+            )
+            return
+
+        # Initialize the Hue bridges and a Light Controller for each. With saved
+        # credentials this does not touch the network, the bridges are connected
+        # below.
+        logging.getLogger("Main").debug("Initializing Hue Bridges and Controllers.")
+        light_ctrl = BridgeFanout.from_credentials(pair_ips, streaming)
 
         logging.getLogger("Main").debug("Initializing Event Handler and Poller.")
-        # Initialize the Event Handler
-        event_handler = EventHandler()
+        # Initialize the Event Handler with the rules mapping events to effects
+        event_handler = EventHandler(DispatchRegistry.from_file())
 
-        # Initialize the Event Poller with the required arguments
-        event_poller = EventPoller(url, API_TIMEOUT)
+        if replay_file:
+            from recorder import EventReplayer
+
+            # Replay recorded events in place of the Events API
+            events_gen = EventReplayer(replay_file, replay_speed).poll_events()
+        else:
+            # Initialize the Event Poller, resuming from the last checkpoint
+            checkpoint = EventCheckpoint()
+            event_poller = EventPoller(url, API_TIMEOUT, checkpoint=checkpoint)
+            events_gen = event_poller.poll_events()
+            commit = event_poller.commit
+
+        if record_file:
+            from recorder import EventRecorder
+
+            recorder = EventRecorder(record_file)
+            events_gen = recorder.tee(events_gen)
 
         logging.getLogger("Main").info("Starting program.")
         print("Starting program.")
 
-        # Start polling events and processing them
-        await event_handler.process_events(event_poller.poll_events(), light_ctrl)
+        # Start polling events and handling them in a staged pipeline
+        pipeline = EventPipeline(events_gen, event_handler, light_ctrl, commit)
+        pipeline_task = asyncio.create_task(pipeline.run())
+
+        # Connect to the bridges while the first long-poll is in flight
+        connect_task = asyncio.create_task(light_ctrl.connect())
+
+        if use_event_stream:
+            logging.getLogger("Main").debug("Subscribing to bridge event streams.")
+            stream_tasks = [
+                asyncio.create_task(bridge_stream.run())
+                for bridge_stream in light_ctrl.event_streams()
+            ]
+
+        await pipeline_task
 
     except Exception as e:
         logging.getLogger(__name__).exception(e)
@@ -114,8 +231,26 @@ async def main():
 
     finally:
         logging.getLogger("Main").info("Shutting down.")
+        for task in (*stream_tasks, connect_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        # Stop any effects that are still running and close the bridges
+        if light_ctrl:
+            await light_ctrl.close()
+        if checkpoint:
+            checkpoint.close()
+        if recorder:
+            recorder.close()
+        if metrics_server:
+            await metrics_server.stop()
+        await profiler.stop()
+
         # Align the log entries
-        log_aligner = LogAligner(file_path="app.log", delete_original=False)
+        from log_formatter import LogAligner
+
+        log_aligner = LogAligner(file_path=LOG_FILE_PATH, delete_original=False)
         await log_aligner.align_log_entries()
 
 
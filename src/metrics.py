@@ -0,0 +1,496 @@
+import logging
+from bisect import bisect_left
+
+from constants import METRICS_HOST, METRICS_PORT
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def format_labels(names, values, extra=()):
+    """
+    Format label pairs in the Prometheus text format.
+
+    Args:
+        names (tuple): Label names.
+        values (tuple): Label values.
+        extra (tuple): Additional name and value pairs.
+
+    Returns:
+        str: Label set including braces, or an empty string without labels.
+    """
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    """
+    Format a sample value in the Prometheus text format.
+
+    Args:
+        value (float): Sample value.
+
+    Returns:
+        str: Formatted value.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of metrics with an optional set of labels.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): Description of the metric.
+        labels (tuple): Label names.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns:
+            list: Lines of the metric.
+        """
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+    def samples(self):
+        """
+        Render the samples of the metric.
+
+        Returns:
+            list: Sample lines.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count per label set.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increase the counter.
+
+        Args:
+            *label_values: Values of the labels, in order.
+            amount (float): Amount to add. Defaults to 1.
+        """
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        """
+        Get the current count.
+
+        Args:
+            *label_values: Values of the labels, in order.
+
+        Returns:
+            float: Current count.
+        """
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        return [
+            f"{self.name}{format_labels(self.labels, values)} {format_value(value)}"
+            for values, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value per label set that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        """
+        Set the gauge.
+
+        Args:
+            value (float): New value.
+            *label_values: Values of the labels, in order.
+        """
+        self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets.
+
+    Observations only increment one bucket, and the cumulative counts expected
+    by Prometheus are computed when the metric is rendered.
+
+    Attributes:
+        buckets (tuple): Sorted upper bounds of the buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labels=()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value, *label_values):
+        """
+        Record an observation.
+
+        Args:
+            value (float): Observed value.
+            *label_values: Values of the labels, in order.
+        """
+        counts = self._counts.get(label_values)
+        if counts is None:
+            # The last slot counts observations above every bucket
+            counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+            self._sums[label_values] = 0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[label_values] += value
+
+    def count(self, *label_values):
+        """
+        Get the number of observations.
+
+        Args:
+            *label_values: Values of the labels, in order.
+
+        Returns:
+            int: Number of observations.
+        """
+        return sum(self._counts.get(label_values, ()))
+
+    def samples(self):
+        lines = []
+        for values, counts in self._counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                total += count
+                bound_label = (("le", format_value(bound)),)
+                labels = format_labels(self.labels, values, bound_label)
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {format_value(self._sums[values])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together.
+
+    Attributes:
+        metrics (dict): Metrics by name.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric (Metric): Metric to add.
+
+        Returns:
+            Metric: The added metric.
+
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+            str: Exposition text.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+POLL_SECONDS = REGISTRY.register(
+    Histogram("hue_events_poll_seconds", "Round-trip time of Events API polls.")
+)
+POLL_BATCH_SIZE = REGISTRY.register(
+    Histogram(
+        "hue_events_batch_size",
+        "Number of events per Events API response.",
+        buckets=BATCH_SIZE_BUCKETS,
+    )
+)
+POLL_ERRORS = REGISTRY.register(
+    Counter(
+        "hue_events_poll_errors_total",
+        "Failed Events API polls by kind of error.",
+        labels=("kind",),
+    )
+)
+POLL_BACKOFF_SECONDS = REGISTRY.register(
+    Counter(
+        "hue_events_backoff_seconds_total",
+        "Time spent waiting before retrying failed Events API polls.",
+    )
+)
+POLL_CIRCUIT_OPEN = REGISTRY.register(
+    Gauge(
+        "hue_events_poll_circuit_open",
+        "Whether polling is paused after repeated Events API failures.",
+    )
+)
+DISPATCH_SECONDS = REGISTRY.register(
+    Histogram(
+        "hue_event_dispatch_seconds",
+        "Time to match an event against the rules and queue its effect.",
+        buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1),
+        labels=("method",),
+    )
+)
+BRIDGE_COMMAND_SECONDS = REGISTRY.register(
+    Histogram(
+        "hue_bridge_command_seconds",
+        "Round-trip time of commands accepted by the bridge.",
+        labels=("bridge", "kind"),
+    )
+)
+BRIDGE_COMMAND_ERRORS = REGISTRY.register(
+    Counter(
+        "hue_bridge_command_errors_total",
+        "Commands rejected by the bridge or failed to send.",
+        labels=("bridge", "kind"),
+    )
+)
+BRIDGE_COMMAND_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "hue_bridge_command_queue_depth",
+        "Number of commands waiting in the scheduler to be sent to the bridge.",
+        labels=("bridge",),
+    )
+)
+BRIDGE_COMMAND_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "hue_bridge_command_wait_seconds",
+        "Time commands waited in the scheduler before being sent.",
+        labels=("bridge",),
+    )
+)
+BRIDGE_COMMAND_MAX_WAIT_SECONDS = REGISTRY.register(
+    Gauge(
+        "hue_bridge_command_max_wait_seconds",
+        "Longest time a command waited in the scheduler before being sent.",
+        labels=("bridge",),
+    )
+)
+EVENTS_SUPPRESSED = REGISTRY.register(
+    Counter(
+        "hue_events_suppressed_total",
+        "Matched events whose effect was suppressed by a rule cooldown.",
+        labels=("method",),
+    )
+)
+PIPELINE_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "hue_pipeline_queue_depth",
+        "Number of polled events waiting to be handled.",
+        labels=("feed",),
+    )
+)
+PIPELINE_BLOCKED_SECONDS = REGISTRY.register(
+    Counter(
+        "hue_pipeline_blocked_seconds_total",
+        "Time the poller waited for room in the full event queue.",
+        labels=("feed",),
+    )
+)
+PIPELINE_QUEUE_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "hue_pipeline_queue_wait_seconds",
+        "Time polled events waited in the event queue before being handled.",
+        labels=("feed",),
+    )
+)
+EFFECT_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "hue_effect_queue_depth",
+        "Number of effects waiting to be played.",
+        labels=("bridge",),
+    )
+)
+EFFECT_QUEUE_DISCARDED = REGISTRY.register(
+    Counter(
+        "hue_effect_queue_discarded_total",
+        "Effects dropped, expired or preempted by the effect queue.",
+        labels=("bridge", "reason"),
+    )
+)
+EVENT_TO_LIGHT_SECONDS = REGISTRY.register(
+    Histogram(
+        "hue_event_to_light_seconds",
+        "Time from receiving an event to the bridge accepting its first command.",
+    )
+)
+
+
+class MetricsServer:
+    """
+    HTTP server exposing the metrics in the Prometheus text format.
+
+    The server runs on the application's event loop. It also serves local
+    control endpoints: /debug/traces lists slow event traces, and /debug/profile
+    profiles the event loop for a number of seconds.
+
+    Attributes:
+        registry (MetricsRegistry): Metrics to expose.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        tracer (Tracer): Tracer whose traces are served, or None.
+        profiler (Profiler): Profiler started on request, or None.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        registry=REGISTRY,
+        host=METRICS_HOST,
+        port=METRICS_PORT,
+        tracer=None,
+        profiler=None,
+    ):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.tracer = tracer
+        self.profiler = profiler
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._runner = None
+
+    async def start(self):
+        """
+        Start serving /metrics.
+        """
+        # The server side of aiohttp is only imported when metrics are served
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        if self.tracer:
+            app.router.add_get("/debug/traces", self.handle_traces)
+        if self.profiler:
+            app.router.add_post("/debug/profile", self.handle_profile)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        """
+        Stop the server.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request):
+        """
+        Respond with the current metrics.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Exposition text.
+        """
+        from aiohttp import web
+
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    async def handle_traces(self, request):
+        """
+        Respond with slow event traces.
+
+        The optional min_ms query parameter lowers or raises the latency a
+        trace needs to be listed.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Traces as JSON, oldest first.
+        """
+        from aiohttp import web
+
+        try:
+            min_ms = request.query.get("min_ms")
+            min_duration = float(min_ms) / 1000 if min_ms else None
+        except ValueError:
+            raise web.HTTPBadRequest(text="min_ms must be a number")
+        traces = self.tracer.traces(min_duration)
+        return web.json_response([trace.to_dict() for trace in traces])
+
+    async def handle_profile(self, request):
+        """
+        Start profiling the event loop.
+
+        The optional seconds query parameter sets how long to profile.
+
+        Args:
+            request (aiohttp.web.Request): Incoming request.
+
+        Returns:
+            aiohttp.web.Response: Path the profile will be written to.
+        """
+        from aiohttp import web
+
+        try:
+            seconds = float(request.query.get("seconds", 0)) or None
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds must be a number")
+        file_path = self.profiler.start(seconds)
+        if file_path is None:
+            raise web.HTTPConflict(text="A profile is already being taken")
+        return web.json_response({"file": file_path}, status=202)
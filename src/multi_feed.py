@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from os import path
+
+import yaml
+
+from bridge_fanout import BridgeFanout
+from checkpoint import EventCheckpoint
+from constants import (
+    API_TIMEOUT,
+    EVENTS_API_URL,
+    FEEDS_FILE_PATH,
+    HTTP_POOL_LIMIT,
+    RULES_FILE_PATH,
+)
+from dispatch import DispatchRegistry, load_rules
+from event_handler import EventHandler
+from event_poller import EventPoller
+from http_session import create_session
+from logging_setup import configure_logging
+from pipeline import EventPipeline
+from tracing import TRACER
+
+# Feed names become part of checkpoint file names
+FEED_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+@dataclass(frozen=True)
+class FeedConfig:
+    """
+    Configuration of a single Events API feed.
+
+    Attributes:
+        name (str): Name of the feed, used for its checkpoint and logs.
+        url (str): Base URL of the feed.
+        rules (tuple): Rule definitions routing the feed's events to effects.
+    """
+
+    name: str
+    url: str
+    rules: tuple
+
+
+@dataclass(frozen=True)
+class FeedsConfig:
+    """
+    Configuration of multi-feed mode.
+
+    Attributes:
+        feeds (tuple): Feeds to poll.
+        shards (int): Number of processes the feeds are split across.
+        pool_limit (int): Maximum pooled connections per process.
+    """
+
+    feeds: tuple
+    shards: int = 1
+    pool_limit: int = HTTP_POOL_LIMIT
+
+
+def load_feed_rules(feed):
+    """
+    Get the rules of a feed from the feed entry, its rules file or the defaults.
+
+    Rules without a group use the feed's group, so each room can drive its own
+    lights.
+
+    Args:
+        feed (dict): Feed entry from the feeds file.
+
+    Returns:
+        tuple: Rule definitions.
+    """
+    rules = feed.get("rules")
+    if rules is None:
+        rules = load_rules(feed.get("rules_file", RULES_FILE_PATH))
+
+    group = feed.get("group")
+    if group is not None:
+        rules = [{"group": group, **rule} for rule in rules]
+    return tuple(rules)
+
+
+def load_feeds_config(file_path=FEEDS_FILE_PATH):
+    """
+    Load the multi-feed configuration.
+
+    Args:
+        file_path (str): Path to the feeds file.
+
+    Returns:
+        FeedsConfig: Configuration, or None if the file does not exist.
+
+    Raises:
+        ValueError: If no feeds are listed, or a feed has an invalid or duplicate
+            name or is missing its credentials.
+    """
+    if not path.exists(file_path):
+        return None
+    with open(file_path, "r") as file:
+        config = yaml.safe_load(file) or {}
+
+    feeds = []
+    names = set()
+    for index, feed in enumerate(config.get("feeds") or []):
+        name = str(feed.get("name", f"feed-{index}"))
+        if not FEED_NAME_PATTERN.fullmatch(name):
+            raise ValueError(
+                f"Feed name '{name}' may only contain letters, digits, '_', '-' "
+                "and '.', and may not start with '.'"
+            )
+        if name in names:
+            raise ValueError(f"Feed name '{name}' is used more than once")
+        names.add(name)
+        url = feed.get("url")
+        if not url:
+            try:
+                url = EVENTS_API_URL.format(
+                    username=feed["username"], token=feed["token"]
+                )
+            except KeyError as e:
+                raise ValueError(f"Feed '{name}' is missing {e}") from e
+        feeds.append(FeedConfig(name, url, load_feed_rules(feed)))
+    if not feeds:
+        raise ValueError(f"{file_path} lists no feeds")
+
+    return FeedsConfig(
+        feeds=tuple(feeds),
+        shards=max(1, int(config.get("shards", 1))),
+        pool_limit=int(config.get("pool_limit", HTTP_POOL_LIMIT)),
+    )
+
+
+class FeedManager:
+    """
+    Class to poll many Events API feeds on one event loop.
+
+    All feeds share one connection pool. Each feed has its own checkpoint, rules
+    and pipeline.
+
+    Attributes:
+        feeds (tuple): Feeds to poll.
+        light_controller (BridgeFanout): Light controllers shared by the feeds.
+        pool_limit (int): Maximum pooled connections.
+        pipelines (dict): Pipeline of each feed by name.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, feeds, light_controller, pool_limit=HTTP_POOL_LIMIT):
+        self.feeds = feeds
+        self.light_controller = light_controller
+        self.pool_limit = pool_limit
+        self.pipelines = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(self):
+        """
+        Poll every feed concurrently until cancelled.
+        """
+        # Long-polls hold a connection each, so the pool must fit every feed
+        limit = max(self.pool_limit, len(self.feeds) + 1)
+        checkpoints = []
+        async with create_session(limit=limit) as session:
+            for feed in self.feeds:
+                checkpoint = EventCheckpoint(f"checkpoint-{feed.name}.json")
+                checkpoints.append(checkpoint)
+                poller = EventPoller(
+                    feed.url, API_TIMEOUT, checkpoint=checkpoint, session=session
+                )
+                self.pipelines[feed.name] = EventPipeline(
+                    poller.poll_events(),
+                    EventHandler(DispatchRegistry(feed.rules)),
+                    self.light_controller,
+                    poller.commit,
+                    feed=feed.name,
+                )
+
+            self.logger.info(f"Polling {len(self.feeds)} feeds.")
+            try:
+                await asyncio.gather(
+                    *(pipeline.run() for pipeline in self.pipelines.values())
+                )
+            finally:
+                for checkpoint in checkpoints:
+                    checkpoint.close()
+
+    def stats(self):
+        """
+        Snapshot of the pipeline metrics of every feed.
+
+        Returns:
+            dict: Pipeline stats by feed name.
+        """
+        return {name: pipeline.stats() for name, pipeline in self.pipelines.items()}
+
+
+class ShardLightController:
+    """
+    Light controller of a shard process, forwarding effects to the parent.
+
+    Only the parent process talks to the bridges, so all shards share its
+    command schedulers and rate limits, and only the parent writes the scene
+    cache and credentials.
+
+    Attributes:
+        requests (queue.Queue): Effect requests read by the parent process.
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def play_effect(
+        self, effect, group_id, received_at=None, trace_id=None, priority=0
+    ):
+        """
+        Forward an effect to the parent process.
+
+        The trace of the triggering event ends here, as the parent process does
+        not share the shard's tracer.
+
+        Args:
+            effect (str): Name of the effect.
+            group_id (str): Logical group name or group ID.
+            received_at (float): Monotonic time the triggering event was received.
+                Defaults to None.
+            trace_id (str): ID of the trace of the triggering event. Defaults to
+                None.
+            priority (int): Priority, higher values are played first and preempt
+                lower ones. Defaults to 0.
+
+        Returns:
+            bool: True, whether the effect is queued is decided by the parent.
+        """
+        self.requests.put((effect, group_id, received_at, None, priority))
+        TRACER.end(trace_id)
+        return True
+
+
+async def forward_effects(requests, light_controller):
+    """
+    Play the effects requested by the shard processes until a None request.
+
+    Args:
+        requests (queue.Queue): Effect requests of the shard processes.
+        light_controller (BridgeFanout): Light controllers of the bridges.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        request = await loop.run_in_executor(None, requests.get)
+        if request is None:
+            return
+        light_controller.play_effect(*request)
+
+
+def run_shard(feeds, pool_limit, requests, log_settings=None):
+    """
+    Entry point of a shard process.
+
+    Logging is configured again first, as a new process does not inherit the
+    handlers, and a forked one inherits a queue no listener thread reads.
+
+    Args:
+        feeds (tuple): Feeds to poll.
+        pool_limit (int): Maximum pooled connections.
+        requests (queue.Queue): Effect requests read by the parent process.
+        log_settings (dict): Keyword arguments for configure_logging.
+    """
+    listener = configure_logging(**(log_settings or {}))
+    manager = FeedManager(feeds, ShardLightController(requests), pool_limit)
+    try:
+        asyncio.run(manager.run())
+    finally:
+        # Pool workers exit without running atexit handlers
+        if listener:
+            listener.stop()
+
+
+async def run_shards(config, shards, light_controller, log_settings=None):
+    """
+    Poll the feeds in shard processes and play their effects in this one.
+
+    Args:
+        config (FeedsConfig): Multi-feed configuration.
+        shards (int): Number of shard processes.
+        light_controller (BridgeFanout): Light controllers of the bridges.
+        log_settings (dict): Keyword arguments for configure_logging in the
+            shard processes.
+    """
+    logging.getLogger("FeedManager").info(f"Splitting feeds across {shards} shards.")
+    loop = asyncio.get_running_loop()
+    with multiprocessing.Manager() as sync_manager:
+        requests = sync_manager.Queue()
+        forwarder = asyncio.create_task(forward_effects(requests, light_controller))
+        try:
+            with ProcessPoolExecutor(max_workers=shards) as executor:
+                await asyncio.gather(
+                    *(
+                        loop.run_in_executor(
+                            executor,
+                            run_shard,
+                            config.feeds[shard::shards],
+                            config.pool_limit,
+                            requests,
+                            log_settings,
+                        )
+                        for shard in range(shards)
+                    )
+                )
+        finally:
+            # Wakes up the forwarder, whose thread cannot be cancelled
+            requests.put(None)
+            await asyncio.gather(forwarder, return_exceptions=True)
+
+
+async def run_feeds(
+    config, use_event_stream=False, log_settings=None, pair_ips=(), streaming=False
+):
+    """
+    Run multi-feed mode, splitting the feeds across processes if configured.
+
+    The bridge connections stay in this process in either case.
+
+    Args:
+        config (FeedsConfig): Multi-feed configuration.
+        use_event_stream (bool): Whether to subscribe to the bridge event stream.
+        log_settings (dict): Keyword arguments for configure_logging in the
+            shard processes.
+        pair_ips (iterable): IP addresses of bridges to pair if they are not
+            saved yet. Defaults to none.
+        streaming (bool): Whether to stream effects with the Hue Entertainment
+            API where possible. Defaults to False.
+    """
+    light_ctrl = BridgeFanout.from_credentials(pair_ips, streaming)
+    # Connect to the bridges while the first long-polls are in flight
+    connect_task = asyncio.create_task(light_ctrl.connect())
+    stream_tasks = []
+    if use_event_stream:
+        stream_tasks = [
+            asyncio.create_task(bridge_stream.run())
+            for bridge_stream in light_ctrl.event_streams()
+        ]
+    try:
+        shards = min(config.shards, len(config.feeds))
+        if shards <= 1:
+            await FeedManager(config.feeds, light_ctrl, config.pool_limit).run()
+        else:
+            await run_shards(config, shards, light_ctrl, log_settings)
+    finally:
+        for task in (*stream_tasks, connect_task):
+            task.cancel()
+        await asyncio.gather(*stream_tasks, connect_task, return_exceptions=True)
+        await light_ctrl.close()
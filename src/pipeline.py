@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from constants import PIPELINE_DRAIN_TIMEOUT, PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS
+from metrics import (
+    PIPELINE_BLOCKED_SECONDS,
+    PIPELINE_QUEUE_DEPTH,
+    PIPELINE_QUEUE_WAIT_SECONDS,
+)
+from tracing import TRACER
+
+
+class EventPipeline:
+    """
+    Staged pipeline between the event poller and the event handler.
+
+    The poller feeds a bounded queue and a pool of workers handles the queued
+    events, so the next long-poll is in flight while earlier events are handled.
+    When the queue is full the poller waits, which bounds memory under load.
+
+    A batch is committed only once every one of its events has been handled.
+    Batches are committed in the order they were polled, so a crash or a drain
+    timeout never commits events that are still queued.
+
+    Attributes:
+        events_gen (generator): Generator for events.
+        event_handler (EventHandler): Handler for single events.
+        light_controller (LightController): Light controller instance.
+        commit (callable): Called without arguments for each handled batch, in
+            polling order, or None.
+        queue (asyncio.Queue): Bounded queue of events waiting to be handled.
+        workers (int): Number of handler workers.
+        drain_timeout (float): Time in seconds to finish queued events on shutdown.
+        feed (str): Name of the feed, used to label the pipeline metrics.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        events_gen,
+        event_handler,
+        light_controller,
+        commit=None,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        workers=PIPELINE_WORKERS,
+        drain_timeout=PIPELINE_DRAIN_TIMEOUT,
+        feed="",
+    ):
+        self.events_gen = events_gen
+        self.event_handler = event_handler
+        self.light_controller = light_controller
+        self.commit = commit
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.feed = feed
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._worker_tasks = []
+        # Number of unhandled events of each uncommitted batch, oldest first
+        self._pending = deque()
+        self._batches = 0
+        self._enqueued = 0
+        self._handled = 0
+        self._errors = 0
+        self._max_depth = 0
+        self._blocked_time = 0.0
+        self._queue_wait = 0.0
+        self._handle_time = 0.0
+
+    def stats(self):
+        """
+        Snapshot of the pipeline metrics.
+
+        Returns:
+            dict: Per-stage counters, queue depth and timings in seconds.
+        """
+        handled = self._handled or 1
+        return {
+            "batches": self._batches,
+            "enqueued": self._enqueued,
+            "handled": self._handled,
+            "errors": self._errors,
+            "depth": self.queue.qsize(),
+            "uncommitted_batches": len(self._pending),
+            "max_depth": self._max_depth,
+            "producer_blocked": self._blocked_time,
+            "average_queue_wait": self._queue_wait / handled,
+            "average_handle_time": self._handle_time / handled,
+        }
+
+    async def run(self):
+        """
+        Run the pipeline until the event generator ends or the task is cancelled.
+
+        Queued events are drained before the workers are stopped.
+        """
+        self._worker_tasks = [
+            asyncio.create_task(self._work(), name=f"pipeline-worker-{number}")
+            for number in range(self.workers)
+        ]
+        try:
+            await self._produce()
+        finally:
+            await self.drain()
+
+    async def drain(self):
+        """
+        Wait for queued events to be handled, then stop the workers.
+        """
+        if self.queue.qsize():
+            self.logger.info(f"Draining {self.queue.qsize()} queued events.")
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(
+                f"Dropped {self._enqueued - self._handled} events not handled "
+                f"within {self.drain_timeout} seconds, their batches are not "
+                f"committed"
+            )
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def _produce(self):
+        """
+        Move events from the generator into the queue.
+        """
+        async for events in self.events_gen:
+            self._batches += 1
+            batch = [len(events)]
+            self._pending.append(batch)
+            for event in events:
+                started = time.monotonic()
+                await self.queue.put((event, started, batch))
+                blocked = time.monotonic() - started
+                self._blocked_time += blocked
+                self._enqueued += 1
+                self._max_depth = max(self._max_depth, self.queue.qsize())
+                PIPELINE_QUEUE_DEPTH.set(self.queue.qsize(), self.feed)
+                PIPELINE_BLOCKED_SECONDS.inc(self.feed, amount=blocked)
+            # An empty batch has nothing to wait for
+            self._commit_handled()
+
+    async def _work(self):
+        """
+        Handle queued events until cancelled.
+        """
+        while True:
+            event, enqueued_at, batch = await self.queue.get()
+            started = time.monotonic()
+            self._queue_wait += started - enqueued_at
+            PIPELINE_QUEUE_DEPTH.set(self.queue.qsize(), self.feed)
+            PIPELINE_QUEUE_WAIT_SECONDS.observe(started - enqueued_at, self.feed)
+            TRACER.add(event.id, "queue", enqueued_at, started)
+            try:
+                await self.event_handler.process_event(event, self.light_controller)
+            except Exception as e:
+                self._errors += 1
+                self.logger.error("Error handling event: %s", e)
+            finally:
+                self._handle_time += time.monotonic() - started
+                self._handled += 1
+                self.queue.task_done()
+            # Skipped when cancelled, so an interrupted event is not committed
+            batch[0] -= 1
+            self._commit_handled()
+
+    def _commit_handled(self):
+        """
+        Commit the oldest batches whose events have all been handled.
+        """
+        while self._pending and not self._pending[0][0]:
+            self._pending.popleft()
+            if self.commit is None:
+                continue
+            try:
+                self.commit()
+            except Exception as e:
+                self.logger.error("Error committing batch: %s", e)
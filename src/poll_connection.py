@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import nullcontext
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from constants import (
+    API_TIMEOUT,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    INITIAL_RETRY_DELAY,
+    MAX_RETRY_DELAY,
+    POLL_CONNECT_TIMEOUT,
+    POLL_READ_MARGIN,
+    RETRY_FACTOR,
+)
+from http_session import create_session
+from metrics import POLL_BACKOFF_SECONDS, POLL_CIRCUIT_OPEN, POLL_ERRORS
+
+# Longest time the Events API holds a long-poll open in seconds
+MAX_SERVER_TIMEOUT = 90
+
+
+def with_server_timeout(url, timeout):
+    """
+    Set the server-side long-poll timeout of an Events API URL.
+
+    Args:
+        url (str): Events API URL, possibly with a cursor.
+        timeout (int): Time in seconds the server holds the poll open.
+
+    Returns:
+        str: URL with the timeout parameter.
+    """
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != "timeout"]
+    query.append(("timeout", str(timeout)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter.
+
+    Half of each delay is random, so many clients retrying after the same
+    outage spread out instead of retrying together.
+
+    Attributes:
+        initial (float): First delay in seconds.
+        factor (float): Factor by which the delay grows after each failure.
+        maximum (float): Maximum delay in seconds.
+        attempts (int): Failures since the last success.
+    """
+
+    def __init__(
+        self, initial=INITIAL_RETRY_DELAY, factor=RETRY_FACTOR, maximum=MAX_RETRY_DELAY
+    ):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        Get the delay before the next retry.
+
+        Returns:
+            float: Delay in seconds.
+        """
+        ceiling = min(self.maximum, self.initial * self.factor**self.attempts)
+        self.attempts += 1
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def reset(self):
+        """
+        Start over from the first delay.
+        """
+        self.attempts = 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker stopping polls while the Events API keeps failing.
+
+    After enough consecutive failures the circuit opens, and no poll is made
+    until the reset timeout has passed. Then a single trial poll is made, which
+    closes the circuit if it succeeds or opens it again if it fails.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Time in seconds the circuit stays open.
+        failures (int): Consecutive failures.
+        opened_at (float): Monotonic time the circuit opened, or None if closed.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        """
+        Whether the circuit is open.
+        """
+        return self.opened_at is not None
+
+    def retry_after(self):
+        """
+        Time until the next poll is allowed.
+
+        Returns:
+            float: Delay in seconds, 0 if the circuit is closed.
+        """
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        """
+        Close the circuit after a successful poll.
+        """
+        self.failures = 0
+        self.opened_at = None
+        POLL_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        """
+        Count a failed poll and open the circuit if there were too many.
+
+        Returns:
+            bool: True if the circuit opened.
+        """
+        self.failures += 1
+        # A failed trial poll opens the circuit again right away
+        if self.is_open or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            POLL_CIRCUIT_OPEN.set(1)
+            return True
+        return False
+
+
+class PollConnection:
+    """
+    Keep-alive connection to the Events API for long-polling.
+
+    Each poll asks the server to hold the request for the server timeout, and
+    the client waits slightly longer for the response. Connecting has its own
+    short timeout, so an unreachable server is noticed in seconds. The session
+    keeps the connection alive between polls, so each poll goes out on an open
+    connection. Failed polls are retried with jittered exponential backoff
+    behind a circuit breaker, and a connection is warmed up towards the end of
+    each wait, so the retry does not pay for connecting either.
+
+    Attributes:
+        session (aiohttp.ClientSession): Shared session, or None to open one.
+        server_timeout (int): Time in seconds the server holds a poll open.
+        timeout (aiohttp.ClientTimeout): Client timeouts of a poll.
+        backoff (Backoff): Delays between retries.
+        breaker (CircuitBreaker): Circuit breaker for repeated failures.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        session=None,
+        server_timeout=API_TIMEOUT,
+        connect_timeout=POLL_CONNECT_TIMEOUT,
+        read_margin=POLL_READ_MARGIN,
+    ):
+        self.session = session
+        self.server_timeout = min(int(server_timeout), MAX_SERVER_TIMEOUT)
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=self.server_timeout + read_margin,
+        )
+        self.backoff = Backoff()
+        self.breaker = CircuitBreaker()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # Session and URL of the last poll, warmed up before retrying it
+        self._target = None
+
+    def open(self):
+        """
+        Get a context manager for the session used to poll.
+
+        A shared session is left open for the other pollers using it.
+
+        Returns:
+            contextlib.AbstractAsyncContextManager: Context yielding the session.
+        """
+        if self.session:
+            return nullcontext(self.session)
+        return create_session()
+
+    def get(self, session, url):
+        """
+        Start a long-poll request.
+
+        Args:
+            session (aiohttp.ClientSession): Session to poll with.
+            url (str): Events API URL.
+
+        Returns:
+            contextlib.AbstractAsyncContextManager: Context yielding the response.
+        """
+        self._target = (session, url)
+        return session.get(
+            with_server_timeout(url, self.server_timeout), timeout=self.timeout
+        )
+
+    def succeeded(self):
+        """
+        Record a successful poll.
+        """
+        self.backoff.reset()
+        self.breaker.record_success()
+
+    async def failed(self, kind, retry_after=None):
+        """
+        Record a failed poll and wait before the next one.
+
+        Args:
+            kind (str): Kind of error, e.g. "server", "client" or "timeout".
+            retry_after (float): Minimum delay in seconds requested by the server.
+                Defaults to None.
+        """
+        POLL_ERRORS.inc(kind)
+        if self.breaker.record_failure():
+            self.logger.warning(
+                f"Events API failed {self.breaker.failures} times in a row, "
+                f"pausing polls for {self.breaker.reset_timeout} seconds."
+            )
+            delay = self.breaker.retry_after()
+        else:
+            delay = self.backoff.next_delay()
+        if retry_after:
+            delay = max(delay, retry_after)
+        POLL_BACKOFF_SECONDS.inc(amount=delay)
+        self.logger.debug(f"Waiting {delay:.1f} seconds before retrying...")
+        # Connecting may take up to the connect timeout, so start that early
+        lead = min(delay, self.timeout.sock_connect)
+        await asyncio.sleep(delay - lead)
+        await asyncio.gather(asyncio.sleep(lead), self.warm_up())
+
+    async def warm_up(self):
+        """
+        Open a keep-alive connection to the Events API for the next poll.
+
+        An OPTIONS request to the server's root opens the connection, which is
+        returned to the session's pool once answered. aiohttp does not pool the
+        connection of a HEAD request.
+
+        Returns:
+            bool: True if the server answered.
+        """
+        if self._target is None:
+            return False
+        session, url = self._target
+        parts = urlsplit(url)
+        root = urlunsplit((parts.scheme, parts.netloc, "/", "", ""))
+        timeout = aiohttp.ClientTimeout(total=self.timeout.sock_connect)
+        try:
+            async with session.options(root, timeout=timeout) as response:
+                await response.read()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.debug(f"Connection warm-up failed: {error!r}")
+            return False
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import signal
+import time
+
+from constants import PROFILE_FILE_PATH, PROFILE_SECONDS
+
+
+class Profiler:
+    """
+    Class to profile the running event loop on demand.
+
+    The profiler is switched on in the event loop thread for a number of seconds
+    and writes a cProfile file, which can be read with pstats or snakeviz. The
+    program does not need to be restarted under cProfile.
+
+    Attributes:
+        seconds (float): Default time in seconds to profile.
+        file_path (str): Pattern of the profile file, formatted with a timestamp.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, seconds=PROFILE_SECONDS, file_path=PROFILE_FILE_PATH):
+        self.seconds = seconds
+        self.file_path = file_path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._task = None
+
+    @property
+    def running(self):
+        """
+        Whether a profile is being taken.
+        """
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds=None):
+        """
+        Start profiling in the background.
+
+        Must be called from the event loop thread.
+
+        Args:
+            seconds (float): Time in seconds to profile. Defaults to the
+                profiler's default.
+
+        Returns:
+            str: Path the profile will be written to, or None if a profile is
+                already being taken.
+        """
+        if self.running:
+            self.logger.warning("A profile is already being taken.")
+            return None
+        seconds = seconds or self.seconds
+        file_path = self.file_path.format(timestamp=time.strftime("%Y%m%d-%H%M%S"))
+        self._task = asyncio.get_running_loop().create_task(
+            self._profile(seconds, file_path)
+        )
+        return file_path
+
+    async def _profile(self, seconds, file_path):
+        """
+        Profile the event loop thread and write the profile file.
+
+        Args:
+            seconds (float): Time in seconds to profile.
+            file_path (str): Path to the profile file.
+        """
+        # Only imported when a profile is taken
+        import cProfile
+
+        self.logger.info(f"Profiling for {seconds} seconds.")
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            profile.dump_stats(file_path)
+            self.logger.info(f"Wrote profile to {file_path}")
+
+    async def stop(self):
+        """
+        Stop a running profile, writing what was recorded.
+        """
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def install_signal_handlers(profiler, tracer):
+    """
+    Profile on SIGUSR1 and dump slow traces on SIGUSR2.
+
+    Does nothing on platforms without these signals.
+
+    Args:
+        profiler (Profiler): Profiler to start.
+        tracer (Tracer): Tracer whose slow traces are dumped.
+    """
+    loop = asyncio.get_running_loop()
+    handlers = {"SIGUSR1": profiler.start, "SIGUSR2": tracer.dump}
+    for name, handler in handlers.items():
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        try:
+            loop.add_signal_handler(signum, handler)
+        except (NotImplementedError, RuntimeError):
+            return
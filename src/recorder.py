@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+import json
+import logging
+import time
+from dataclasses import fields
+
+from constants import RECORD_FLUSH_INTERVAL
+from event_decoder import Event
+from tracing import TRACER
+
+# Event fields stored in a recording, the receive time is stored per batch
+RECORDED_FIELDS = tuple(
+    field.name for field in fields(Event) if field.name != "received_at"
+)
+
+
+class EventRecorder:
+    """
+    Class to record event batches to a compressed NDJSON file.
+
+    Each run appends a gzip member starting with a header line naming the
+    event fields. Every following line is one batch: its wall-clock arrival
+    time and its events as lists of field values. Appended members form a
+    valid gzip file, so recordings of several runs can be replayed as one.
+
+    Attributes:
+        file_path (str): Path to the recording.
+        flush_interval (float): Minimum time in seconds between flushes.
+        batches (int): Number of batches recorded.
+        events (int): Number of events recorded.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, file_path, flush_interval=RECORD_FLUSH_INTERVAL):
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.events = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._file = gzip.open(file_path, "at", encoding="utf-8")
+        self._flushed_at = time.monotonic()
+        self._write({"fields": RECORDED_FIELDS, "started": time.time()})
+
+    def record(self, events, at=None):
+        """
+        Append a batch of events.
+
+        Args:
+            events (list): Decoded events.
+            at (float): Wall-clock arrival time of the batch. Defaults to now.
+        """
+        rows = [[getattr(event, name) for name in RECORDED_FIELDS] for event in events]
+        self._write([time.time() if at is None else at, rows])
+        self.batches += 1
+        self.events += len(events)
+
+        # Flushing ends a deflate block, so it is limited to keep the file small
+        now = time.monotonic()
+        if now - self._flushed_at >= self.flush_interval:
+            self._file.flush()
+            self._flushed_at = now
+
+    async def tee(self, events_gen):
+        """
+        Record every batch of an event generator while passing it on.
+
+        Args:
+            events_gen (AsyncGenerator): Generator of event batches.
+
+        Yields:
+            list: Batches of events, unchanged.
+        """
+        async for events in events_gen:
+            self.record(events)
+            yield events
+
+    def close(self):
+        """
+        Flush and close the recording.
+        """
+        self._file.close()
+        self.logger.info(
+            f"Recorded {self.events} events in {self.batches} batches "
+            f"to {self.file_path}"
+        )
+
+    def _write(self, record):
+        """
+        Write one NDJSON line.
+
+        Args:
+            record (object): JSON-serializable record.
+        """
+        self._file.write(json.dumps(record, separators=(",", ":")))
+        self._file.write("\n")
+
+
+def read_recording(file_path):
+    """
+    Read the batches of a recording.
+
+    Args:
+        file_path (str): Path to the recording.
+
+    Yields:
+        tuple: Number of the recorded run, wall-clock arrival time and list of
+            events of each batch.
+    """
+    names = RECORDED_FIELDS
+    run = 0
+    with gzip.open(file_path, "rt", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                # Header of a run, recorded with these fields
+                names = record["fields"]
+                run += 1
+                continue
+            at, rows = record
+            yield run, at, [Event(**dict(zip(names, row))) for row in rows]
+
+
+class EventReplayer:
+    """
+    Class to replay a recording as an event source.
+
+    The replayer stands in for EventPoller.poll_events. Batches are released
+    with their recorded spacing divided by the speed, or back to back when the
+    speed is 0. The pause between recorded runs is skipped. Each event gets the
+    time it was released as its receive time, so latency is measured from the
+    replayed arrival.
+
+    Attributes:
+        file_path (str): Path to the recording.
+        speed (float): Replay speed, 1 for real time, 0 for as fast as possible.
+        batches (int): Number of batches replayed.
+        events (int): Number of events replayed.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, file_path, speed=1.0):
+        self.file_path = file_path
+        self.speed = speed
+        self.batches = 0
+        self.events = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def poll_events(self):
+        """
+        Replay the recorded batches.
+
+        Yields:
+            list: List of events.
+        """
+        started = time.monotonic()
+        current_run = first_at = None
+        for run, at, events in read_recording(self.file_path):
+            if run != current_run:
+                current_run = run
+                first_at = at
+                run_started = time.monotonic()
+            if self.speed:
+                # Scheduled from the start, so sleep overshoot does not add up
+                due = run_started + (at - first_at) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # Let the consumers run between batches
+                await asyncio.sleep(0)
+
+            received_at = time.monotonic()
+            for event in events:
+                event.received_at = received_at
+            TRACER.begin_batch(events, received_at)
+            self.batches += 1
+            self.events += len(events)
+            yield events
+
+        elapsed = time.monotonic() - started
+        self.logger.info(
+            f"Replayed {self.events} events in {self.batches} batches "
+            f"in {elapsed:.1f} seconds"
+        )
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from command_scheduler import GROUPS
+from constants import SCENE_CACHE_FILE_PATH, SCENE_CACHE_SIZE
+
+
+def content_hash(username, lightstates):
+    """
+    Hash light states into a stable key.
+
+    Args:
+        username (str): Username for the Hue bridge, so bridges do not share keys.
+        lightstates (dict): State for each light ID.
+
+    Returns:
+        str: Hex digest of the states.
+    """
+    content = json.dumps([username, lightstates], sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+class SceneCache:
+    """
+    Bridge scenes provisioned for sets of light states, keyed by content hash.
+
+    A scene is created on the bridge the first time a set of light states is
+    needed and recalled afterwards, so every light of a group is set with one
+    group command instead of one command per light. The scene IDs are kept in a
+    file so scenes are reused across restarts. Scenes are created and deleted
+    through the command scheduler, charged to the bridge-wide group bucket, so
+    they do not push group commands over the bridge's limit.
+
+    Attributes:
+        client (BridgeClient): Async client for the bridge.
+        scheduler (CommandScheduler): Scheduler pacing the bridge writes.
+        file_path (str): Path to the scene cache file.
+        max_scenes (int): Maximum number of provisioned scenes.
+        scenes (OrderedDict): Scene ID for each content hash, oldest first.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        client,
+        scheduler,
+        file_path=SCENE_CACHE_FILE_PATH,
+        max_scenes=SCENE_CACHE_SIZE,
+    ):
+        self.client = client
+        self.scheduler = scheduler
+        self.file_path = file_path
+        self.max_scenes = max_scenes
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.scenes = self._load()
+
+    async def scene_for(self, lightstates):
+        """
+        Get a scene holding light states, creating it if needed.
+
+        Args:
+            lightstates (dict): State for each light ID.
+
+        Returns:
+            str: Scene ID.
+        """
+        key = content_hash(self.client.username, lightstates)
+        scene_id = self.scenes.get(key)
+        if scene_id:
+            self.scenes.move_to_end(key)
+            return scene_id
+
+        result = await self.scheduler.request(
+            GROUPS,
+            "create",
+            "scenes",
+            name=f"hue-events {key[:8]}",
+            type="LightScene",
+            lights=sorted(lightstates),
+            lightstates=lightstates,
+            # Allows the bridge to remove the scene when it runs out of space
+            recycle=True,
+        )
+        scene_id = result[0]["success"]["id"]
+        self.logger.debug("Created scene %s for %d lights", scene_id, len(lightstates))
+        self.scenes[key] = scene_id
+        await self._evict()
+        self._save()
+        return scene_id
+
+    def forget(self, scene_id):
+        """
+        Drop a scene that no longer exists on the bridge.
+
+        Args:
+            scene_id (str): Scene ID.
+        """
+        for key, cached_id in list(self.scenes.items()):
+            if cached_id == scene_id:
+                del self.scenes[key]
+        self._save()
+
+    async def _evict(self):
+        """
+        Delete the least recently used scenes above the limit from the bridge.
+        """
+        while len(self.scenes) > self.max_scenes:
+            _, scene_id = self.scenes.popitem(last=False)
+            try:
+                await self.scheduler.request(GROUPS, "delete", "scenes", scene_id)
+            except Exception as e:
+                self.logger.warning(f"Error deleting scene {scene_id}: {e}")
+
+    def _load(self):
+        """
+        Load the scene cache file.
+
+        Returns:
+            OrderedDict: Scene ID for each content hash.
+        """
+        try:
+            with open(self.file_path, "r") as file:
+                return OrderedDict(json.load(file))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    def _save(self):
+        """
+        Write the scene cache file.
+        """
+        temp_path = f"{self.file_path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(self.scenes, file)
+            os.replace(temp_path, self.file_path)
+        except OSError as e:
+            self.logger.error(f"Error writing file {self.file_path}: {e}")
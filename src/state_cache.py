@@ -0,0 +1,183 @@
+import logging
+import time
+
+from command_scheduler import GROUPS, LIGHTS, STATE_PATHS
+from constants import STATE_CACHE_TTL
+
+# Group 0 is the special group containing every light on the bridge
+ALL_LIGHTS_GROUP = "0"
+
+# Color mode the bridge switches to when each attribute is written
+COLOR_MODES = {"xy": "xy", "ct": "ct", "hue": "hs", "sat": "hs"}
+
+
+class StateCache:
+    """
+    In-process cache of light and group resources read from the Hue bridge.
+
+    Entries expire after a TTL. Commands sent to the bridge are written through
+    to the cached state, so the cache keeps matching what the lights show. While
+    the cache is live, state is pushed by the bridge event stream and entries do
+    not expire.
+
+    Attributes:
+        ttl (float): Time in seconds entries stay fresh.
+        live (bool): Whether the cache is kept current by the bridge event stream.
+        hits (int): Number of reads served from the cache.
+        misses (int): Number of reads that needed the bridge.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(self, ttl=STATE_CACHE_TTL):
+        self.ttl = ttl
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._entries = {LIGHTS: {}, GROUPS: {}}
+        self._expires = {}
+
+    def get(self, kind, resource_id):
+        """
+        Get a cached resource.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            resource_id (str): Light or group ID.
+
+        Returns:
+            dict: Cached resource, or None if it is missing or expired.
+        """
+        key = (kind, str(resource_id))
+        if self._is_fresh(key):
+            self.hits += 1
+            return self._entries[kind][str(resource_id)]
+        self.misses += 1
+        return None
+
+    def get_all(self, kind):
+        """
+        Get every cached resource of a kind.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+
+        Returns:
+            dict: Cached resources by ID, or None if the collection is expired.
+        """
+        if self._is_fresh((kind, None)):
+            self.hits += 1
+            return dict(self._entries[kind])
+        self.misses += 1
+        return None
+
+    def put(self, kind, resource_id, resource):
+        """
+        Store a resource read from the bridge.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            resource_id (str): Light or group ID.
+            resource (dict): Resource as returned by the bridge.
+        """
+        self._entries[kind][str(resource_id)] = resource
+        self._expires[(kind, str(resource_id))] = time.monotonic() + self.ttl
+
+    def put_all(self, kind, resources):
+        """
+        Store a full collection read from the bridge.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            resources (dict): Resources by ID as returned by the bridge.
+        """
+        self._entries[kind] = {}
+        for resource_id, resource in resources.items():
+            self.put(kind, resource_id, resource)
+        self._expires[(kind, None)] = time.monotonic() + self.ttl
+
+    def update(self, kind, resource_id, state, propagate=True):
+        """
+        Write a command sent to the bridge through to the cached state.
+
+        Group actions are also applied to the cached state of every member light.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            resource_id (str): Light or group ID.
+            state (dict): State attributes that were sent.
+            propagate (bool): Whether to apply group actions to member lights.
+                Defaults to True.
+        """
+        resource = self._entries[kind].get(str(resource_id))
+        if resource is not None:
+            cached_state = resource.setdefault(STATE_PATHS[kind], {})
+            cached_state.update(state)
+            for attribute, color_mode in COLOR_MODES.items():
+                if attribute in state:
+                    cached_state["colormode"] = color_mode
+
+        if kind == GROUPS and propagate:
+            for light_id in self.group_lights(resource_id):
+                self.update(LIGHTS, light_id, state)
+
+    def group_lights(self, group_id):
+        """
+        Get the IDs of the lights in a cached group.
+
+        Group membership rarely changes, so expired groups are still used.
+
+        Args:
+            group_id (str): Group ID.
+
+        Returns:
+            list: Light IDs, empty if the group is unknown.
+        """
+        if str(group_id) == ALL_LIGHTS_GROUP:
+            return list(self._entries[LIGHTS])
+        group = self._entries[GROUPS].get(str(group_id))
+        return list(group.get("lights", [])) if group else []
+
+    def last_state(self, kind, resource_id):
+        """
+        Get the last known state of a cached resource, even if it expired.
+
+        Args:
+            kind (str): Either "lights" or "groups".
+            resource_id (str): Light or group ID.
+
+        Returns:
+            dict: State attributes, empty if the resource is unknown.
+        """
+        resource = self._entries[kind].get(str(resource_id))
+        return resource.get(STATE_PATHS[kind], {}) if resource else {}
+
+    def invalidate(self, kind=None, resource_id=None):
+        """
+        Expire cached entries.
+
+        Args:
+            kind (str): Kind to expire. Defaults to None, meaning every kind.
+            resource_id (str): ID to expire. Defaults to None, meaning every ID.
+        """
+        self.logger.debug(f"Invalidating cached {kind or 'resources'} {resource_id}")
+        for key in list(self._expires):
+            if kind is not None and key[0] != kind:
+                continue
+            if resource_id is not None and key[1] not in (str(resource_id), None):
+                continue
+            del self._expires[key]
+
+    def _is_fresh(self, key):
+        """
+        Check whether an entry can be served from the cache.
+
+        Args:
+            key (tuple): Kind and ID of the entry, ID None for a full collection.
+
+        Returns:
+            bool: True if the entry is live or has not expired.
+        """
+        if key not in self._expires:
+            return False
+        return self.live or self._expires[key] > time.monotonic()
@@ -0,0 +1,224 @@
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from constants import TRACE_BUFFER_SIZE, TRACE_DUMP_FILE_PATH, TRACE_SLOW_SECONDS
+
+# Spans of an effect waiting behind the effects queued before it
+WAITING_SPANS = ("effect_queue", "effect_queue_dropped", "effect_queue_expired")
+
+
+@dataclass(slots=True)
+class Trace:
+    """
+    Timeline of one event through the pipeline.
+
+    Attributes:
+        trace_id (str): ID of the traced event.
+        started (float): Monotonic time the event was received.
+        spans (list): Stages as (name, start, end) tuples of monotonic times.
+        ended (float): Monotonic time the trace ended, or None while active.
+    """
+
+    trace_id: str
+    started: float
+    spans: list = field(default_factory=list)
+    ended: float = None
+
+    @property
+    def duration(self):
+        """
+        Time in seconds from receiving the event to the end of the trace.
+        """
+        return (self.ended or time.monotonic()) - self.started
+
+    @property
+    def latency(self):
+        """
+        Duration of the trace without the time spent waiting behind other effects.
+
+        Effects play one at a time for seconds each, so the wait in the effect
+        queue says more about the effects before than about this event.
+        """
+        waited = sum(
+            end - start for name, start, end in self.spans if name in WAITING_SPANS
+        )
+        return self.duration - waited
+
+    def to_dict(self):
+        """
+        Convert the trace to a JSON-serializable dictionary.
+
+        Span times are in milliseconds relative to the receive time, so the
+        long-poll wait before it has a negative start.
+
+        Returns:
+            dict: Trace ID, duration, latency and spans.
+        """
+        return {
+            "id": self.trace_id,
+            "duration_ms": round(self.duration * 1000, 3),
+            "latency_ms": round(self.latency * 1000, 3),
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round((start - self.started) * 1000, 3),
+                    "duration_ms": round((end - start) * 1000, 3),
+                }
+                for name, start, end in self.spans
+            ],
+        }
+
+    def summary(self):
+        """
+        Format the spans on one line.
+
+        Returns:
+            str: Name and duration in milliseconds of each span.
+        """
+        return ", ".join(
+            f"{name} {(end - start) * 1000:.1f} ms" for name, start, end in self.spans
+        )
+
+
+class Tracer:
+    """
+    Lightweight tracer following events through the pipeline stages.
+
+    A trace is started for each event when its batch is received, keyed by the
+    event ID. Each stage adds a span with monotonic start and end times, and the
+    trace ends when the event's effect reaches the bridge or the event is done
+    without one. Ended traces are kept in a fixed-size ring buffer, and traces
+    whose latency, i.e. their duration without waiting behind other effects,
+    is above the threshold are logged and kept in a second one.
+
+    Attributes:
+        capacity (int): Number of traces kept in each ring buffer.
+        slow_threshold (float): Latency in seconds above which a trace is slow.
+        enabled (bool): Whether traces are recorded.
+        finished (collections.deque): Most recently ended traces.
+        slow (collections.deque): Most recent slow traces.
+        logger (logging.Logger): Logger instance.
+    """
+
+    def __init__(
+        self,
+        capacity=TRACE_BUFFER_SIZE,
+        slow_threshold=TRACE_SLOW_SECONDS,
+        enabled=True,
+    ):
+        self.capacity = capacity
+        self.slow_threshold = slow_threshold
+        self.enabled = enabled
+        self.finished = deque(maxlen=capacity)
+        self.slow = deque(maxlen=capacity)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._active = {}
+
+    def begin(self, trace_id, started, spans=()):
+        """
+        Start the trace of an event.
+
+        Args:
+            trace_id (str): ID of the event.
+            started (float): Monotonic time the event was received.
+            spans (iterable): Spans shared by the events of the batch.
+        """
+        if not self.enabled or trace_id is None:
+            return
+        if len(self._active) >= self.capacity:
+            # Traces that never ended, e.g. of events lost on shutdown, are dropped
+            del self._active[next(iter(self._active))]
+        self._active[trace_id] = Trace(trace_id, started, list(spans))
+
+    def begin_batch(self, events, started, spans=()):
+        """
+        Start the traces of a batch of events.
+
+        Args:
+            events (list): Decoded events.
+            started (float): Monotonic time the batch was received.
+            spans (iterable): Spans of receiving the batch.
+        """
+        if not self.enabled:
+            return
+        for event in events:
+            self.begin(event.id, started, spans)
+
+    def add(self, trace_id, name, start, end=None):
+        """
+        Add a span to an active trace.
+
+        Args:
+            trace_id (str): ID of the event.
+            name (str): Name of the stage.
+            start (float): Monotonic time the stage started.
+            end (float): Monotonic time the stage ended. Defaults to now.
+        """
+        trace = self._active.get(trace_id)
+        if trace is not None:
+            trace.spans.append((name, start, time.monotonic() if end is None else end))
+
+    def end(self, trace_id):
+        """
+        End a trace and keep it in the ring buffer.
+
+        Ending a trace that is not active does nothing, so a trace shared by
+        several bridges ends with the first one.
+
+        Args:
+            trace_id (str): ID of the event.
+        """
+        trace = self._active.pop(trace_id, None)
+        if trace is None:
+            return
+        trace.ended = time.monotonic()
+        self.finished.append(trace)
+        if trace.latency >= self.slow_threshold:
+            self.slow.append(trace)
+            self.logger.warning(
+                f"Slow trace {trace.trace_id} took {trace.latency * 1000:.1f} ms "
+                f"besides waiting for other effects: {trace.summary()}"
+            )
+
+    def traces(self, min_duration=None):
+        """
+        Get ended traces with at least a given latency.
+
+        Args:
+            min_duration (float): Minimum latency in seconds. Defaults to the
+                slow threshold.
+
+        Returns:
+            list: Traces, oldest first.
+        """
+        if min_duration is None or min_duration >= self.slow_threshold:
+            source = self.slow
+            min_duration = min_duration or self.slow_threshold
+        else:
+            source = self.finished
+        return [trace for trace in source if trace.latency >= min_duration]
+
+    def dump(self, file_path=TRACE_DUMP_FILE_PATH, min_duration=None):
+        """
+        Append slow traces to an NDJSON file.
+
+        Args:
+            file_path (str): Path to the dump file.
+            min_duration (float): Minimum latency in seconds. Defaults to the
+                slow threshold.
+
+        Returns:
+            int: Number of traces written.
+        """
+        traces = self.traces(min_duration)
+        with open(file_path, "a") as file:
+            for trace in traces:
+                file.write(json.dumps(trace.to_dict()) + "\n")
+        self.logger.info(f"Dumped {len(traces)} traces to {file_path}")
+        return len(traces)
+
+
+TRACER = Tracer()